@@ -27,7 +27,18 @@ export async function POST(req: NextRequest) {
     if (!res.ok) {
       const text = await res.text();
       console.error('Inference service error:', text);
-      return NextResponse.json({ error: 'Inference service error', detail: text }, { status: 500 });
+      let detail = text;
+      try {
+        detail = JSON.parse(text).detail ?? text;
+      } catch {
+        // not JSON, keep the raw text
+      }
+      // Client errors (e.g. 422 from the input gate for non-X-ray uploads) keep their status and detail
+      if (res.status >= 400 && res.status < 500) {
+        const error = res.status === 422 ? 'Not a chest X-ray' : 'Invalid image';
+        return NextResponse.json({ error, detail }, { status: res.status });
+      }
+      return NextResponse.json({ error: 'Inference service error', detail }, { status: 500 });
     }
 
     const data = await res.json();
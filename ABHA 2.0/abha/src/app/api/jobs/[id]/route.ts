@@ -0,0 +1,17 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+const INFERENCE_API_URL = process.env.INFERENCE_API_URL || 'http://127.0.0.1:8002';
+
+export const runtime = 'nodejs';
+
+export async function GET(req: NextRequest, { params }: { params: Promise<{ id: string }> }) {
+  try {
+    const { id } = await params;
+    const res = await fetch(`${INFERENCE_API_URL}/jobs/${encodeURIComponent(id)}`, { cache: 'no-store' });
+    const data = await res.json();
+    return NextResponse.json(data, { status: res.status });
+  } catch (e: any) {
+    console.error('Job status error:', e);
+    return NextResponse.json({ error: 'Server error', detail: e.message }, { status: 500 });
+  }
+}
@@ -0,0 +1,33 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+// Asynchronous jobs for large PDFs and multi-image studies
+const INFERENCE_API_URL = process.env.INFERENCE_API_URL || 'http://127.0.0.1:8002';
+
+export const runtime = 'nodejs';
+
+export async function POST(req: NextRequest) {
+  try {
+    const formData = await req.formData();
+    const files = formData.getAll('files').filter((f): f is File => f instanceof File);
+    if (files.length === 0) {
+      return NextResponse.json({ error: 'At least one file is required' }, { status: 400 });
+    }
+
+    const forward = new FormData();
+    for (const file of files) {
+      forward.append('files', file, file.name);
+    }
+
+    // Returns immediately with a job ID; poll /api/jobs/<id> for the result
+    const res = await fetch(`${INFERENCE_API_URL}/jobs`, {
+      method: 'POST',
+      body: forward,
+    });
+
+    const data = await res.json();
+    return NextResponse.json(data, { status: res.status });
+  } catch (e: any) {
+    console.error('Job submission error:', e);
+    return NextResponse.json({ error: 'Server error', detail: e.message }, { status: 500 });
+  }
+}
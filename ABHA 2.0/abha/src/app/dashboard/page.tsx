@@ -1,6 +1,7 @@
 "use client";
 import { useState, useEffect, useCallback, ChangeEvent } from 'react';
 import { connectContract, formatRecord, HealthRecordStruct } from '../../lib/contract';
+import { analysisError } from '../../lib/analysis';
 
 interface AnalysisResult { prediction: string; confidence: number; }
 
@@ -347,7 +348,7 @@ export default function Dashboard() {
       const blob = await imgResp.blob();
       const fd = new FormData(); fd.append('file', new File([blob], record.fileName, { type: blob.type || 'image/png' }));
       const resp = await fetch('/api/analyze', { method: 'POST', body: fd });
-      if (!resp.ok) throw new Error('Analysis API error');
+      if (!resp.ok) throw new Error(await analysisError(resp));
       const data = await resp.json(); setAnalysisResult(data); setStatus('');
     } catch (e: any) { setError(e.message); setStatus(''); }
     finally { setAnalyzing(false); }
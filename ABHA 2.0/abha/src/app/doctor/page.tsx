@@ -1,6 +1,7 @@
 "use client"
 import { useCallback, useEffect, useState } from 'react'
 import { connectContract, formatRecord, HealthRecordStruct } from '../../lib/contract'
+import { analysisError } from '../../lib/analysis'
 import { useRouter } from 'next/navigation'
 
 export default function DoctorPage() {
@@ -109,7 +110,7 @@ export default function DoctorPage() {
       const blob = await imgResp.blob()
       const fd = new FormData(); fd.append('file', new File([blob], record.fileName, { type: blob.type || 'image/png' }))
       const resp = await fetch('/api/analyze', { method: 'POST', body: fd })
-      if (!resp.ok) throw new Error('Analysis API error')
+      if (!resp.ok) throw new Error(await analysisError(resp))
       const data = await resp.json(); setResult(data)
       setStatus('')
     } catch (e: any) { setError(e.message); setStatus('') }
@@ -0,0 +1,16 @@
+// User-facing message for a failed /api/analyze response
+export async function analysisError(resp: Response): Promise<string> {
+  let body: { error?: string; detail?: string } = {};
+  try {
+    body = await resp.json();
+  } catch {
+    // no JSON body
+  }
+  if (resp.status === 422) {
+    return `This image does not look like a chest X-ray. Please upload a chest radiograph.${body.detail ? ` (${body.detail})` : ''}`;
+  }
+  if (resp.status >= 400 && resp.status < 500) {
+    return body.detail || body.error || 'The image could not be analyzed';
+  }
+  return 'Analysis API error';
+}
@@ -0,0 +1,487 @@
+"""Hardware autotuner for inference threads, batching and backend.
+
+Benchmarks the registered models on this machine across
+
+    intra-op threads   1, 2, 4, cores/2, cores
+    inter-op threads   1, 2
+    backend            keras (direct call), compiled (XLA tf.function), tflite
+    batch size         1, 2, 4, 8, 16, 32
+
+and writes the fastest settings that meet a p99 latency target to a profile
+file (autotune_profile.json next to the models). TensorFlow fixes its thread
+pools when it starts, so every thread configuration is measured in its own
+spawned process, one at a time.
+
+For a candidate, L(b) is the model time for a batch of b (summed over the
+ensemble members for the ensemble setting). The engine runs one batch at a
+time, so a request can wait for the batch window, the batch in flight and its
+own batch:
+
+    p99 estimate  = batch_wait + 2 * p99(L(b))
+    throughput    = b / p50(L(b))
+    batch_wait    = min(p50(L(b)), target - 2 * p99(L(b)))
+
+Waiting longer than one model call does not help, because under load the next
+batch fills while the current one runs. The chosen setting is the one with
+the highest throughput whose estimate meets the target. If none meets it,
+the setting with the lowest estimate is chosen.
+
+Only backends that give the model's own outputs are chosen automatically
+(keras, compiled, fp32 tflite). The int8 TFLite variant changes the
+predictions and nothing checks its accuracy, so it can be measured with
+--backends tflite_int8 but is only served when INFERENCE_BACKEND asks for it.
+
+The profile holds one setting per model (used by inference_service.py) and
+one for the configured ensemble members (used by
+enhanced_inference_service.py; members run through Keras). It records the host
+and a fingerprint of the registered models (training checkpoint snapshots
+excluded, so a training run does not make it stale). At startup the services
+apply the profile; only when there is no profile for this host do they tune in
+a background process. A profile that is stale because the models changed is
+still applied and reported as stale in /metrics; re-tune it explicitly with
+POST /autotune or this command. The new batch settings are applied live.
+Thread counts take effect on the next restart, because TensorFlow is already
+running by then. A background re-tune shares the CPU with live traffic, so a
+tune on an idle host (this command) gives the cleanest numbers.
+
+Usage:
+    python autotune.py                            # tune all registered models
+    python autotune.py --target-p99-ms 150 --batch-sizes 1 4 8 16
+    python autotune.py --models pneumonia_detection_model.keras --backends keras compiled
+    python autotune.py --show                     # current profile and whether it is fresh
+
+Arguments:
+    --model-dir      Registry directory (default: this directory)
+    --models         Registered model names or version IDs (default: all active)
+    --target-p99-ms  Latency target (default AUTOTUNE_TARGET_P99_MS or 250)
+    --batch-sizes    Batch sizes to measure (default 1 2 4 8 16 32)
+    --threads        Intra-op thread counts (default 1 2 4 cores/2 cores)
+    --inter-op       Inter-op thread counts (default 1 2)
+    --backends       Backends to measure (default keras compiled tflite; tflite_int8 is recorded, never chosen)
+    --repeats        Timed calls per measurement (default 20)
+    --output         Profile path (default AUTOTUNE_PROFILE or <model-dir>/autotune_profile.json)
+    --show           Print the current profile and its status, then exit
+
+Configuration (environment, read by the services):
+    AUTOTUNE                auto (default: load, tune in the background when there is no profile) | load | off
+    AUTOTUNE_PROFILE        Profile path (default <model dir>/autotune_profile.json)
+    AUTOTUNE_TARGET_P99_MS  Latency target for background re-tunes (default 250)
+    INFERENCE_MAX_BATCH, INFERENCE_BATCH_WAIT_MS, INFERENCE_BACKEND and
+    TF_NUM_INTRAOP_THREADS / TF_NUM_INTEROP_THREADS, when set, win over the profile
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import platform
+import argparse
+import threading
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+import numpy as np
+
+from model_registry import ModelRegistry
+try:
+    import fcntl
+    _HAS_FCNTL = True
+except ImportError:  # Windows
+    import msvcrt
+    _HAS_FCNTL = False
+
+BASE_DIR = Path(__file__).parent
+AUTOTUNE_MODE = os.getenv("AUTOTUNE", "auto").lower()
+AUTOTUNE_TARGET_P99_MS = float(os.getenv("AUTOTUNE_TARGET_P99_MS", "250"))
+PROFILE_NAME = "autotune_profile.json"
+PROFILE_VERSION = 1
+BACKENDS = ("keras", "compiled", "tflite", "tflite_int8")
+# Backends whose outputs match the Keras model; the only ones chosen automatically
+AUTO_BACKENDS = ("keras", "compiled", "tflite")
+BATCH_SIZES = (1, 2, 4, 8, 16, 32)
+
+
+# --- Host and profile files ---
+
+def _cores() -> int:
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+
+
+def host_signature() -> Dict[str, Any]:
+    cpu = platform.processor() or platform.machine()
+    try:
+        with open("/proc/cpuinfo", "r") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    cpu = line.split(":", 1)[1].strip()
+                    break
+    except OSError:
+        pass
+    return {"cpu": cpu, "cores": _cores(), "machine": platform.machine(), "system": platform.system()}
+
+
+def thread_candidates(cores: Optional[int] = None) -> List[int]:
+    cores = cores or _cores()
+    return sorted({n for n in (1, 2, 4, cores // 2, cores) if 1 <= n <= cores})
+
+
+def profile_path(model_dir: Path) -> Path:
+    return Path(os.getenv("AUTOTUNE_PROFILE") or Path(model_dir) / PROFILE_NAME)
+
+
+def load_profile(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return profile if profile.get("profile_version") == PROFILE_VERSION else None
+
+
+def write_profile(path: Path, profile: Dict[str, Any]):
+    tmp_path = Path(path).with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def models_fingerprint(registry: ModelRegistry) -> str:
+    """Digest of the active versions a profile covers; training checkpoint snapshots do not count."""
+    ids = ",".join(sorted(e["version_id"] for e in registry.active_versions() if e.get("source") != "checkpoint"))
+    return hashlib.sha256(ids.encode()).hexdigest()[:16]
+
+
+def profile_status(profile: Optional[Dict[str, Any]], registry: ModelRegistry) -> str:
+    """missing | other_host | stale (models changed) | fresh"""
+    if profile is None:
+        return "missing"
+    host, here = profile.get("host", {}), host_signature()
+    if host.get("cpu") != here["cpu"] or host.get("cores") != here["cores"]:
+        return "other_host"
+    if profile.get("registry_fingerprint") != models_fingerprint(registry):
+        return "stale"
+    return "fresh"
+
+
+# --- Measurement (one spawned process per thread configuration) ---
+
+def _bench_config(job: Dict[str, Any]) -> Dict[str, Any]:
+    intra, inter = job["intra_op"], job["inter_op"]
+    os.environ["OMP_NUM_THREADS"] = str(intra)
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(intra)
+    tf.config.threading.set_inter_op_parallelism_threads(inter)
+    from inference_engine import create_backend, IMG_SIZE
+
+    rng = np.random.default_rng(0)
+    results = []
+    for model in job["models"]:
+        for kind in job["backends"]:
+            try:
+                backend = create_backend(kind, model=model, model_dir=Path(job["model_dir"]), num_threads=intra)
+            except FileNotFoundError:
+                continue  # variant not built for this model
+            w, h = backend.input_sizes[0] if backend.input_sizes else IMG_SIZE
+            for batch_size in job["batch_sizes"]:
+                batch = rng.random((batch_size, h, w, 3), dtype=np.float32)
+                row = {"model": model, "backend": kind, "batch_size": batch_size}
+                try:
+                    for _ in range(job["warmup"]):
+                        backend.predict_batch(batch)
+                    timings = []
+                    for _ in range(job["repeats"]):
+                        start = time.perf_counter()
+                        backend.predict_batch(batch)
+                        timings.append((time.perf_counter() - start) * 1000)
+                except Exception as e:
+                    results.append({**row, "error": f"{type(e).__name__}: {e}"})
+                    break
+                results.append({**row, "p50_ms": float(np.percentile(timings, 50)),
+                                "p99_ms": float(np.percentile(timings, 99))})
+    return {"intra_op": intra, "inter_op": inter, "results": results}
+
+
+def choose(runs: List[Dict[str, Any]], models: List[str], target_p99_ms: float,
+           backends: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """Fastest setting for serving `models` together that meets the target (see module docstring)."""
+    candidates = []
+    for run in runs:
+        rows: Dict[tuple, Dict[str, Dict[str, Any]]] = {}
+        for row in run["results"]:
+            if "error" not in row and row["model"] in models and (backends is None or row["backend"] in backends):
+                rows.setdefault((row["backend"], row["batch_size"]), {})[row["model"]] = row
+        for (backend, batch_size), by_model in rows.items():
+            if len(by_model) < len(models):
+                continue  # backend not available for every model
+            p50 = sum(r["p50_ms"] for r in by_model.values())
+            p99 = sum(r["p99_ms"] for r in by_model.values())
+            wait = max(0.0, min(p50, target_p99_ms - 2 * p99))
+            candidates.append({
+                "intra_op": run["intra_op"],
+                "inter_op": run["inter_op"],
+                "backend": backend,
+                "max_batch_size": batch_size,
+                "batch_wait_ms": round(wait, 2),
+                "throughput_ips": round(batch_size / p50 * 1000, 1) if p50 > 0 else 0.0,
+                "p99_estimate_ms": round(wait + 2 * p99, 2),
+            })
+    if not candidates:
+        return None
+    feasible = [c for c in candidates if c["p99_estimate_ms"] <= target_p99_ms]
+    if feasible:
+        best = max(feasible, key=lambda c: (c["throughput_ips"], -c["p99_estimate_ms"]))
+    else:
+        best = min(candidates, key=lambda c: c["p99_estimate_ms"])
+    return {**best, "meets_target": bool(feasible)}
+
+
+def _ensemble_member_ids(registry: ModelRegistry) -> List[str]:
+    from model_ensemble import ENSEMBLE_MODELS
+    if ENSEMBLE_MODELS == ["*"]:
+        return [e["version_id"] for e in registry.active_versions()]
+    entries = [registry.resolve(name) for name in ENSEMBLE_MODELS]
+    return [e["version_id"] for e in entries if e]
+
+
+def tune(model_dir: Path, models: Optional[List[str]] = None, target_p99_ms: float = AUTOTUNE_TARGET_P99_MS,
+         batch_sizes=BATCH_SIZES, threads: Optional[List[int]] = None, inter_ops=(1, 2),
+         backends=AUTO_BACKENDS, repeats: int = 20, warmup: int = 3) -> Dict[str, Any]:
+    registry = ModelRegistry(model_dir)
+    entries = [registry.resolve(m) for m in models] if models else registry.active_versions()
+    entries = [e for e in entries if e]
+    if not entries:
+        raise FileNotFoundError(f"No registered models in {model_dir}")
+    ids = [e["version_id"] for e in entries]
+    names = {e["version_id"]: e["name"] for e in entries}
+    print(f"⚙️  Autotuning {len(ids)} model(s) on {host_signature()['cpu']} ({_cores()} cores), "
+          f"target p99 {target_p99_ms:.0f} ms")
+
+    runs = []
+    ctx = multiprocessing.get_context("spawn")
+    for intra in threads or thread_candidates():
+        for inter in inter_ops:
+            job = {"model_dir": str(model_dir), "models": ids, "intra_op": intra, "inter_op": inter,
+                   "backends": list(backends), "batch_sizes": list(batch_sizes), "repeats": repeats, "warmup": warmup}
+            start = time.perf_counter()
+            # A fresh process per configuration; thread pools are fixed once TensorFlow starts
+            with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+                run = executor.submit(_bench_config, job).result()
+            runs.append(run)
+            print(f"   intra {intra:>3} inter {inter}: {len(run['results'])} measurements "
+                  f"in {time.perf_counter() - start:.0f}s")
+
+    members = [vid for vid in _ensemble_member_ids(registry) if vid in names]
+    return {
+        "profile_version": PROFILE_VERSION,
+        "created_at": time.time(),
+        "host": host_signature(),
+        "registry_fingerprint": models_fingerprint(registry),
+        "target_p99_ms": target_p99_ms,
+        "models": {vid: {"name": names[vid], **(choose(runs, [vid], target_p99_ms, backends=list(AUTO_BACKENDS)) or {})}
+                   for vid in ids},
+        "ensemble": ({"members": [names[vid] for vid in members],
+                      **(choose(runs, members, target_p99_ms, backends=["keras"]) or {})} if members else None),
+        "measurements": runs,
+    }
+
+
+# --- Applying a profile in the services ---
+
+def setting_for(profile: Optional[Dict[str, Any]], version_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """The per-model setting, or the ensemble setting when version_id is None."""
+    if not profile:
+        return None
+    setting = profile["models"].get(version_id) if version_id else profile.get("ensemble")
+    # Profiles written before AUTO_BACKENDS existed may name tflite_int8
+    if not setting or "max_batch_size" not in setting or setting.get("backend") not in AUTO_BACKENDS:
+        return None
+    return setting
+
+
+def apply_threads(setting: Optional[Dict[str, Any]]):
+    """TF thread pools from a setting; only possible before TensorFlow has started."""
+    if not setting:
+        return
+    intra, inter = setting["intra_op"], setting["inter_op"]
+    if "tensorflow" not in sys.modules:
+        os.environ.setdefault("TF_NUM_INTRAOP_THREADS", str(intra))
+        os.environ.setdefault("TF_NUM_INTEROP_THREADS", str(inter))
+        os.environ.setdefault("OMP_NUM_THREADS", str(intra))
+        return
+    try:
+        import tensorflow as tf
+        tf.config.threading.set_intra_op_parallelism_threads(intra)
+        tf.config.threading.set_inter_op_parallelism_threads(inter)
+    except RuntimeError:
+        print(f"⚠️  TensorFlow already started; tuned threads ({intra} intra / {inter} inter) apply after a restart")
+
+
+def engine_settings(setting: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """InferenceEngine keyword arguments; explicit environment settings win."""
+    if not setting:
+        return {}
+    kwargs = {}
+    if "INFERENCE_MAX_BATCH" not in os.environ:
+        kwargs["max_batch_size"] = setting["max_batch_size"]
+    if "INFERENCE_BATCH_WAIT_MS" not in os.environ:
+        kwargs["batch_wait_ms"] = setting["batch_wait_ms"]
+    return kwargs
+
+
+def apply_engine_settings(engine, setting: Optional[Dict[str, Any]]):
+    """Update a running engine's batching from a new setting."""
+    kwargs = engine_settings(setting)
+    if "max_batch_size" in kwargs:
+        engine.max_batch_size = max(1, kwargs["max_batch_size"])
+    if "batch_wait_ms" in kwargs:
+        engine.batch_wait = kwargs["batch_wait_ms"] / 1000.0
+
+
+def describe(profile: Optional[Dict[str, Any]], registry: ModelRegistry) -> Dict[str, Any]:
+    return {
+        "mode": AUTOTUNE_MODE,
+        "status": profile_status(profile, registry),
+        "retuning": _retune_process is not None and _retune_process.poll() is None,
+        "created_at": profile.get("created_at") if profile else None,
+        "target_p99_ms": profile.get("target_p99_ms") if profile else None,
+        "ensemble": setting_for(profile),
+    }
+
+
+_retune_lock = threading.Lock()
+_retune_process: Optional[subprocess.Popen] = None
+
+
+def _acquire_lock(lock_path: Path) -> Optional[int]:
+    """One re-tune per profile across service processes: a non-blocking lock on the lock file.
+
+    Returns the locked descriptor, or None when another process holds the lock.
+    The OS releases the lock when every holder has exited, so a crash never
+    leaves a stale lock behind and nothing is decided from the file's contents.
+    """
+    fd = os.open(lock_path, os.O_CREAT | os.O_RDWR, 0o644)
+    try:
+        if _HAS_FCNTL:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def retune_in_background(model_dir: Path, on_update: Optional[Callable[[Dict[str, Any]], None]] = None) -> bool:
+    """Run this module as a subprocess; on_update gets the new profile when it finishes."""
+    global _retune_process
+    path = profile_path(model_dir)
+    lock_path = path.with_suffix(".lock")
+    with _retune_lock:
+        if _retune_process is not None and _retune_process.poll() is None:
+            return False
+        lock_fd = _acquire_lock(lock_path)
+        if lock_fd is None:
+            return False
+        print(f"⚙️  Re-tuning inference settings in the background -> {path.name}")
+        try:
+            # The tuner inherits the locked descriptor, so the lock outlives this process if it dies first
+            process = subprocess.Popen([sys.executable, str(Path(__file__).resolve()), "--model-dir", str(model_dir),
+                                        "--output", str(path), "--target-p99-ms", str(AUTOTUNE_TARGET_P99_MS)],
+                                       cwd=str(BASE_DIR), pass_fds=(lock_fd,) if _HAS_FCNTL else ())
+        except Exception:
+            os.close(lock_fd)
+            raise
+        _retune_process = process
+
+    def wait():
+        try:
+            code = process.wait()
+        finally:
+            os.close(lock_fd)
+        profile = load_profile(path) if code == 0 else None
+        if profile is None:
+            print(f"❌ Background autotune failed (exit code {code})")
+            return
+        print("✅ Autotune profile updated")
+        if on_update:
+            on_update(profile)
+
+    threading.Thread(target=wait, daemon=True, name="autotune").start()
+    return True
+
+
+def ensure_profile(model_dir: Path, registry: Optional[ModelRegistry] = None,
+                   on_update: Optional[Callable[[Dict[str, Any]], None]] = None) -> Optional[Dict[str, Any]]:
+    """The profile to apply now, tuning in the background when this host has none.
+
+    A stale profile (the models changed) is applied as it is; re-tuning it is an
+    explicit step (POST /autotune or the CLI), so registry changes never start
+    a tune on their own.
+    """
+    if AUTOTUNE_MODE == "off":
+        return None
+    registry = registry or ModelRegistry(model_dir)
+    profile = load_profile(profile_path(model_dir))
+    status = profile_status(profile, registry)
+    if status == "stale":
+        print("⚙️  Autotune profile is stale (models changed); re-tune with POST /autotune or autotune.py")
+    elif status != "fresh":
+        print(f"⚙️  Autotune profile: {status}")
+        if AUTOTUNE_MODE == "auto" and registry.active_versions():
+            retune_in_background(model_dir, on_update)
+    # A profile from this host is still better than the defaults while the re-tune runs
+    return profile if status in ("fresh", "stale") else None
+
+
+# --- CLI ---
+
+def format_setting(label: str, setting: Optional[Dict[str, Any]]) -> str:
+    if not setting or "max_batch_size" not in setting:
+        return f"{label:35} no measurements"
+    return (f"{label:35} {setting['backend']:11} threads {setting['intra_op']:>2}/{setting['inter_op']}  "
+            f"batch {setting['max_batch_size']:>2}  wait {setting['batch_wait_ms']:6.2f} ms  "
+            f"{setting['throughput_ips']:8.1f} img/s  p99~{setting['p99_estimate_ms']:7.1f} ms"
+            f"{'' if setting['meets_target'] else '  (misses target)'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune inference threads, batching and backend for this machine")
+    parser.add_argument("--model-dir", default=str(BASE_DIR), help="Registry directory")
+    parser.add_argument("--models", nargs="*", help="Registered model names or version IDs (default: all active)")
+    parser.add_argument("--target-p99-ms", type=float, default=AUTOTUNE_TARGET_P99_MS, help="Latency target")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=list(BATCH_SIZES), help="Batch sizes to measure")
+    parser.add_argument("--threads", type=int, nargs="+", default=None, help="Intra-op thread counts")
+    parser.add_argument("--inter-op", type=int, nargs="+", default=[1, 2], help="Inter-op thread counts")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(AUTO_BACKENDS),
+                        help="Backends to measure (tflite_int8 is recorded, never chosen)")
+    parser.add_argument("--repeats", type=int, default=20, help="Timed calls per measurement")
+    parser.add_argument("--output", default=None, help="Profile path")
+    parser.add_argument("--show", action="store_true", help="Print the current profile and its status")
+    args = parser.parse_args()
+
+    model_dir = Path(args.model_dir)
+    output = Path(args.output) if args.output else profile_path(model_dir)
+    if args.show:
+        profile = load_profile(output)
+        print(f"Profile {output}: {profile_status(profile, ModelRegistry(model_dir))}")
+        if profile:
+            print(format_setting("ensemble", profile.get("ensemble")))
+            for setting in profile["models"].values():
+                print(format_setting(setting["name"], setting))
+        return
+
+    profile = tune(model_dir, args.models, args.target_p99_ms, args.batch_sizes, args.threads,
+                   args.inter_op, args.backends, args.repeats)
+    write_profile(output, profile)
+    print()
+    print(format_setting("ensemble", profile["ensemble"]))
+    for setting in profile["models"].values():
+        print(format_setting(setting["name"], setting))
+    print(f"\n📝 Profile written to {output}")
+
+
+if __name__ == "__main__":
+    main()
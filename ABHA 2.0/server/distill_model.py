@@ -0,0 +1,191 @@
+"""distill_model.py
+
+Distill the ModelEnsemble into a single compact student model.
+
+The teacher is the same weighted and calibrated ensemble served by
+enhanced_inference_service.py (`ModelEnsemble.ensemble_probabilities`). Its
+probabilities on the training images become soft targets for a student built
+with one of the `train_model.build_model` architectures. Because binary
+cross-entropy is linear in the target, mixing soft and hard labels is done by
+mixing the targets: target = alpha * label + (1 - alpha) * teacher_prob.
+
+Usage examples:
+    python distill_model.py --data ./chest_xray --epochs 10
+    python distill_model.py --arch separable --alpha 0.2 --teachers pneumonia_detection_model.keras,pneumonia_smoke.keras
+
+Serve the student:
+    STUDENT_MODEL=pneumonia_student.keras python enhanced_inference_service.py
+
+Arguments:
+    --data / -d        Base directory containing train/ and val/ (auto-detected if omitted)
+    --teachers         Comma-separated registry names / version IDs (default: ENSEMBLE_MODELS)
+    --arch             Student architecture (default mobilenet)
+    --alpha            Weight of the hard labels in the target (default 0.1)
+    --epochs / -e      Number of epochs (default 10)
+    --batch-size / -b  Batch size (default 32)
+    --lr               Learning rate (default 1e-3)
+    --model-path / -o  Output student file (default pneumonia_student.keras)
+"""
+
+import os
+import json
+import argparse
+from typing import Tuple, Dict, Any, Optional
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.optimizers import Adam
+
+from model_ensemble import ModelEnsemble, IMG_SIZE, MODEL_DIR
+from model_registry import ModelRegistry, input_size
+from train_model import (
+    ARCHITECTURES, build_model, benchmark_model, format_benchmark,
+    resolve_data_dir, collect_probs_and_labels, compute_metrics, _HAS_SKLEARN,
+)
+
+# Same decision threshold as the service
+SERVICE_THRESHOLD = 0.3
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Distill the inference ensemble into a compact student")
+    parser.add_argument('-d', '--data', default=os.getenv('DATA_DIR', None), help='Base data directory containing train/ and val/')
+    parser.add_argument('--teachers', default=None, help='Comma-separated teacher models (default: ENSEMBLE_MODELS)')
+    parser.add_argument('--arch', choices=ARCHITECTURES, default='mobilenet')
+    parser.add_argument('--alpha', type=float, default=0.1, help='Weight of hard labels in the training target')
+    parser.add_argument('-e', '--epochs', type=int, default=10)
+    parser.add_argument('-b', '--batch-size', type=int, default=32)
+    parser.add_argument('--lr', type=float, default=1e-3)
+    parser.add_argument('-o', '--model-path', default=str(MODEL_DIR / 'pneumonia_student.keras'))
+    return parser.parse_args()
+
+
+def load_split(split_dir: str, batch_size: int, img_size: Tuple[int, int]) -> tf.data.Dataset:
+    """Unshuffled, rescaled images (H, W) and labels (order must match teacher outputs)."""
+    ds = tf.keras.utils.image_dataset_from_directory(
+        split_dir, image_size=img_size, batch_size=batch_size, label_mode='binary', shuffle=False)
+    norm = tf.keras.layers.Rescaling(1./255)
+    return ds.map(lambda x, y: (norm(x), y), num_parallel_calls=tf.data.AUTOTUNE)
+
+
+def teacher_targets(ensemble: ModelEnsemble, ds: tf.data.Dataset) -> Tuple[np.ndarray, np.ndarray]:
+    """Calibrated ensemble probabilities and hard labels for a dataset."""
+    probs, labels = [], []
+    for xb, yb in ds:
+        probs.append(ensemble.ensemble_probabilities(xb.numpy())['calibrated'])
+        labels.append(yb.numpy().ravel())
+    return np.concatenate(probs).astype(np.float32), np.concatenate(labels).astype(np.float32)
+
+
+def agreement(student_probs: np.ndarray, teacher_probs: np.ndarray) -> Dict[str, float]:
+    """How closely the student reproduces the ensemble."""
+    return {
+        'label_agreement_at_service_threshold': float(np.mean(
+            (student_probs >= SERVICE_THRESHOLD) == (teacher_probs >= SERVICE_THRESHOLD))),
+        'label_agreement_at_0.5': float(np.mean((student_probs >= 0.5) == (teacher_probs >= 0.5))),
+        'mean_abs_prob_diff': float(np.mean(np.abs(student_probs - teacher_probs))),
+        'max_abs_prob_diff': float(np.max(np.abs(student_probs - teacher_probs))),
+    }
+
+
+def ensemble_latency(ensemble: ModelEnsemble) -> Dict[str, float]:
+    """Sum of member forward-pass latencies, i.e. the cost the student replaces."""
+    total: Dict[str, float] = {}
+    for model_name, model in ensemble.models.items():
+        w, h = input_size(ensemble.model_metadata.get(model_name), IMG_SIZE)
+        bench = benchmark_model(model.load(), (h, w), repeats=10)
+        for key, lat in bench['latency_ms'].items():
+            total[key] = total.get(key, 0.0) + lat['p50']
+    return total
+
+
+def train_student(train_ds: tf.data.Dataset, targets: np.ndarray, img_size: Tuple[int, int], arch: str,
+                  batch_size: int, lr: float, epochs: int, val_ds: Optional[tf.data.Dataset] = None) -> tf.keras.Model:
+    """Fit a fresh `arch` student on the images of train_ds against the mixed targets (same order)."""
+    images = train_ds.map(lambda x, y: x).unbatch()
+    student_train = (tf.data.Dataset.zip((images, tf.data.Dataset.from_tensor_slices(targets[:, None])))
+                     .cache().shuffle(2048, seed=1337).batch(batch_size).prefetch(tf.data.AUTOTUNE))
+    student = build_model(img_size, arch)
+    student.compile(optimizer=Adam(learning_rate=lr), loss='binary_crossentropy', metrics=['accuracy'])
+    student.summary()
+    callbacks = []
+    if val_ds is not None:
+        callbacks.append(tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True))
+    student.fit(student_train, validation_data=val_ds, epochs=epochs, callbacks=callbacks)
+    return student
+
+
+def distill():
+    args = parse_args()
+    base_dir = resolve_data_dir(args.data)
+    train_dir = os.path.join(base_dir, 'train')
+    val_dir = os.path.join(base_dir, 'val')
+    test_dir = os.path.join(base_dir, 'test')
+
+    members = [m.strip() for m in args.teachers.split(',')] if args.teachers else None
+    ensemble = ModelEnsemble(members=members, student=None)
+    if not ensemble.models:
+        raise SystemExit('No teacher models found in the registry. Train a model first.')
+    print(f"Teachers: {ensemble.model_versions}")
+    # Teachers see the largest member input (smaller members are resized from it); the student uses it too
+    w, h = ensemble.input_size
+    img_size = (h, w)
+
+    print("\n--- Computing teacher soft targets ---")
+    train_ds = load_split(train_dir, args.batch_size, img_size)
+    soft_train, hard_train = teacher_targets(ensemble, train_ds)
+    targets = args.alpha * hard_train + (1 - args.alpha) * soft_train
+    print(f"Train images: {len(targets)}  teacher/label agreement: "
+          f"{np.mean((soft_train >= SERVICE_THRESHOLD) == (hard_train >= 0.5)):.3f}")
+
+    val_ds = load_split(val_dir, args.batch_size, img_size)
+    print("\n--- Training student ---")
+    student = train_student(train_ds, targets, img_size, args.arch, args.batch_size, args.lr, args.epochs, val_ds)
+    student.save(args.model_path)
+    print(f"Student saved as '{args.model_path}'")
+
+    # --- Evaluation: agreement with the ensemble, standard metrics, latency ---
+    report: Dict[str, Any] = {
+        'distillation': {
+            'arch': args.arch,
+            'alpha': args.alpha,
+            'teachers': ensemble.model_versions,
+        }
+    }
+    eval_splits = {'validation': val_dir}
+    if os.path.isdir(test_dir) and len(os.listdir(test_dir)) > 0:
+        eval_splits['test'] = test_dir
+    for split, split_dir in eval_splits.items():
+        # Cached so the teacher and the student see the same decoded batches
+        ds = load_split(split_dir, args.batch_size, img_size).cache()
+        teacher_probs, teacher_labels = teacher_targets(ensemble, ds)
+        y_true, student_probs = collect_probs_and_labels(student, ds)
+        if not np.array_equal(y_true, teacher_labels):
+            raise RuntimeError(f"{split}: student and teacher labels are out of order")
+        report['distillation'][f'{split}_agreement'] = agreement(student_probs, teacher_probs)
+        if _HAS_SKLEARN:
+            report[split] = compute_metrics(y_true, student_probs)
+            report['distillation'][f'{split}_teacher_metrics'] = {
+                k: v for k, v in compute_metrics(y_true, teacher_probs).items() if k != 'classification_report'}
+        print(f"\n[{split}] agreement: {report['distillation'][f'{split}_agreement']}")
+    report.setdefault('test', None)
+
+    print("\n--- CPU latency: student vs ensemble ---")
+    report['benchmark'] = benchmark_model(student, img_size, model_path=args.model_path)
+    report['distillation']['ensemble_latency_ms'] = ensemble_latency(ensemble)
+    print(format_benchmark('student', report['benchmark'], report.get('test') or report.get('validation')))
+    print(f"{'ensemble':10} " + "  ".join(f"{k}: {v:7.2f} ms" for k, v in report['distillation']['ensemble_latency_ms'].items()))
+
+    report_json = os.path.splitext(args.model_path)[0] + '_metrics.json'
+    with open(report_json, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved metrics JSON to {report_json}")
+
+    registry = ModelRegistry(os.path.dirname(os.path.abspath(args.model_path)), auto_refresh=False)
+    entry = registry.register(args.model_path, source='distillation', distilled=True,
+                              teachers=list(ensemble.model_versions.values()))
+    print(f"Registered student as version {entry['version_id']}")
+    print(f"Serve it with: STUDENT_MODEL={entry['version_id']} python enhanced_inference_service.py")
+
+
+if __name__ == '__main__':
+    distill()
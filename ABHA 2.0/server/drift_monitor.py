@@ -0,0 +1,329 @@
+"""Streaming input and prediction drift monitor with fixed-size sketches.
+
+Every image that reaches the model updates a handful of fixed-size sketches
+(constant memory, a few microseconds per request):
+
+    intensity     32-bin histogram of pixel luminance (subsampled 1/16 of pixels)
+    brightness    32-bin histogram of per-image mean luminance
+    size          counts per long-side bucket of the original upload (<256, 256-511, ...)
+    format        counts per file format sniffed from the upload bytes
+    probability   100-bin histogram (quantiles to 0.01) of the uncalibrated
+                  (raw / ensemble) and the calibrated probability
+    members       the same two histograms per ensemble member (keyed by version
+                  ID, from `individual_predictions` and `model_versions`)
+
+The live sketch decays exponentially (half-life DRIFT_HALF_LIFE requests), so
+it reflects recent traffic. It is compared with the reference profile that
+train_model.py writes next to the model when run with --reference-samples N
+(`<stem>_reference_profile.json`, built with the same code on training images
+at the model's input size) using
+the population stability index (PSI): < 0.1 stable, 0.1-0.25 moderate drift,
+> 0.25 drift.
+
+A reference profile describes one model. A single-model service compares its
+outputs with it directly (`DriftMonitor(profile)`). An ensemble compares each
+member's output with that member's own profile (`DriftMonitor(members=...)`),
+because the weighted ensemble output has a different distribution by
+construction; its image sketches are compared with the first member's profile.
+
+Configuration (environment):
+    DRIFT_MONITOR      Enable the monitor (1/0, default 1)
+    DRIFT_HALF_LIFE    Half-life of the live sketch in requests (default 2000)
+    DRIFT_MIN_SAMPLES  Samples needed before a status is reported (default 100)
+"""
+import os
+import json
+import math
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+DRIFT_MONITOR = os.getenv("DRIFT_MONITOR", "1") == "1"
+DRIFT_HALF_LIFE = float(os.getenv("DRIFT_HALF_LIFE", "2000"))
+DRIFT_MIN_SAMPLES = int(os.getenv("DRIFT_MIN_SAMPLES", "100"))
+
+INTENSITY_BINS = 32
+PROB_BINS = 100
+PROB_FIELDS = ("raw_probability", "calibrated_probability")
+SIZE_BUCKETS = ("<256", "256-511", "512-1023", "1024-2047", "2048-4095", ">=4096")
+FORMATS = ("jpeg", "png", "pdf", "gif", "bmp", "webp", "tiff", "array", "other")
+PSI_MODERATE = 0.1
+PSI_DRIFT = 0.25
+# Decay is applied in steps so the per-request cost stays constant
+_DECAY_EVERY = 64
+
+
+def sniff_format(data: Optional[bytes]) -> str:
+    """File format from magic bytes (cheaper and more reliable than the client's content type)."""
+    if not data:
+        return "array"
+    head = data[:12]
+    if head.startswith(b"\xff\xd8"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG"):
+        return "png"
+    if head.startswith(b"%PDF-"):
+        return "pdf"
+    if head.startswith(b"GIF8"):
+        return "gif"
+    if head.startswith(b"BM"):
+        return "bmp"
+    if head.startswith(b"RIFF") and head[8:12] == b"WEBP":
+        return "webp"
+    if head[:4] in (b"II*\x00", b"MM\x00*"):
+        return "tiff"
+    return "other"
+
+
+def size_bucket(width: int, height: int) -> int:
+    long_side = max(width, height)
+    if long_side < 256:
+        return 0
+    return min(len(SIZE_BUCKETS) - 1, int(math.log2(long_side)) - 7)
+
+
+class DriftSketch:
+    def __init__(self):
+        self.intensity = np.zeros(INTENSITY_BINS)
+        self.brightness = np.zeros(INTENSITY_BINS)
+        self.sizes = np.zeros(len(SIZE_BUCKETS))
+        self.formats = np.zeros(len(FORMATS))
+        self.probabilities = {name: np.zeros(PROB_BINS) for name in PROB_FIELDS}
+        # version ID -> field -> histogram
+        self.members: Dict[str, Dict[str, np.ndarray]] = {}
+        self.images = 0.0
+        self.predictions = 0.0
+
+    def add_image(self, arr: np.ndarray, width: int, height: int, fmt: str):
+        lum = arr[::4, ::4].mean(axis=-1)
+        bins = np.minimum((lum * INTENSITY_BINS).astype(np.intp), INTENSITY_BINS - 1)
+        self.intensity += np.bincount(bins.ravel(), minlength=INTENSITY_BINS) / bins.size
+        self.brightness[min(int(lum.mean() * INTENSITY_BINS), INTENSITY_BINS - 1)] += 1
+        self.sizes[size_bucket(width, height)] += 1
+        self.formats[FORMATS.index(fmt) if fmt in FORMATS else FORMATS.index("other")] += 1
+        self.images += 1
+
+    def add_prediction(self, result: Dict[str, Any]):
+        # The ensemble reports its uncalibrated output as ensemble_probability
+        values = {"raw_probability": result.get("raw_probability", result.get("ensemble_probability")),
+                  "calibrated_probability": result.get("calibrated_probability")}
+        _add_probabilities(self.probabilities, values)
+        versions = result.get("model_versions") or {}
+        for name, member in (result.get("individual_predictions") or {}).items():
+            hists = self.members.setdefault(versions.get(name) or name, {f: np.zeros(PROB_BINS) for f in PROB_FIELDS})
+            _add_probabilities(hists, {"raw_probability": member.get("probability"),
+                                       "calibrated_probability": member.get("calibrated_probability")})
+        self.predictions += 1
+
+    def decay(self, factor: float):
+        member_hists = [hist for hists in self.members.values() for hist in hists.values()]
+        for array in (self.intensity, self.brightness, self.sizes, self.formats, *self.probabilities.values(),
+                      *member_hists):
+            array *= factor
+        self.images *= factor
+        self.predictions *= factor
+
+    def quantiles(self, name: str, qs: Iterable[float] = (0.05, 0.25, 0.5, 0.75, 0.95)) -> Optional[Dict[str, float]]:
+        return _quantiles(self.probabilities.get(name), qs)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "images": self.images,
+            "predictions": self.predictions,
+            "intensity": self.intensity.tolist(),
+            "brightness": self.brightness.tolist(),
+            "sizes": dict(zip(SIZE_BUCKETS, self.sizes.tolist())),
+            "formats": dict(zip(FORMATS, self.formats.tolist())),
+            "probabilities": {name: hist.tolist() for name, hist in self.probabilities.items()},
+            "members": {vid: {name: hist.tolist() for name, hist in hists.items()} for vid, hists in self.members.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "DriftSketch":
+        sketch = cls()
+        sketch.images = data.get("images", 0.0)
+        sketch.predictions = data.get("predictions", 0.0)
+        sketch.intensity = np.asarray(data["intensity"], dtype=np.float64)
+        sketch.brightness = np.asarray(data["brightness"], dtype=np.float64)
+        sketch.sizes = np.array([data.get("sizes", {}).get(k, 0.0) for k in SIZE_BUCKETS])
+        sketch.formats = np.array([data.get("formats", {}).get(k, 0.0) for k in FORMATS])
+        for name in PROB_FIELDS:
+            if name in data.get("probabilities", {}):
+                sketch.probabilities[name] = np.asarray(data["probabilities"][name], dtype=np.float64)
+        sketch.members = {vid: {name: np.asarray(hists.get(name, np.zeros(PROB_BINS)), dtype=np.float64)
+                                for name in PROB_FIELDS}
+                          for vid, hists in data.get("members", {}).items()}
+        return sketch
+
+
+def _add_probabilities(hists: Dict[str, np.ndarray], values: Dict[str, Any]):
+    for name, value in values.items():
+        if value is not None:
+            hists[name][min(int(float(value) * PROB_BINS), PROB_BINS - 1)] += 1
+
+
+def _quantiles(hist: Optional[np.ndarray], qs: Iterable[float] = (0.05, 0.25, 0.5, 0.75, 0.95)) -> Optional[Dict[str, float]]:
+    if hist is None or hist.sum() <= 0:
+        return None
+    cdf = np.cumsum(hist) / hist.sum()
+    return {f"p{int(q * 100)}": round((int(np.searchsorted(cdf, q)) + 0.5) / PROB_BINS, 3) for q in qs}
+
+
+def psi(expected: np.ndarray, actual: np.ndarray, eps: float = 1e-4) -> Optional[float]:
+    """Population stability index between two histograms over the same bins."""
+    if expected.sum() <= 0 or actual.sum() <= 0:
+        return None
+    e = np.maximum(expected / expected.sum(), eps)
+    a = np.maximum(actual / actual.sum(), eps)
+    return float(np.sum((a - e) * np.log(a / e)))
+
+
+def _coarse(hist: np.ndarray, bins: int = 10) -> np.ndarray:
+    return hist.reshape(bins, -1).sum(axis=1)
+
+
+class DriftMonitor:
+    def __init__(self, reference: Optional[Dict[str, Any]] = None, half_life: float = DRIFT_HALF_LIFE,
+                 min_samples: int = DRIFT_MIN_SAMPLES, members: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.live = DriftSketch()
+        self.reference: Optional[DriftSketch] = None
+        self.reference_meta: Dict[str, Any] = {}
+        # Per-member reference probabilities (version ID -> sketch, meta); set for ensembles
+        self.member_references: Dict[str, Tuple[DriftSketch, Dict[str, Any]]] = {}
+        self.compare_outputs = True
+        self.min_samples = min_samples
+        self._decay_factor = 0.5 ** (_DECAY_EVERY / half_life) if half_life > 0 else 1.0
+        self._since_decay = 0
+        self.totals = {"images": 0, "predictions": 0}
+        self._lock = threading.Lock()
+        self.set_reference(reference, members)
+
+    def set_reference(self, profile: Optional[Dict[str, Any]], members: Optional[Dict[str, Dict[str, Any]]] = None):
+        """Single-model reference, or per-member references (version ID -> profile, first one for images)."""
+        member_references = {vid: (DriftSketch.from_dict(p["sketch"]), {k: v for k, v in p.items() if k != "sketch"})
+                             for vid, p in (members or {}).items() if p}
+        if profile is None and member_references:
+            profile = next(p for p in members.values() if p)
+        with self._lock:
+            self.reference = DriftSketch.from_dict(profile["sketch"]) if profile else None
+            self.reference_meta = {k: v for k, v in (profile or {}).items() if k != "sketch"}
+            self.member_references = member_references
+            # An ensemble's own output is not what any member's profile recorded
+            self.compare_outputs = not member_references
+
+    def _tick(self):
+        self._since_decay += 1
+        if self._since_decay >= _DECAY_EVERY:
+            self.live.decay(self._decay_factor)
+            self._since_decay = 0
+
+    def observe_image(self, data: Optional[bytes], image: Optional[Image.Image], arr: np.ndarray):
+        width, height = (image.width, image.height) if image is not None else (arr.shape[1], arr.shape[0])
+        fmt = sniff_format(data)
+        with self._lock:
+            self.live.add_image(arr, width, height, fmt)
+            self.totals["images"] += 1
+
+    def observe_prediction(self, result: Dict[str, Any]):
+        with self._lock:
+            self.live.add_prediction(result)
+            self.totals["predictions"] += 1
+            # One prediction per model input, so decay is counted in requests
+            self._tick()
+
+    def scores(self) -> Dict[str, Any]:
+        with self._lock:
+            live, ref = self.live, self.reference
+            report: Dict[str, Any] = {
+                "totals": dict(self.totals),
+                "effective_samples": {"images": round(live.images, 1), "predictions": round(live.predictions, 1)},
+                "quantiles": {name: live.quantiles(name) for name in PROB_FIELDS},
+                "formats": {k: round(v, 1) for k, v in zip(FORMATS, live.formats) if v > 0},
+                "sizes": {k: round(v, 1) for k, v in zip(SIZE_BUCKETS, live.sizes) if v > 0},
+            }
+            if ref is None:
+                report["status"] = "no_reference"
+                report["hint"] = "Train with --reference-samples N to write a reference profile"
+                return report
+            psis = {
+                "intensity": psi(ref.intensity, live.intensity),
+                "brightness": psi(ref.brightness, live.brightness),
+                "size": psi(ref.sizes, live.sizes),
+                "format": psi(ref.formats, live.formats),
+            }
+            if self.compare_outputs:
+                for name in PROB_FIELDS:
+                    psis[name] = psi(_coarse(ref.probabilities[name]), _coarse(live.probabilities[name]))
+            members = {}
+            for vid, (member_ref, meta) in self.member_references.items():
+                live_hists = live.members.get(vid)
+                member_psis = {name: psi(_coarse(member_ref.probabilities[name]), _coarse(live_hists[name]))
+                               if live_hists else None for name in PROB_FIELDS}
+                for name, value in member_psis.items():
+                    psis[f"{name}@{vid}"] = value
+                members[vid] = {
+                    "model": meta.get("model"),
+                    "psi": {k: (round(v, 4) if v is not None else None) for k, v in member_psis.items()},
+                    "quantiles": {name: _quantiles(live_hists[name]) if live_hists else None for name in PROB_FIELDS},
+                    "reference_quantiles": {name: member_ref.quantiles(name) for name in PROB_FIELDS},
+                }
+            report["psi"] = {k: (round(v, 4) if v is not None else None) for k, v in psis.items()
+                             if "@" not in k}
+            if members:
+                report["members"] = members
+            report["reference"] = {**self.reference_meta,
+                                   "quantiles": {name: ref.quantiles(name) for name in PROB_FIELDS}}
+        if self.totals["images"] < self.min_samples and self.totals["predictions"] < self.min_samples:
+            report["status"] = "insufficient_data"
+            return report
+        worst = max((v for v in psis.values() if v is not None), default=0.0)
+        report["status"] = "drift" if worst > PSI_DRIFT else "moderate" if worst > PSI_MODERATE else "stable"
+        report["drifted"] = sorted(k for k, v in psis.items() if v is not None and v > PSI_MODERATE)
+        return report
+
+
+# --- Reference profiles (written at training time) ---
+
+def load_profile(path: Optional[Path]) -> Optional[Dict[str, Any]]:
+    if path is None or not Path(path).exists():
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def build_reference_profile(paths: List[Path], predict_fn: Callable[[np.ndarray], np.ndarray],
+                            img_size: Tuple[int, int], batch_size: int = 32,
+                            calibrate_fn: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> Dict[str, Any]:
+    """Run training images through the serving decode path and the model into one sketch.
+
+    img_size is the serving input as (width, height). calibrate_fn is the
+    serving calibration, so the calibrated histogram is recorded too.
+    """
+    from inference_engine import decode_image, preprocess, ImageDecodeError
+    sketch = DriftSketch()
+    batch: List[np.ndarray] = []
+
+    def flush():
+        probs = np.asarray(predict_fn(np.stack(batch)), dtype=np.float64).ravel()
+        calibrated = np.asarray(calibrate_fn(probs), dtype=np.float64) if calibrate_fn else [None] * len(probs)
+        for prob, cal in zip(probs, calibrated):
+            sketch.add_prediction({"raw_probability": float(prob),
+                                   "calibrated_probability": None if cal is None else float(cal)})
+        batch.clear()
+
+    for path in paths:
+        data = Path(path).read_bytes()
+        try:
+            image = decode_image(data, filename=Path(path).name)
+        except ImageDecodeError:
+            continue
+        arr = preprocess(image, img_size)
+        sketch.add_image(arr, image.width, image.height, sniff_format(data))
+        batch.append(arr)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return {"samples": int(sketch.images), "img_size": list(img_size), "sketch": sketch.to_dict()}
@@ -6,22 +6,89 @@ Features:
 - Enhanced preprocessing and post-processing
 - Confidence calibration
 - Automatic model selection based on performance metrics
+- Optional single distilled student (STUDENT_MODEL) instead of the full ensemble
+
+Decoding (images and PDFs), batching across concurrent requests and result
+caching are handled by inference_engine.InferenceEngine. Integrations holding
+decoded pixels can use the binary POST /predict/tensor endpoint (tensor_protocol.py);
+per-model details are only included when verbose is requested.
+
+Ensemble members may be trained at different input sizes (train_model.py
+--img-size). Each upload is decoded once at the largest member input and the
+smaller inputs are resized from that batch; GET /model_info lists the members
+per input size.
+
+Under load an overload_control.DegradationController degrades each new request
+from the full ensemble to the best single member, then to its int8 TFLite
+variant, then sheds with 503, and recovers as load falls. Every response
+reports the tier that served it (`serving_tier`, or the X-Serving-Tier header).
+The degraded tiers apply the ensemble's calibration to the member's output, so
+every tier applies the 0.3 threshold to a calibrated probability and returns
+the same fields.
+
+Uploads that do not look like chest X-rays are stopped by input_gate.InputGate
+before they use model capacity (422, or an `input_check` note with
+INPUT_GATE=flag); GET /metrics reports the gate's rejection rate.
+
+With DEBUG_MEMORY=1, GET /debug/memory returns RSS, tracemalloc top allocators
+and TF allocator stats (used by soak_test.py).
+
+Asynchronous jobs for large PDFs and multi-image studies (job_queue.py):
+POST /jobs queues the files in a local SQLite queue and returns a job ID;
+GET /jobs/{id} polls and GET /jobs/{id}/events streams server-sent events.
+
+Model execution is admitted by request_scheduler.FairScheduler: X-Priority
+(interactive, the default for synchronous endpoints, or batch, used for jobs)
+selects the class and X-API-Key / X-Client-Id the fair-share client. A full
+class queue returns 503; tensor requests and jobs larger than the class limit
+run in chunks, each holding its own slot. Overload
+admission happens before a request queues for its scheduler slot, so the
+degradation controller counts waiting as well as executing images and its
+latency includes the queue wait.
+
+Threads, batch size and batch window come from the autotune profile
+(autotune.py): the ensemble setting for the full tier, the best member's
+setting (including the compiled backend) for the degraded tiers. Without a
+profile for this host one is tuned in the background (AUTOTUNE=auto|load|off);
+after the models change, POST /autotune re-tunes the stale profile.
+
+GET /drift compares recent inputs and probabilities with the training-time
+reference profiles: each member's probabilities against its own profile, the
+inputs against the best member's (drift_monitor.py).
+
+Every prediction (synchronous, tensor and job) is appended to the write-behind
+prediction log (prediction_log.py) with its content hash, model versions,
+probabilities, threshold and latency; pass X-Record-Id to link it to a
+HealthRecord entry. GET /predictions queries the log by hash, record or time.
 """
 import os
-import io
 import json
-from typing import Tuple, Dict, List, Optional, Any
-import numpy as np
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import time
+import threading
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from PIL import Image
-import tensorflow as tf
-from pathlib import Path
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Tuple
+from model_ensemble import ModelEnsemble
+from inference_engine import InferenceEngine, EnsembleBackend, KerasBackend, MemberBackend, TFLiteBackend, ImageInput, ImageDecodeError
+from overload_control import DegradationController, Overloaded
+from input_gate import InputGate, InputRejected
+from memory_probe import DEBUG_MEMORY, start_tracing, memory_snapshot
+from job_queue import JobQueue, JobWorker, job_events
+from request_scheduler import FairScheduler, QueueFull, request_identity
+from drift_monitor import DriftMonitor, DRIFT_MONITOR
+from prediction_log import PredictionLog, PREDICTION_LOG
+from tensor_protocol import decode_frames, encode_results, TensorProtocolError, RESULT_MEDIA_TYPE
+from autotune import ensure_profile, setting_for, apply_threads, engine_settings, apply_engine_settings
+from autotune import describe as describe_autotune, retune_in_background, AUTOTUNE_MODE
 
 # Configuration
-IMG_SIZE = (150, 150)
-BASE_DIR = Path(__file__).parent
-MODEL_DIR = BASE_DIR
+# Seconds between registry checks for new model versions (0 disables hot reload)
+MODEL_RELOAD_INTERVAL = float(os.getenv("MODEL_RELOAD_INTERVAL", "0"))
+# Background worker for POST /jobs (0 disables the job API)
+JOBS_ENABLED = os.getenv("JOBS_ENABLED", "1") == "1"
+JOB_MAX_BYTES = int(os.getenv("JOB_MAX_BYTES", str(200 * 1024 * 1024)))
 
 app = FastAPI(title="Enhanced Pneumonia Detection API", version="2.0.0")
 
@@ -33,200 +100,256 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
-class ModelEnsemble:
-    def __init__(self):
-        self.models = {}
-        self.model_metrics = {}
-        self.model_weights = {}
-        self.load_available_models()
-    
-    def load_available_models(self):
-        """Load all available trained models and their metrics."""
-        model_files = [
-            "pneumonia_detection_model.keras",
-            "pneumonia_smoke.keras"
-        ]
-        
-        for model_file in model_files:
-            model_path = MODEL_DIR / model_file
-            if model_path.exists():
-                try:
-                    print(f"Loading model: {model_file}")
-                    model = tf.keras.models.load_model(model_path)
-                    self.models[model_file] = model
-                    
-                    # Load metrics if available
-                    metrics_file = MODEL_DIR / f"{model_file.replace('.keras', '_metrics.json')}"
-                    if metrics_file.exists():
-                        with open(metrics_file, 'r') as f:
-                            self.model_metrics[model_file] = json.load(f)
-                    
-                    print(f"✅ Successfully loaded {model_file}")
-                except Exception as e:
-                    print(f"❌ Failed to load {model_file}: {e}")
-        
-        self.calculate_model_weights()
-        print(f"Loaded {len(self.models)} models for ensemble")
-    
-    def calculate_model_weights(self):
-        """Calculate weights for ensemble based on model performance."""
-        if not self.model_metrics:
-            # Give more weight to the main model, less to smoke model
-            for model_name in self.models:
-                if "detection" in model_name:
-                    self.model_weights[model_name] = 0.8
-                else:
-                    self.model_weights[model_name] = 0.2
-            return
-        
-        # Weight models based on F1 score and AUC
-        weights = {}
-        for model_name, metrics in self.model_metrics.items():
-            if 'test' in metrics:
-                test_metrics = metrics['test']
-                # Combine F1 and AUC for weighting
-                f1_score = test_metrics.get('f1', 0.5)
-                roc_auc = test_metrics.get('roc_auc', 0.5)
-                weights[model_name] = (f1_score + roc_auc) / 2
-            else:
-                weights[model_name] = 0.5
-        
-        # Normalize weights
-        total_weight = sum(weights.values())
-        if total_weight > 0:
-            self.model_weights = {k: v/total_weight for k, v in weights.items()}
-        else:
-            # Fallback to weighted approach
-            for model_name in self.models:
-                if "detection" in model_name:
-                    self.model_weights[model_name] = 0.8
-                else:
-                    self.model_weights[model_name] = 0.2
-    
-    def preprocess_image(self, image: Image.Image) -> np.ndarray:
-        """Enhanced preprocessing with multiple augmentations for robustness."""
-        # Convert to RGB and resize
-        image = image.convert("RGB")
-        image = image.resize(IMG_SIZE)
-        
-        # Normalize
-        arr = np.array(image) / 255.0
-        
-        # Add batch dimension
-        arr = np.expand_dims(arr, axis=0)
-        
-        return arr
-    
-    def predict_ensemble(self, image_array: np.ndarray) -> Dict[str, Any]:
-        """Make prediction using ensemble of models."""
-        if not self.models:
-            raise HTTPException(status_code=500, detail="No models loaded")
-        
-        predictions = {}
-        weighted_probs = []
-        
-        # Get predictions from all models
-        for model_name, model in self.models.items():
+if DEBUG_MEMORY:
+    start_tracing()
+
+# Global ensemble instance and the engine serving it
+ensemble = ModelEnsemble()
+gate = InputGate()
+
+def _apply_profile(profile):
+    """A background re-tune finished: take over its batching (threads apply after a restart)."""
+    global tuning_profile
+    tuning_profile = profile
+    apply_engine_settings(engine, setting_for(profile))
+    for _, tier_engine in tier_engines.values():
+        if tier_engine is not engine:
+            apply_engine_settings(tier_engine, setting_for(profile, tier_engine.backend.entry.get("version_id")))
+
+tuning_profile = ensure_profile(ensemble.registry.model_dir, ensemble.registry, on_update=_apply_profile)
+# Before any member (and with it TensorFlow) is loaded
+apply_threads(setting_for(tuning_profile))
+
+def member_reference_profiles():
+    """Drift reference per member version, best member first (its profile is the image reference)."""
+    best = ensemble.best_member()
+    names = ([best] if best else []) + [name for name in ensemble.models if name != best]
+    profiles = {}
+    for name in names:
+        entry = ensemble.model_metadata[name]
+        profile = ensemble.registry.load_reference_profile(entry)
+        if profile:
+            profiles[entry["version_id"]] = profile
+    return profiles
+
+drift = DriftMonitor(members=member_reference_profiles()) if DRIFT_MONITOR else None
+engine = InferenceEngine(EnsembleBackend(ensemble), gate=gate, drift=drift, **engine_settings(setting_for(tuning_profile)))
+controller = DegradationController()
+scheduler = FairScheduler()
+# tier -> (tier actually served, engine); built from the current ensemble members
+tier_engines: Dict[str, Tuple[str, InferenceEngine]] = {}
+
+def build_tier_engines():
+    """Engines for the degraded tiers, reusing existing ones whose model version is unchanged."""
+    global tier_engines
+    existing = {e.backend.cache_key: e for _, e in tier_engines.values()}
+    engines = {"full": ("full", engine)}
+    best = ensemble.best_member()
+    if best is not None and not ensemble.student:
+        entry = ensemble.model_metadata[best]
+        tuning = setting_for(tuning_profile, entry["version_id"])
+        # Degraded tiers use the ensemble's calibration, so the same threshold means the same thing
+        single = existing.get(entry["version_id"]) or InferenceEngine(
+            MemberBackend(KerasBackend(ensemble.models[best], entry, compiled=(tuning or {}).get("backend") == "compiled"),
+                          best, ensemble.calibrate_probabilities),
+            gate=gate, drift=drift, **engine_settings(tuning))
+        engines["single"] = ("single", single)
+        engines["quantized"] = engines["single"]
+        int8_path = ensemble.registry.artifact_path(entry, "tflite_int8")
+        if int8_path is not None:
             try:
-                pred = model.predict(image_array, verbose=0)
-                prob = float(pred[0][0])
-                predictions[model_name] = {
-                    'probability': prob,
-                    'prediction': 'PNEUMONIA' if prob >= 0.5 else 'NORMAL'
-                }
-                
-                # Weight the probability
-                weight = self.model_weights.get(model_name, 1.0 / len(self.models))
-                weighted_probs.append(prob * weight)
-                
+                quantized = existing.get(f"{entry['version_id']}:{int8_path.name}") or InferenceEngine(
+                    MemberBackend(TFLiteBackend(int8_path, entry, num_threads=tuning["intra_op"] if tuning else None),
+                                  best, ensemble.calibrate_probabilities),
+                    gate=gate, drift=drift, **engine_settings(tuning))
+                engines["quantized"] = ("quantized", quantized)
             except Exception as e:
-                print(f"Error with model {model_name}: {e}")
-                continue
-        
-        if not weighted_probs:
-            raise HTTPException(status_code=500, detail="All models failed to predict")
-        
-        # Calculate ensemble prediction
-        ensemble_prob = sum(weighted_probs)
-        
-        # Apply confidence calibration
-        calibrated_prob = self.calibrate_confidence(ensemble_prob)
-        
-        # Determine final prediction with adjusted threshold
-        # Use lower threshold (0.3) to catch more pneumonia cases and reduce false negatives
-        threshold = 0.3
-        final_prediction = 'PNEUMONIA' if calibrated_prob >= threshold else 'NORMAL'
-        confidence = calibrated_prob if final_prediction == 'PNEUMONIA' else (1 - calibrated_prob)
-        
-        return {
-            'prediction': final_prediction,
-            'confidence': round(confidence, 4),
-            'ensemble_probability': round(ensemble_prob, 4),
-            'calibrated_probability': round(calibrated_prob, 4),
-            'individual_predictions': predictions,
-            'model_weights': self.model_weights,
-            'threshold_used': threshold
-        }
-    
-    def calibrate_confidence(self, raw_prob: float) -> float:
-        """Apply confidence calibration to improve reliability."""
-        # Simple Platt scaling approximation
-        # This helps correct overconfident predictions
-        
-        # For now, apply a simple sigmoid transformation
-        # In production, this should be fitted on a calibration set
-        calibrated = 1 / (1 + np.exp(-5 * (raw_prob - 0.5)))
-        return float(calibrated)
+                print(f"❌ Could not load int8 variant of {best}: {e}")
+    else:
+        # A single student is already the cheapest Keras tier
+        engines["single"] = engines["quantized"] = engines["full"]
+    tier_engines = engines
 
-# Global ensemble instance
-ensemble = ModelEnsemble()
+def clear_caches():
+    for _, tier_engine in tier_engines.values():
+        tier_engine.clear_cache()
+
+def models_changed():
+    """Rebuild everything that depends on the ensemble members after a reload."""
+    global tuning_profile
+    # New versions can make the profile stale; it stays in use until POST /autotune
+    tuning_profile = ensure_profile(ensemble.registry.model_dir, ensemble.registry, on_update=_apply_profile)
+    build_tier_engines()
+    clear_caches()
+    if drift:
+        drift.set_reference(None, member_reference_profiles())
+
+build_tier_engines()
+
+def _watch_registry():
+    while True:
+        time.sleep(MODEL_RELOAD_INTERVAL)
+        try:
+            if ensemble.reload():
+                models_changed()
+                print(f"🔄 Reloaded ensemble: {ensemble.model_versions}")
+        except Exception as e:
+            print(f"❌ Registry reload failed: {e}")
+
+if MODEL_RELOAD_INTERVAL > 0:
+    threading.Thread(target=_watch_registry, daemon=True).start()
+
+prediction_log = PredictionLog() if PREDICTION_LOG else None
+
+def _log_job(job, results):
+    if prediction_log is None:
+        return
+    meta = json.loads(job.get("meta") or "{}")
+    filenames = meta.get("filenames") or [None] * len(results)
+    for filename, result in zip(filenames, results):
+        prediction_log.record(result, endpoint="/jobs", client=job.get("client"), filename=filename,
+                              record_id=meta.get("record_id"), serving_tier="full")
+
+# Jobs always run on the full ensemble; they are not latency sensitive
+job_queue = JobQueue() if JOBS_ENABLED else None
+job_worker = JobWorker(job_queue, lambda: engine, scheduler=scheduler, on_results=_log_job) if JOBS_ENABLED else None
+
+@app.on_event("startup")
+async def start_job_worker():
+    if job_worker:
+        job_worker.start()
+
+@app.on_event("shutdown")
+async def stop_job_worker():
+    if job_worker:
+        await job_worker.stop()
+    if prediction_log:
+        prediction_log.close()
 
 @app.get("/health")
 def health():
     return {
         "status": "ok",
         "models_loaded": len(ensemble.models),
-        "available_models": list(ensemble.models.keys())
+        "available_models": list(ensemble.models.keys()),
+        "model_versions": ensemble.model_versions,
+        "serving_tier": controller.tier
+    }
+
+@app.get("/metrics")
+def metrics():
+    """Counters for dashboards: per-tier engine stats, overload state and input gate."""
+    return {
+        "engines": {tier: tier_engine.describe()["stats"] for tier, (served, tier_engine) in tier_engines.items()
+                    if served == tier},
+        "overload": controller.describe(),
+        "scheduler": scheduler.describe(),
+        "input_gate": gate.describe(),
+        "jobs": {**job_queue.counts(), **job_worker.stats} if job_queue else None,
+        "prediction_log": prediction_log.describe() if prediction_log else None
     }
 
+@app.get("/drift")
+def drift_report():
+    """PSI drift scores of recent inputs and probabilities against the training reference."""
+    if drift is None:
+        raise HTTPException(status_code=404, detail="Drift monitor disabled (DRIFT_MONITOR=0)")
+    return drift.scores()
+
+@app.get("/predictions")
+def predictions(content_hash: str = None, record_id: str = None, since: float = None, until: float = None,
+                limit: int = 100):
+    """Logged predictions by upload content hash, record ID or time range (Unix seconds), newest first."""
+    if prediction_log is None:
+        raise HTTPException(status_code=404, detail="Prediction log disabled (PREDICTION_LOG=0)")
+    return {"predictions": prediction_log.query(content_hash, since, until, record_id, min(limit, 1000))}
+
+@app.get("/debug/memory")
+def debug_memory(top: int = 20):
+    """RSS, tracemalloc top allocators and TF allocator stats (DEBUG_MEMORY=1 only)."""
+    if not DEBUG_MEMORY:
+        raise HTTPException(status_code=404, detail="Set DEBUG_MEMORY=1 to enable memory debugging")
+    return memory_snapshot(top)
+
 @app.get("/model_info")
 def model_info():
     """Get information about loaded models and their performance."""
     return {
         "models": list(ensemble.models.keys()),
+        "model_versions": ensemble.model_versions,
+        "registry_fingerprint": ensemble.registry.fingerprint(),
         "model_weights": ensemble.model_weights,
-        "model_metrics": ensemble.model_metrics
+        "model_metrics": ensemble.model_metrics,
+        "model_metadata": ensemble.model_metadata,
+        "input_sizes": {f"{w}x{h}": names for (w, h), names in ensemble.input_groups.items()},
+        "loaded": {name: model.loaded for name, model in ensemble.models.items()},
+        "engine": engine.describe(),
+        "overload": controller.describe(),
+        "autotune": describe_autotune(tuning_profile, ensemble.registry),
+        "tiers": {tier: {"served_by": served, **tier_engine.describe()}
+                  for tier, (served, tier_engine) in tier_engines.items()}
+    }
+
+@app.post("/reload")
+def reload_models():
+    """Pick up new or changed model versions from the registry."""
+    changed = ensemble.reload()
+    if changed:
+        models_changed()
+    return {
+        "changed": changed,
+        "model_versions": ensemble.model_versions
     }
 
+@app.post("/autotune")
+def start_autotune():
+    """Re-tune threads and batching for the current models in a background process."""
+    if AUTOTUNE_MODE == "off":
+        raise HTTPException(status_code=404, detail="Autotune disabled (AUTOTUNE=off)")
+    started = retune_in_background(ensemble.registry.model_dir, on_update=_apply_profile)
+    return {"started": started, **describe_autotune(tuning_profile, ensemble.registry)}
+
+def _identity(request: Request):
+    cls, client = request_identity(request.headers, request.client.host if request.client else None)
+    if cls not in scheduler.classes:
+        raise HTTPException(status_code=400, detail=f"Unknown X-Priority '{cls}'")
+    return cls, client
+
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(request: Request, file: UploadFile = File(...)):
+    started = time.perf_counter()
     try:
-        # Read and validate file
         contents = await file.read()
-        if not contents:
-            raise HTTPException(status_code=400, detail="Empty file")
+        cls, client = _identity(request)
         
-        # Load image
+        # Decode, preprocess and predict (batched with concurrent requests)
         try:
-            image = Image.open(io.BytesIO(contents))
-            if getattr(image, "is_animated", False):
-                image.seek(0)
-            image = image.convert("RGB")
-        except Exception:
-            raise HTTPException(status_code=400, detail="Invalid image file")
-        
-        # Preprocess
-        image_array = ensemble.preprocess_image(image)
-        
-        # Get ensemble prediction
-        result = ensemble.predict_ensemble(image_array)
+            # Overload admission first, so queued requests count toward the degradation tiers
+            with controller.admit() as tier:
+                async with scheduler.slot(cls, client) as queue_time:
+                    serving_tier, tier_engine = tier_engines[tier]
+                    result = (await tier_engine.apredict([ImageInput(contents, file.content_type, file.filename)]))[0]
+        except (Overloaded, QueueFull) as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        except InputRejected as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except ImageDecodeError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         # Add metadata
         result.update({
+            'serving_tier': serving_tier,
+            'priority_class': cls,
+            'queue_time_ms': round(queue_time * 1000, 2),
             'model_version': 'Enhanced Ensemble v2.0',
-            'image_size': IMG_SIZE,
+            'serving_mode': 'student' if ensemble.student else 'ensemble',
+            'image_size': list(tier_engine.image_size),
             'filename': file.filename or 'unknown'
         })
+        if prediction_log:
+            prediction_log.record(result, (time.perf_counter() - started) * 1000, endpoint="/predict",
+                                  client=client, filename=file.filename,
+                                  record_id=request.headers.get("X-Record-Id"))
         
         return result
         
@@ -235,6 +358,76 @@ async def predict(file: UploadFile = File(...)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction error: {str(e)}")
 
+@app.post("/predict/tensor")
+async def predict_tensor(request: Request, verbose: bool = False):
+    """Binary endpoint for pre-decoded N x H x W x {1,3} tensors at the engine's image_size (see tensor_protocol.py)."""
+    started = time.perf_counter()
+    cls, client = _identity(request)
+    try:
+        images, frame_verbose = decode_frames(await request.body())
+        with controller.admit(cost=len(images)) as tier:
+            serving_tier, tier_engine = tier_engines[tier]
+            # Chunks of at most the class limit, so a large request neither bypasses it nor starves
+            size, results = scheduler.max_cost(cls), []
+            for i in range(0, len(images), size):
+                chunk = images[i:i + size]
+                async with scheduler.slot(cls, client, cost=len(chunk)):
+                    results.extend(await tier_engine.apredict(chunk, return_exceptions=True))
+        payload = encode_results(results, tier_engine.threshold, verbose or frame_verbose)
+    except (Overloaded, QueueFull) as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except TensorProtocolError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if prediction_log:
+        latency_ms = (time.perf_counter() - started) * 1000
+        for result in results:
+            prediction_log.record(result, latency_ms, endpoint="/predict/tensor", client=client,
+                                  serving_tier=serving_tier, record_id=request.headers.get("X-Record-Id"))
+    return Response(content=payload, media_type=RESULT_MEDIA_TYPE, headers={"X-Serving-Tier": serving_tier})
+
+def _require_jobs() -> JobQueue:
+    if job_queue is None:
+        raise HTTPException(status_code=404, detail="Job API disabled (JOBS_ENABLED=0)")
+    return job_queue
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: Request, files: List[UploadFile] = File(...)):
+    """Queue one or more files (e.g. a multi-image study) for asynchronous prediction."""
+    queue = _require_jobs()
+    items, total = [], 0
+    for upload in files:
+        contents = await upload.read()
+        total += len(contents)
+        if total > JOB_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Job exceeds {JOB_MAX_BYTES} bytes")
+        items.append(ImageInput(contents, upload.content_type, upload.filename))
+    # Writing up to JOB_MAX_BYTES of blobs to SQLite must not block the event loop
+    job_id = await run_in_threadpool(queue.submit, items, client=request.headers.get("X-Client-Id"),
+                                     meta={"filenames": [upload.filename for upload in files],
+                                           "record_id": request.headers.get("X-Record-Id")})
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events"
+    }
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = _require_jobs().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+def job_event_stream(job_id: str):
+    """Server-sent events: a `status` event on every change until the job is done or failed."""
+    queue = _require_jobs()
+    if queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(job_events(queue, job_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("enhanced_inference_service:app", host="0.0.0.0", port=8002, reload=False)
@@ -0,0 +1,785 @@
+"""In-process inference engine shared by all inference services.
+
+Decoding, preprocessing, batching, caching and backend selection live here so
+the FastAPI apps (inference_service.py, enhanced_inference_service.py,
+mock_inference.py) are thin wrappers, and offline jobs or notebooks can call
+the same code directly without HTTP.
+
+Usage:
+    from inference_engine import create_engine
+    engine = create_engine("ensemble")
+    results = engine.predict([open("xray.png", "rb").read()])
+    for result in engine.predict_iter(paths_to_bytes(paths)):
+        ...
+    # inside async code
+    results = await engine.apredict([ImageInput(data, "application/pdf", "scan.pdf")])
+
+Inputs may be encoded file bytes, `ImageInput` (bytes + content type/filename
+hints), PIL images, or already preprocessed HxWx3 arrays. Every input (arrays
+included) passes through an optional input_gate.InputGate before it is queued
+for the model, and an optional drift_monitor.DriftMonitor sees every image and
+prediction.
+
+Each upload is decoded and resized once, at the largest input size the backend
+needs (`backend.input_sizes`, read from the registry's input_shape); an
+ensemble whose members use smaller inputs derives them from that batch
+(model_ensemble.py). Model batches are grouped by input shape, so a batch
+never mixes shapes, e.g. while the ensemble is reloaded with a new member.
+
+With INFERENCE_SHM_DECODE=1, uploads on the async path are decoded by worker
+processes straight into a shared-memory ring of batch slots
+(shm_decode_pool.py) and the model reads each batch in place; the sync path
+and PIL/array inputs keep using the decode threads.
+
+Backends (INFERENCE_BACKEND or create_engine(kind)):
+    keras     single registered Keras model
+    compiled  the same model as an XLA-compiled tf.function
+    ensemble  weighted, calibrated ModelEnsemble
+    student   distilled student served through ModelEnsemble
+    tflite    TFLite (or int8 TFLite) variant from the model registry
+    mock      deterministic fake predictions, no TensorFlow required
+"""
+import os
+import io
+import time
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+import numpy as np
+from PIL import Image
+try:
+    import fitz  # PyMuPDF
+    _HAS_PYMUPDF = True
+except Exception:
+    _HAS_PYMUPDF = False
+
+# Input size (width, height) when the backend does not report one
+IMG_SIZE = (150, 150)
+# Lower threshold (0.3) catches more pneumonia cases and reduces false negatives
+DEFAULT_THRESHOLD = 0.3
+BASE_DIR = Path(__file__).parent
+
+CACHE_SIZE = int(os.getenv("INFERENCE_CACHE_SIZE", "1024"))
+MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH", "16"))
+BATCH_WAIT_MS = float(os.getenv("INFERENCE_BATCH_WAIT_MS", "2"))
+DECODE_WORKERS = int(os.getenv("INFERENCE_DECODE_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Decode async uploads in worker processes into shared memory (shm_decode_pool.py)
+SHM_DECODE = os.getenv("INFERENCE_SHM_DECODE", "0") == "1"
+
+
+class ImageDecodeError(ValueError):
+    """The upload could not be turned into an image (services map this to HTTP 400)."""
+
+
+@dataclass
+class ImageInput:
+    data: bytes
+    content_type: Optional[str] = None
+    filename: Optional[str] = None
+
+
+EngineInput = Union[bytes, ImageInput, Image.Image, np.ndarray]
+
+
+# --- Decoding and preprocessing ---
+
+def _is_pdf(data: bytes, content_type: Optional[str], filename: Optional[str]) -> bool:
+    return ((content_type or "").lower() == "application/pdf"
+            or (filename or "").lower().endswith(".pdf")
+            or data[:5] == b"%PDF-")
+
+
+def _load_image_from_pdf(data: bytes) -> Image.Image:
+    if not _HAS_PYMUPDF:
+        raise ImageDecodeError("PDF support requires PyMuPDF. Please install 'pymupdf'.")
+    try:
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            if doc.page_count == 0:
+                raise ImageDecodeError("Empty PDF")
+            page = doc.load_page(0)
+            # Render first page at higher zoom for clarity
+            zoom = fitz.Matrix(2, 2)
+            pix = page.get_pixmap(matrix=zoom, alpha=False)
+            mode = "RGB" if pix.n < 4 else "RGBA"
+            img = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
+            return img.convert("RGB")
+    except ImageDecodeError:
+        raise
+    except Exception:
+        raise ImageDecodeError("Failed to process PDF")
+
+
+def decode_image(data: bytes, content_type: Optional[str] = None, filename: Optional[str] = None) -> Image.Image:
+    """Decode an upload (PDF first page or any PIL-readable image) to RGB."""
+    if not data:
+        raise ImageDecodeError("Empty file")
+    if _is_pdf(data, content_type, filename):
+        return _load_image_from_pdf(data)
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            # For animated formats, select first frame
+            if getattr(img, "is_animated", False):
+                img.seek(0)
+            return img.convert("RGB")
+    except Exception:
+        raise ImageDecodeError("Invalid or unsupported image file")
+
+
+def preprocess(image: Image.Image, size: Tuple[int, int] = IMG_SIZE) -> np.ndarray:
+    """Resize to the model input and scale to 0-1 (matches training)."""
+    image = image.convert("RGB").resize(size)
+    return np.asarray(image, dtype=np.float32) / 255.0
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+# --- Backends ---
+
+class KerasBackend:
+    """Single Keras model (LazyModel or loaded model).
+
+    With compiled=True the forward pass is an XLA-compiled tf.function. Each
+    batch size is compiled once, so partial batches are padded to the next
+    power of two to bound the number of compilations.
+    """
+
+    kind = "keras"
+
+    def __init__(self, model, entry: Optional[Dict[str, Any]] = None, compiled: bool = False):
+        self.model = model
+        self.entry = entry or {}
+        self.compiled = compiled
+        self._forward = None
+        self._forward_model = None
+
+    @property
+    def cache_key(self) -> str:
+        return self.entry.get("version_id", "keras")
+
+    @property
+    def input_sizes(self) -> List[Tuple[int, int]]:
+        from model_registry import input_size
+        size = input_size(self.entry)
+        return [size] if size else []
+
+    def warm(self):
+        if hasattr(self.model, "load"):
+            self.model.load()
+
+    def _compiled(self, model):
+        if self._forward is None or self._forward_model is not model:
+            import tensorflow as tf
+            self._forward = tf.function(lambda x: model(x, training=False), jit_compile=True)
+            self._forward_model = model
+        return self._forward
+
+    def predict_batch(self, batch: np.ndarray) -> List[Dict[str, Any]]:
+        model = self.model.load() if hasattr(self.model, "load") else self.model
+        if self.compiled:
+            n = len(batch)
+            padded = 1 << (n - 1).bit_length()
+            if padded > n:
+                batch = np.concatenate([batch, np.zeros((padded - n,) + batch.shape[1:], dtype=batch.dtype)])
+            probs = np.asarray(self._compiled(model)(batch), dtype=np.float64).ravel()[:n]
+        else:
+            # Direct call avoids model.predict's per-call data pipeline overhead
+            probs = np.asarray(model(batch, training=False), dtype=np.float64).ravel()
+        return [{
+            "probability": float(p),
+            "raw_probability": round(float(p), 4),
+            "model_version_id": self.entry.get("version_id"),
+        } for p in probs]
+
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": "compiled" if self.compiled else self.kind, "model": self.entry.get("name"),
+                "version_id": self.entry.get("version_id")}
+
+
+class EnsembleBackend:
+    """ModelEnsemble (or a distilled student served through it)."""
+
+    kind = "ensemble"
+
+    def __init__(self, ensemble):
+        self.ensemble = ensemble
+
+    @property
+    def cache_key(self) -> str:
+        return ",".join(f"{k}@{v}" for k, v in sorted(self.ensemble.model_versions.items()))
+
+    @property
+    def input_sizes(self) -> List[Tuple[int, int]]:
+        return list(self.ensemble.input_groups)
+
+    def warm(self):
+        self.ensemble.warm_models()
+
+    def predict_batch(self, batch: np.ndarray) -> List[Dict[str, Any]]:
+        probs = self.ensemble.ensemble_probabilities(batch)
+        member_calibrated = {name: self.ensemble.calibrate_probabilities(member_probs)
+                             for name, member_probs in probs["members"].items()}
+        results = []
+        for i in range(len(batch)):
+            individual = {}
+            for model_name, member_probs in probs["members"].items():
+                p = float(member_probs[i])
+                individual[model_name] = {
+                    "probability": p,
+                    "calibrated_probability": round(float(member_calibrated[model_name][i]), 4),
+                    "prediction": "PNEUMONIA" if p >= 0.5 else "NORMAL"
+                }
+            calibrated = float(probs["calibrated"][i])
+            results.append({
+                "probability": calibrated,
+                "ensemble_probability": round(float(probs["ensemble"][i]), 4),
+                "raw_probability": round(float(probs["ensemble"][i]), 4),
+                "calibrated_probability": round(calibrated, 4),
+                "individual_predictions": individual,
+                "model_weights": self.ensemble.model_weights,
+                "model_versions": dict(self.ensemble.model_versions),
+            })
+        return results
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "backend": "student" if self.ensemble.student else self.kind,
+            "model_versions": dict(self.ensemble.model_versions),
+        }
+
+
+class MemberBackend:
+    """One ensemble member with the ensemble's calibration and response fields.
+
+    Wraps a single-model backend (Keras, compiled or TFLite) for the degraded
+    tiers of enhanced_inference_service.py, so the engine threshold applies to
+    the same calibrated scale on every tier and responses have the same fields.
+    """
+
+    def __init__(self, backend, name: str, calibrate: Callable[[np.ndarray], np.ndarray]):
+        self.backend = backend
+        self.name = name
+        self.calibrate = calibrate
+
+    @property
+    def kind(self) -> str:
+        return self.backend.kind
+
+    @property
+    def entry(self) -> Dict[str, Any]:
+        return self.backend.entry
+
+    @property
+    def cache_key(self) -> str:
+        return self.backend.cache_key
+
+    @property
+    def input_sizes(self) -> List[Tuple[int, int]]:
+        return self.backend.input_sizes
+
+    def warm(self):
+        self.backend.warm()
+
+    def predict_batch(self, batch: np.ndarray) -> List[Dict[str, Any]]:
+        raw = np.array([r["probability"] for r in self.backend.predict_batch(batch)], dtype=np.float64)
+        calibrated = np.asarray(self.calibrate(raw), dtype=np.float64)
+        version_id = self.entry.get("version_id")
+        return [{
+            "probability": float(c),
+            "ensemble_probability": round(float(p), 4),
+            "raw_probability": round(float(p), 4),
+            "calibrated_probability": round(float(c), 4),
+            "individual_predictions": {self.name: {
+                "probability": float(p),
+                "calibrated_probability": round(float(c), 4),
+                "prediction": "PNEUMONIA" if p >= 0.5 else "NORMAL"
+            }},
+            "model_weights": {self.name: 1.0},
+            "model_versions": {self.name: version_id},
+        } for p, c in zip(raw, calibrated)]
+
+    def describe(self) -> Dict[str, Any]:
+        return {**self.backend.describe(), "member": self.name, "calibrated": True}
+
+
+class TFLiteBackend:
+    """TFLite interpreter for a registry variant (float or int8 quantized)."""
+
+    kind = "tflite"
+
+    def __init__(self, model_path: Path, entry: Optional[Dict[str, Any]] = None, num_threads: Optional[int] = None):
+        import tensorflow as tf
+        self.model_path = Path(model_path)
+        self.entry = entry or {}
+        self.interpreter = tf.lite.Interpreter(model_path=str(model_path), num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch = int(self._input["shape"][0])
+        # One interpreter is not thread-safe
+        self._lock = threading.Lock()
+
+    @property
+    def cache_key(self) -> str:
+        return f"{self.entry.get('version_id', 'tflite')}:{self.model_path.name}"
+
+    @property
+    def input_sizes(self) -> List[Tuple[int, int]]:
+        _, h, w, _ = self._input["shape"]
+        return [(int(w), int(h))]
+
+    def warm(self):
+        pass
+
+    def predict_batch(self, batch: np.ndarray) -> List[Dict[str, Any]]:
+        with self._lock:
+            if len(batch) != self._batch:
+                self.interpreter.resize_tensor_input(self._input["index"], [len(batch)] + list(batch.shape[1:]))
+                self.interpreter.allocate_tensors()
+                self._input = self.interpreter.get_input_details()[0]
+                self._output = self.interpreter.get_output_details()[0]
+                self._batch = len(batch)
+            x = batch
+            scale, zero_point = self._input.get("quantization", (0.0, 0))
+            if scale:
+                x = np.round(batch / scale + zero_point)
+            self.interpreter.set_tensor(self._input["index"], x.astype(self._input["dtype"]))
+            self.interpreter.invoke()
+            out = self.interpreter.get_tensor(self._output["index"]).astype(np.float64)
+            scale, zero_point = self._output.get("quantization", (0.0, 0))
+            if scale:
+                out = (out - zero_point) * scale
+        return [{
+            "probability": float(p),
+            "raw_probability": round(float(p), 4),
+            "model_version_id": self.entry.get("version_id"),
+        } for p in out.ravel()]
+
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": self.kind, "model": self.model_path.name, "version_id": self.entry.get("version_id")}
+
+
+class MockBackend:
+    """Fake predictions for demos and load tests; deterministic per input."""
+
+    kind = "mock"
+    cache_key = "mock"
+    input_sizes: List[Tuple[int, int]] = []
+
+    def __init__(self, seed: int = 0):
+        self.seed = seed
+
+    def warm(self):
+        pass
+
+    def predict_batch(self, batch: np.ndarray) -> List[Dict[str, Any]]:
+        results = []
+        for arr in batch:
+            digest = hashlib.sha256(arr.tobytes() + str(self.seed).encode()).digest()
+            p = int.from_bytes(digest[:8], "big") / float(1 << 64)
+            results.append({"probability": p, "raw_probability": round(p, 4)})
+        return results
+
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": self.kind, "seed": self.seed}
+
+
+def create_backend(kind: Optional[str] = None, model: Optional[str] = None, model_dir: Optional[Path] = None,
+                   num_threads: Optional[int] = None):
+    """Build a backend by name; registry-backed kinds resolve `model` by name or version ID."""
+    kind = (kind or os.getenv("INFERENCE_BACKEND", "ensemble")).lower()
+    model_dir = Path(model_dir) if model_dir else BASE_DIR
+    if kind == "mock":
+        return MockBackend(seed=int(os.getenv("MOCK_SEED", "0")))
+
+    from model_registry import ModelRegistry
+    registry = ModelRegistry(model_dir)
+    if kind in ("ensemble", "student"):
+        from model_ensemble import ModelEnsemble
+        student = (model or os.getenv("STUDENT_MODEL")) if kind == "student" else os.getenv("STUDENT_MODEL")
+        return EnsembleBackend(ModelEnsemble(registry, student=student))
+
+    name = model or os.getenv("MODEL_VERSION") or os.getenv("MODEL_PATH", "pneumonia_detection_model.keras")
+    entry = registry.resolve(name)
+    if entry is None:
+        raise FileNotFoundError(f"Model {name} not found in registry. Train the model first.")
+    if kind in ("keras", "compiled"):
+        from model_loader import LazyModel
+        return KerasBackend(LazyModel(registry.artifact_path(entry), entry), entry, compiled=kind == "compiled")
+    if kind in ("tflite", "tflite_int8"):
+        path = registry.artifact_path(entry, kind)
+        if path is None:
+            raise FileNotFoundError(f"No {kind} variant registered for {entry['name']}")
+        return TFLiteBackend(path, entry, num_threads=num_threads)
+    raise ValueError(f"Unknown inference backend '{kind}'")
+
+
+# --- Engine ---
+
+class _Pending:
+    __slots__ = ("key", "array", "future", "note")
+
+    def __init__(self, key, array, future, note=None):
+        self.key = key
+        self.array = array
+        self.future = future
+        self.note = note
+
+
+class InferenceEngine:
+    def __init__(self, backend, threshold: float = DEFAULT_THRESHOLD, image_size: Optional[Tuple[int, int]] = None,
+                 cache_size: int = CACHE_SIZE, max_batch_size: int = MAX_BATCH_SIZE,
+                 batch_wait_ms: float = BATCH_WAIT_MS, decode_workers: int = DECODE_WORKERS, gate=None,
+                 drift=None, shm_decode: bool = SHM_DECODE):
+        self.backend = backend
+        # Optional InputGate run on decoded uploads before they reach the model
+        self.gate = gate
+        # Optional DriftMonitor fed with model inputs and outputs
+        self.drift = drift
+        self.threshold = threshold
+        # None follows the backend's largest input size (it can change when an ensemble reloads)
+        self._image_size = tuple(image_size) if image_size else None
+        self.cache_size = cache_size
+        self.max_batch_size = max(1, max_batch_size)
+        self.batch_wait = batch_wait_ms / 1000.0
+        self._cache: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._decode_pool = ThreadPoolExecutor(max_workers=max(1, decode_workers), thread_name_prefix="decode")
+        # Model execution is serialized on one thread; batching provides the parallelism
+        self._model_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model")
+        self._queue: Optional[asyncio.Queue] = None
+        self._batcher: Optional[asyncio.Task] = None
+        self.shm_decode = shm_decode
+        self.decode_workers = max(1, decode_workers)
+        if shm_decode:
+            from shm_decode_pool import shared_pool
+            # Start the workers now rather than on the first request; a new input size starts its own pool
+            shared_pool(self.image_size, self.max_batch_size, self.batch_wait, workers=self.decode_workers)
+        self.stats = {"requests": 0, "cache_hits": 0, "batches": 0, "batched_items": 0, "model_time_s": 0.0}
+
+    @property
+    def image_size(self) -> Tuple[int, int]:
+        """Size uploads are preprocessed at: the largest input any backend model needs."""
+        if self._image_size:
+            return self._image_size
+        sizes = getattr(self.backend, "input_sizes", None)
+        return max(sizes, key=lambda size: size[0] * size[1]) if sizes else IMG_SIZE
+
+    @property
+    def shm_pool(self):
+        """The shared-memory decode pool for the current input size (None when disabled)."""
+        if not self.shm_decode:
+            return None
+        from shm_decode_pool import shared_pool
+        return shared_pool(self.image_size, self.max_batch_size, self.batch_wait, workers=self.decode_workers)
+
+    # --- Input handling ---
+
+    def _prepare(self, item: EngineInput) -> Tuple[Optional[str], Optional[np.ndarray], Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Return (cache key, preprocessed array, cached result, gate note) for one input."""
+        if isinstance(item, (bytes, bytearray)):
+            item = ImageInput(bytes(item))
+        if isinstance(item, ImageInput):
+            key = (self.backend.cache_key, content_hash(item.data))
+            cached = self._cache_get(key)
+            if cached is not None:
+                return key, None, cached, None
+            image = decode_image(item.data, item.content_type, item.filename)
+            return (key, *self._check_image(image, item.data))
+        if isinstance(item, Image.Image):
+            return (None, *self._check_image(item, None))
+        if isinstance(item, np.ndarray):
+            arr = item.astype(np.float32) / 255.0 if item.dtype == np.uint8 else item.astype(np.float32, copy=False)
+            if arr.ndim == 2:
+                arr = arr[..., None]
+            if arr.ndim == 3 and arr.shape[-1] == 1:
+                arr = np.repeat(arr, 3, axis=-1)
+            expected = (self.image_size[1], self.image_size[0], 3)
+            if arr.shape != expected:
+                raise ImageDecodeError(f"Array input must have shape {expected}, got {item.shape}")
+            key = (self.backend.cache_key, content_hash(arr.tobytes()))
+            cached = self._cache_get(key)
+            if cached is not None:
+                return key, None, cached, None
+            return (key, *self._check_array(arr, None, None))
+        raise ImageDecodeError(f"Unsupported input type {type(item).__name__}")
+
+    def _check_image(self, image: Image.Image, data: Optional[bytes]) -> Tuple[np.ndarray, None, Optional[Dict[str, Any]]]:
+        """Preprocess a decoded image, run the input gate and record it for drift monitoring."""
+        return self._check_array(preprocess(image, self.image_size), image, data)
+
+    def _check_array(self, arr: np.ndarray, image: Optional[Image.Image],
+                     data: Optional[bytes]) -> Tuple[np.ndarray, None, Optional[Dict[str, Any]]]:
+        """Run the input gate on a preprocessed array and record it for drift monitoring."""
+        note = self.gate.check(image, arr) if self.gate else None
+        if self.drift:
+            self.drift.observe_image(data, image, arr)
+        return arr, None, note
+
+    def _cache_get(self, key) -> Optional[Dict[str, Any]]:
+        if not self.cache_size:
+            return None
+        with self._cache_lock:
+            result = self._cache.get(key)
+            if result is not None:
+                self._cache.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return dict(result)
+        return None
+
+    def _cache_put(self, key, result: Dict[str, Any]):
+        if not self.cache_size or key is None:
+            return
+        with self._cache_lock:
+            self._cache[key] = result
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+    # --- Model execution ---
+
+    @staticmethod
+    def _annotate(output: Dict[str, Any], key, note: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """Add the input's content hash (links a result to the upload) and the gate note."""
+        output = {**output, "content_hash": key[1]} if key is not None else output
+        return {**output, "input_check": note} if note else output
+
+    def _finalize(self, backend_result: Dict[str, Any]) -> Dict[str, Any]:
+        prob = backend_result.pop("probability")
+        label = "PNEUMONIA" if prob >= self.threshold else "NORMAL"
+        confidence = prob if label == "PNEUMONIA" else 1 - prob
+        result = {"prediction": label, "confidence": round(confidence, 4), "threshold_used": self.threshold}
+        result.update(backend_result)
+        if self.drift:
+            self.drift.observe_prediction(result)
+        return result
+
+    def _run_batch(self, arrays: List[np.ndarray]) -> List[Dict[str, Any]]:
+        """One model call per input shape, results in input order."""
+        groups: Dict[Tuple[int, ...], List[int]] = {}
+        for i, arr in enumerate(arrays):
+            groups.setdefault(arr.shape, []).append(i)
+        if len(groups) == 1:
+            return self._run_stacked(np.stack(arrays))
+        results: List[Any] = [None] * len(arrays)
+        for indices in groups.values():
+            for i, output in zip(indices, self._run_stacked(np.stack([arrays[i] for i in indices]))):
+                results[i] = output
+        return results
+
+    def _run_stacked(self, batch: np.ndarray, valid: Optional[List[bool]] = None) -> List[Optional[Dict[str, Any]]]:
+        """Run a ready NxHxWx3 batch; rows marked invalid (ring holes) get None."""
+        start = time.perf_counter()
+        raw = self.backend.predict_batch(batch)
+        self.stats["model_time_s"] += time.perf_counter() - start
+        self.stats["batches"] += 1
+        self.stats["batched_items"] += len(batch) if valid is None else sum(valid)
+        return [self._finalize(r) if valid is None or valid[i] else None for i, r in enumerate(raw)]
+
+    # --- Synchronous API ---
+
+    def predict(self, images: Sequence[EngineInput], return_exceptions: bool = False) -> List[Any]:
+        """Predict a list of inputs, batching model calls and using the cache."""
+        results: List[Any] = [None] * len(images)
+        todo: List[Tuple[int, Any, np.ndarray, Optional[Dict[str, Any]]]] = []
+        self.stats["requests"] += len(images)
+        for i, item in enumerate(images):
+            try:
+                key, arr, cached, note = self._prepare(item)
+            except ImageDecodeError as e:
+                if not return_exceptions:
+                    raise
+                results[i] = e
+                continue
+            if cached is not None:
+                results[i] = cached
+            else:
+                todo.append((i, key, arr, note))
+
+        for start in range(0, len(todo), self.max_batch_size):
+            chunk = todo[start:start + self.max_batch_size]
+            try:
+                outputs = self._run_batch([arr for _, _, arr, _ in chunk])
+            except Exception as e:
+                if not return_exceptions:
+                    raise
+                outputs = [e] * len(chunk)
+            for (i, key, _, note), output in zip(chunk, outputs):
+                if not isinstance(output, Exception):
+                    output = self._annotate(output, key, note)
+                    self._cache_put(key, dict(output))
+                results[i] = output
+        return results
+
+    def predict_iter(self, stream: Iterable[EngineInput], return_exceptions: bool = False) -> Iterator[Any]:
+        """Predict a (possibly unbounded) stream, yielding results in input order."""
+        chunk: List[EngineInput] = []
+        for item in stream:
+            chunk.append(item)
+            if len(chunk) >= self.max_batch_size:
+                yield from self.predict(chunk, return_exceptions=return_exceptions)
+                chunk = []
+        if chunk:
+            yield from self.predict(chunk, return_exceptions=return_exceptions)
+
+    # --- Asynchronous API (micro-batched across concurrent callers) ---
+
+    async def _ensure_batcher(self):
+        if self._batcher is None or self._batcher.done():
+            self._queue = asyncio.Queue()
+            self._batcher = asyncio.get_running_loop().create_task(self._batch_loop())
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                outputs = await loop.run_in_executor(self._model_pool, self._run_batch, [p.array for p in batch])
+            except Exception as e:
+                outputs = [e] * len(batch)
+            for pending, output in zip(batch, outputs):
+                if pending.future.done():
+                    continue
+                if isinstance(output, Exception):
+                    pending.future.set_exception(output)
+                else:
+                    output = self._annotate(output, pending.key, pending.note)
+                    self._cache_put(pending.key, dict(output))
+                    pending.future.set_result(output)
+
+    async def _run_ring_batch(self, batch: np.ndarray, entries: List[Optional[_Pending]]):
+        """Model call for a shared-memory ring slot; `batch` is a view the model reads in place."""
+        valid = [entry is not None for entry in entries]
+        try:
+            outputs = await asyncio.get_running_loop().run_in_executor(self._model_pool, self._run_stacked, batch, valid)
+        except Exception as e:
+            outputs = [e] * len(entries)
+        for pending, output in zip(entries, outputs):
+            if pending is None or pending.future.done():
+                continue
+            if isinstance(output, Exception):
+                pending.future.set_exception(output)
+            else:
+                output = self._annotate(output, pending.key, pending.note)
+                self._cache_put(pending.key, dict(output))
+                pending.future.set_result(output)
+
+    def _cache_lookup(self, item: ImageInput):
+        key = (self.backend.cache_key, content_hash(item.data))
+        return key, self._cache_get(key)
+
+    async def _apredict_shm(self, item: ImageInput) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        key, cached = await loop.run_in_executor(self._decode_pool, self._cache_lookup, item)
+        if cached is not None:
+            return cached
+        pool = self.shm_pool
+        batch, position = await pool.reserve(self._run_ring_batch)
+        size = await pool.decode(batch, position, item.data, item.content_type, item.filename)
+        try:
+            arr = pool.view(batch, position)
+            note = self.gate.check(size, arr) if self.gate else None
+            if self.drift:
+                self.drift.observe_image(item.data, size, arr)
+        except BaseException:
+            pool.resolve(batch, position, None)
+            raise
+        future = loop.create_future()
+        pool.resolve(batch, position, _Pending(key, None, future, note))
+        return await future
+
+    async def _apredict_one(self, item: EngineInput) -> Dict[str, Any]:
+        if self.shm_decode and isinstance(item, (bytes, bytearray, ImageInput)):
+            return await self._apredict_shm(item if isinstance(item, ImageInput) else ImageInput(bytes(item)))
+        loop = asyncio.get_running_loop()
+        key, arr, cached, note = await loop.run_in_executor(self._decode_pool, self._prepare, item)
+        if cached is not None:
+            return cached
+        await self._ensure_batcher()
+        future = loop.create_future()
+        await self._queue.put(_Pending(key, arr, future, note))
+        return await future
+
+    async def apredict(self, images: Sequence[EngineInput], return_exceptions: bool = False) -> List[Any]:
+        """Async predict; concurrent callers share model batches."""
+        self.stats["requests"] += len(images)
+        return await asyncio.gather(*(self._apredict_one(item) for item in images), return_exceptions=return_exceptions)
+
+    @staticmethod
+    async def _collect(task, return_exceptions: bool):
+        try:
+            return await task
+        except Exception as e:
+            if not return_exceptions:
+                raise
+            return e
+
+    async def apredict_iter(self, stream, return_exceptions: bool = False, max_in_flight: Optional[int] = None) -> AsyncIterator[Any]:
+        """Async stream predict (sync or async iterable), yielding results in order."""
+        max_in_flight = max_in_flight or self.max_batch_size * 2
+        in_flight: deque = deque()
+
+        async def items():
+            if hasattr(stream, "__aiter__"):
+                async for item in stream:
+                    yield item
+            else:
+                for item in stream:
+                    yield item
+
+        async for item in items():
+            self.stats["requests"] += 1
+            in_flight.append(asyncio.ensure_future(self._apredict_one(item)))
+            # Keep a bounded window in flight so concurrent items share batches
+            while in_flight and (len(in_flight) >= max_in_flight or in_flight[0].done()):
+                yield await self._collect(in_flight.popleft(), return_exceptions)
+        while in_flight:
+            yield await self._collect(in_flight.popleft(), return_exceptions)
+
+    # --- Introspection ---
+
+    def describe(self) -> Dict[str, Any]:
+        batches = self.stats["batches"]
+        return {
+            **self.backend.describe(),
+            "threshold": self.threshold,
+            "image_size": list(self.image_size),
+            "input_sizes": [list(size) for size in getattr(self.backend, "input_sizes", [])],
+            "max_batch_size": self.max_batch_size,
+            "batch_wait_ms": self.batch_wait * 1000,
+            "cache_entries": len(self._cache),
+            "input_gate": self.gate.describe() if self.gate else None,
+            "shm_decode": self.shm_pool.describe() if self.shm_decode else None,
+            "stats": {
+                **self.stats,
+                "avg_batch_size": self.stats["batched_items"] / batches if batches else 0.0,
+            },
+        }
+
+
+def create_engine(kind: Optional[str] = None, model: Optional[str] = None, model_dir: Optional[Path] = None,
+                  num_threads: Optional[int] = None, **kwargs) -> InferenceEngine:
+    """Backend + engine in one call; keyword arguments go to InferenceEngine."""
+    backend = create_backend(kind, model=model, model_dir=model_dir, num_threads=num_threads)
+    if isinstance(backend, MockBackend):
+        kwargs.setdefault("threshold", 0.5)
+    return InferenceEngine(backend, **kwargs)
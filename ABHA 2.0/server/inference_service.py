@@ -2,27 +2,45 @@
 
 Endpoints:
 POST /predict  - multipart/form-data with field 'file' (X-ray image). Returns JSON {prediction: 'PNEUMONIA'|'NORMAL', confidence: float}
+POST /predict/tensor - binary frames of pre-decoded tensors (see tensor_protocol.py)
 GET /health    - health check.
-
-Model: expects a Keras model file path via env MODEL_PATH (default: pneumonia_detection_model.keras)
-Image preprocessing matches training: resize to 150x150, scale 0-1.
+GET /metrics   - engine and input gate counters (including the gate rejection rate).
+GET /drift     - input/probability drift against the model's training reference profile.
+GET /debug/memory - memory snapshot for soak testing (only with DEBUG_MEMORY=1, see soak_test.py).
+GET /predictions - logged predictions by content hash, X-Record-Id or time range (see prediction_log.py).
+
+Model: expects a Keras model file path via env MODEL_PATH (default: pneumonia_detection_model.keras),
+resolved through the model registry in that file's directory. MODEL_VERSION may pin a registry
+version ID (or file name) instead. INFERENCE_BACKEND=tflite|tflite_int8 serves a registered variant.
+Decoding, preprocessing (resize to the model's input size, scale 0-1), batching and caching are done by
+inference_engine.InferenceEngine. Uploads that do not look like chest X-rays are rejected with
+422 by input_gate.InputGate before they reach the model (INPUT_GATE=reject|flag|off).
+
+Threads, batch size, batch window and (unless INFERENCE_BACKEND is set) the backend come
+from the model's entry in the autotune profile (autotune.py); a missing profile is tuned in
+the background (AUTOTUNE=auto|load|off), a stale one is re-tuned with POST /autotune. The profile only picks backends with
+the model's own outputs (keras, compiled, tflite); int8 has to be requested explicitly.
 """
 import os
-import io
-from typing import Tuple
-import numpy as np
-from fastapi import FastAPI, UploadFile, File, HTTPException
+import time
+from pathlib import Path
+from typing import Optional
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from PIL import Image
-try:
-    import fitz  # PyMuPDF
-    _HAS_PYMUPDF = True
-except Exception:
-    _HAS_PYMUPDF = False
-import tensorflow as tf
+from inference_engine import InferenceEngine, ImageInput, ImageDecodeError, create_engine
+from input_gate import InputGate, InputRejected
+from memory_probe import DEBUG_MEMORY, start_tracing, memory_snapshot
+from drift_monitor import DriftMonitor, DRIFT_MONITOR, load_profile
+from prediction_log import PredictionLog, PREDICTION_LOG
+from tensor_protocol import predict_tensor_request, TensorProtocolError, RESULT_MEDIA_TYPE
+from model_registry import ModelRegistry
+from autotune import ensure_profile, setting_for, apply_threads, engine_settings, apply_engine_settings
+from autotune import describe as describe_autotune, retune_in_background, AUTOTUNE_MODE
 
 MODEL_PATH = os.getenv("MODEL_PATH", "pneumonia_detection_model.keras")
-IMG_SIZE = (150, 150)
+MODEL_VERSION = os.getenv("MODEL_VERSION")
+# Unset: the autotuned backend, else keras
+BACKEND = os.getenv("INFERENCE_BACKEND")
 
 app = FastAPI(title="Pneumonia Detection Inference API", version="1.0.0")
 
@@ -34,107 +52,122 @@ app.add_middleware(
     ,allow_headers=["*"]
 )
 
-model = None
-
-def load_model():
-    global model
-    if model is None:
-        if not os.path.exists(MODEL_PATH):
-            raise FileNotFoundError(f"Model file not found at {MODEL_PATH}. Train the model first.")
-        model = tf.keras.models.load_model(MODEL_PATH)
-    return model
-
-def preprocess(image: Image.Image) -> np.ndarray:
-    image = image.convert("RGB")
-    image = image.resize(IMG_SIZE)
-    arr = np.array(image) / 255.0
-    arr = np.expand_dims(arr, axis=0)
-    return arr
+engine: Optional[InferenceEngine] = None
+registry: Optional[ModelRegistry] = None
+tuning_profile: Optional[dict] = None
+prediction_log = PredictionLog() if PREDICTION_LOG else None
+
+if DEBUG_MEMORY:
+    start_tracing()
+
+def _served_setting(profile: Optional[dict]) -> Optional[dict]:
+    entry = registry.resolve(MODEL_VERSION or MODEL_PATH) if registry else None
+    return setting_for(profile, entry["version_id"]) if entry else None
+
+def _apply_profile(profile: dict):
+    """A background re-tune finished: take over its batching (threads apply after a restart)."""
+    global tuning_profile
+    tuning_profile = profile
+    if engine is not None:
+        apply_engine_settings(engine, _served_setting(profile))
+
+def get_engine() -> InferenceEngine:
+    # Created on first use so the service can start before a model is trained
+    global engine, registry, tuning_profile
+    if engine is None:
+        model_dir = Path(MODEL_PATH).parent
+        tuning = None
+        if BACKEND != "mock":
+            registry = ModelRegistry(model_dir)
+            tuning_profile = ensure_profile(model_dir, registry, on_update=_apply_profile)
+            tuning = _served_setting(tuning_profile)
+            # Before the model (and with it TensorFlow) is loaded
+            apply_threads(tuning)
+        engine = create_engine(BACKEND or (tuning or {}).get("backend") or "keras", model=MODEL_VERSION or MODEL_PATH,
+                               model_dir=model_dir, num_threads=tuning["intra_op"] if tuning else None,
+                               gate=InputGate(), **engine_settings(tuning))
+        if DRIFT_MONITOR:
+            entry = getattr(engine.backend, "entry", None) or {}
+            profile = entry.get("reference_profile")
+            engine.drift = DriftMonitor(load_profile(Path(MODEL_PATH).parent / profile) if profile else None)
+    return engine
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
-def _load_image_from_pdf(data: bytes) -> Image.Image:
-    if not _HAS_PYMUPDF:
-        raise HTTPException(status_code=400, detail="PDF support requires PyMuPDF. Please install 'pymupdf'.")
-    try:
-        doc = fitz.open(stream=data, filetype="pdf")
-        if doc.page_count == 0:
-            raise HTTPException(status_code=400, detail="Empty PDF")
-        page = doc.load_page(0)
-        # Render first page at higher zoom for clarity
-        zoom = fitz.Matrix(2, 2)
-        pix = page.get_pixmap(matrix=zoom, alpha=False)
-        mode = "RGB" if pix.n < 4 else "RGBA"
-        img = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
-        return img.convert("RGB")
-    except HTTPException:
-        raise
-    except Exception:
-        raise HTTPException(status_code=400, detail="Failed to process PDF")
-
-
-def _read_upload_as_image(upload: UploadFile) -> Image.Image:
-    # Reads UploadFile and returns a PIL Image; supports PDF (first page) and common image formats
-    contents = upload.file.read() if upload.file else None
-    if contents is None:
-        contents = b""
-    # If empty (some servers), use await interface
-    if not contents:
-        # This function may be called from async path, keep a fallback
-        contents = upload.file.read() if upload.file else b""
-    ctype = (upload.content_type or "").lower()
-    name = (upload.filename or "").lower()
-    if ctype == "application/pdf" or name.endswith(".pdf"):
-        return _load_image_from_pdf(contents)
-    try:
-        img = Image.open(io.BytesIO(contents))
-        # For animated formats, select first frame
-        if getattr(img, "is_animated", False):
-            img.seek(0)
-        return img.convert("RGB")
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid or unsupported image file")
-
+@app.get("/metrics")
+def metrics():
+    if engine is None:
+        return {"engine": None}
+    described = engine.describe()
+    return {"engine": described["stats"], "input_gate": described["input_gate"],
+            "autotune": describe_autotune(tuning_profile, registry) if registry else None}
+
+@app.get("/drift")
+def drift_report():
+    if engine is None or engine.drift is None:
+        raise HTTPException(status_code=404, detail="Drift monitor not active")
+    return engine.drift.scores()
+
+@app.post("/autotune")
+def start_autotune():
+    """Re-tune the served model's threads, batching and backend in a background process."""
+    if AUTOTUNE_MODE == "off" or BACKEND == "mock":
+        raise HTTPException(status_code=404, detail="Autotune disabled (AUTOTUNE=off or mock backend)")
+    get_engine()
+    started = retune_in_background(Path(MODEL_PATH).parent, on_update=_apply_profile)
+    return {"started": started, **describe_autotune(tuning_profile, registry)}
+
+@app.get("/debug/memory")
+def debug_memory(top: int = 20):
+    """RSS, tracemalloc top allocators and TF allocator stats (DEBUG_MEMORY=1 only)."""
+    if not DEBUG_MEMORY:
+        raise HTTPException(status_code=404, detail="Set DEBUG_MEMORY=1 to enable memory debugging")
+    return memory_snapshot(top)
+
+@app.get("/predictions")
+def predictions(content_hash: str = None, record_id: str = None, since: float = None, until: float = None,
+                limit: int = 100):
+    if prediction_log is None:
+        raise HTTPException(status_code=404, detail="Prediction log disabled (PREDICTION_LOG=0)")
+    return {"predictions": prediction_log.query(content_hash, since, until, record_id, min(limit, 1000))}
+
+@app.on_event("shutdown")
+def close_prediction_log():
+    if prediction_log:
+        prediction_log.close()
 
 @app.post("/predict")
-async def predict(file: UploadFile = File(...)):
+async def predict(request: Request, file: UploadFile = File(...)):
+    started = time.perf_counter()
+    contents = await file.read()
     try:
-        contents = await file.read()
-        if (file.content_type or "").lower() == "application/pdf" or (file.filename or "").lower().endswith(".pdf"):
-            image = _load_image_from_pdf(contents)
-        else:
-            image = Image.open(io.BytesIO(contents))
-            if getattr(image, "is_animated", False):
-                image.seek(0)
-            image = image.convert("RGB")
-    except HTTPException:
-        raise
-    except Exception:
-        raise HTTPException(status_code=400, detail="Invalid image or PDF file")
-
-    model_loaded = load_model()
-    arr = preprocess(image)
-    preds = model_loaded.predict(arr)
-    prob = float(preds[0][0])  # sigmoid output
-    
-    # Use lower threshold (0.3) to catch more pneumonia cases and reduce false negatives
-    # This is especially important for bacterial infections that may have lower probability scores
-    threshold = 0.3
-    label = "PNEUMONIA" if prob >= threshold else "NORMAL"
-    confidence = prob if label == "PNEUMONIA" else 1 - prob
-    
+        result = (await get_engine().apredict([ImageInput(contents, file.content_type, file.filename)]))[0]
+    except InputRejected as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except ImageDecodeError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
     # Enhanced response with additional metadata
-    return {
-        "prediction": label, 
-        "confidence": round(confidence, 4),
-        "raw_probability": round(prob, 4),
-        "threshold_used": threshold,
+    result.update({
         "model_version": "Pneumonia Detection v2.1 (Enhanced Sensitivity)",
         "filename": file.filename or "unknown"
-    }
+    })
+    if prediction_log:
+        prediction_log.record(result, (time.perf_counter() - started) * 1000, endpoint="/predict",
+                              filename=file.filename, record_id=request.headers.get("X-Record-Id"))
+    return result
+
+@app.post("/predict/tensor")
+async def predict_tensor(request: Request, verbose: bool = False):
+    """Binary endpoint for pre-decoded N x H x W x {1,3} tensors at the engine's image_size (see tensor_protocol.py)."""
+    try:
+        payload = await predict_tensor_request(get_engine(), await request.body(), verbose)
+    except TensorProtocolError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=payload, media_type=RESULT_MEDIA_TYPE)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("inference_service:app", host="0.0.0.0", port=8001, reload=True)
\ No newline at end of file
+    uvicorn.run("inference_service:app", host="0.0.0.0", port=8001, reload=True)
@@ -0,0 +1,258 @@
+"""Cheap pre-inference validity gate for non-radiograph uploads.
+
+Photos, screenshots and scanned documents otherwise run through the CNNs and
+get a confident PNEUMONIA/NORMAL label. The gate runs on the decoded,
+preprocessed image before it is queued for the model and uses a handful of
+vectorized statistics (tens of microseconds on a 150x150 image):
+
+    colorfulness   mean spread between RGB channels (chest X-rays are gray)
+    aspect_ratio   log width/height of the original upload
+    mean / std     luminance level and contrast
+    peak_bin       largest 16-bin histogram share (flat backgrounds, documents)
+    entropy        normalized histogram entropy
+    dark / bright  share of near-black and near-white pixels
+    edge_density   mean absolute horizontal gradient (text and UI edges)
+
+Fixed rules catch the obvious cases. An optional logistic-regression
+classifier on the same features (input_gate_model.json) catches the rest.
+
+Configuration (environment):
+    INPUT_GATE        reject (default) | flag | off
+    INPUT_GATE_MODEL  Path of the trained classifier (default input_gate_model.json)
+
+Train the classifier from the chest X-ray dataset plus a folder of non-X-ray images:
+    python input_gate.py --data ./chest_xray --negatives ./not_xray
+    python input_gate.py --bench        # time the gate on random inputs
+"""
+import os
+import json
+import time
+import math
+import argparse
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+from inference_engine import ImageDecodeError, IMG_SIZE, preprocess
+
+BASE_DIR = Path(__file__).parent
+GATE_MODE = os.getenv("INPUT_GATE", "reject").lower()
+GATE_MODEL_PATH = Path(os.getenv("INPUT_GATE_MODEL", str(BASE_DIR / "input_gate_model.json")))
+
+FEATURES = ("colorfulness", "aspect_ratio", "mean", "std", "peak_bin", "entropy", "dark", "bright", "edge_density")
+HIST_BINS = 16
+
+# (feature, comparison, limit, reason); deliberately loose so real radiographs pass
+RULES = (
+    ("colorfulness", ">", 0.08, "color_image"),
+    ("aspect_ratio", ">", math.log(2.0), "aspect_ratio"),
+    ("aspect_ratio", "<", math.log(0.5), "aspect_ratio"),
+    ("std", "<", 0.04, "blank_image"),
+    ("peak_bin", ">", 0.6, "flat_histogram"),
+    ("bright", ">", 0.6, "document_like"),
+)
+
+
+class InputRejected(ImageDecodeError):
+    """The upload does not look like a chest radiograph (services map this to HTTP 422)."""
+
+    def __init__(self, reasons: List[str]):
+        super().__init__(f"Input does not look like a chest X-ray ({', '.join(reasons)})")
+        self.reasons = reasons
+
+
+def image_features(arr: np.ndarray, aspect: float = 1.0) -> np.ndarray:
+    """Feature vector (FEATURES order) for a preprocessed HxWx3 array in 0-1."""
+    small = arr[::2, ::2]
+    colorfulness = float(np.mean(small.max(axis=-1) - small.min(axis=-1)))
+    lum = small.mean(axis=-1)
+    hist = np.bincount(np.minimum((lum * HIST_BINS).astype(np.intp), HIST_BINS - 1).ravel(),
+                       minlength=HIST_BINS) / lum.size
+    nonzero = hist[hist > 0]
+    entropy = float(-(nonzero * np.log(nonzero)).sum() / math.log(HIST_BINS))
+    return np.array([
+        colorfulness,
+        math.log(max(aspect, 1e-6)),
+        float(lum.mean()),
+        float(lum.std()),
+        float(hist.max()),
+        entropy,
+        float(np.mean(lum < 0.05)),
+        float(np.mean(lum > 0.95)),
+        float(np.mean(np.abs(np.diff(lum, axis=1)))),
+    ], dtype=np.float32)
+
+
+class InputGate:
+    def __init__(self, mode: str = GATE_MODE, model_path: Optional[Path] = GATE_MODEL_PATH):
+        if mode not in ("reject", "flag", "off"):
+            raise ValueError(f"Unknown input gate mode '{mode}'")
+        self.mode = mode
+        self.classifier: Optional[Dict[str, Any]] = None
+        if model_path and Path(model_path).exists():
+            with open(model_path, "r", encoding="utf-8") as f:
+                self.classifier = json.load(f)
+            for key in ("mean", "std", "weights"):
+                self.classifier[key] = np.asarray(self.classifier[key], dtype=np.float32)
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {"checked": 0, "rejected": 0, "flagged": 0, "check_time_s": 0.0, "reasons": {}}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def xray_probability(self, features: np.ndarray) -> Optional[float]:
+        if self.classifier is None:
+            return None
+        z = (features - self.classifier["mean"]) / self.classifier["std"]
+        logit = float(z @ self.classifier["weights"] + self.classifier["bias"])
+        return 1.0 / (1.0 + math.exp(-max(min(logit, 50.0), -50.0)))
+
+    def evaluate(self, arr: np.ndarray, aspect: float = 1.0) -> Tuple[List[str], Optional[float]]:
+        """Reasons the input looks invalid (empty if it passes) and the classifier score."""
+        features = image_features(arr, aspect)
+        values = dict(zip(FEATURES, features))
+        reasons = []
+        for name, op, limit, reason in RULES:
+            if (values[name] > limit if op == ">" else values[name] < limit) and reason not in reasons:
+                reasons.append(reason)
+        score = self.xray_probability(features)
+        if score is not None and score < self.classifier.get("threshold", 0.5):
+            reasons.append("classifier")
+        return reasons, score
+
+    def check(self, image: Optional[Image.Image], arr: np.ndarray) -> Optional[Dict[str, Any]]:
+        """Raise InputRejected in reject mode; return a note for the response in flag mode."""
+        if not self.enabled:
+            return None
+        start = time.perf_counter()
+        aspect = image.width / image.height if image is not None and image.height else 1.0
+        reasons, score = self.evaluate(arr, aspect)
+        with self._lock:
+            self.stats["checked"] += 1
+            self.stats["check_time_s"] += time.perf_counter() - start
+            if reasons:
+                self.stats["rejected" if self.mode == "reject" else "flagged"] += 1
+                for reason in reasons:
+                    self.stats["reasons"][reason] = self.stats["reasons"].get(reason, 0) + 1
+        if not reasons:
+            return None
+        if self.mode == "reject":
+            raise InputRejected(reasons)
+        return {"valid": False, "reasons": reasons, "xray_score": None if score is None else round(score, 4)}
+
+    def describe(self) -> Dict[str, Any]:
+        with self._lock:
+            checked = self.stats["checked"]
+            return {
+                "mode": self.mode,
+                "classifier": self.classifier is not None,
+                **self.stats,
+                "reasons": dict(self.stats["reasons"]),
+                "rejection_rate": (self.stats["rejected"] + self.stats["flagged"]) / checked if checked else 0.0,
+                "avg_check_us": self.stats["check_time_s"] / checked * 1e6 if checked else 0.0,
+            }
+
+
+# --- Classifier training (offline) ---
+
+def _iter_image_files(directory: str) -> List[Path]:
+    exts = {".png", ".jpg", ".jpeg", ".bmp", ".gif", ".webp", ".tif", ".tiff"}
+    return sorted(p for p in Path(directory).rglob("*") if p.suffix.lower() in exts)
+
+
+def _features_for_files(paths: List[Path], size: Tuple[int, int]) -> List[np.ndarray]:
+    rows = []
+    for path in paths:
+        try:
+            with Image.open(path) as img:
+                image = img.convert("RGB")
+        except Exception:
+            continue
+        rows.append(image_features(preprocess(image, size), image.width / image.height))
+    return rows
+
+
+def synthetic_negatives(count: int, seed: int = 1337) -> List[np.ndarray]:
+    """Blank, document-like, tinted and noise images for when few real negatives exist."""
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i in range(count):
+        kind = i % 4
+        if kind == 0:
+            arr = np.full((150, 150, 3), rng.uniform(0, 1), dtype=np.float32) + rng.normal(0, 0.01, (150, 150, 3)).astype(np.float32)
+        elif kind == 1:
+            arr = np.ones((150, 150, 3), dtype=np.float32)
+            for row in rng.choice(150, size=40, replace=False):
+                arr[row, 10:rng.integers(40, 140)] = 0.1
+        elif kind == 2:
+            arr = rng.uniform(0, 1, (150, 150, 3)).astype(np.float32) * rng.uniform(0.3, 1.0, 3).astype(np.float32)
+        else:
+            arr = rng.uniform(0, 1, (15, 15, 3)).astype(np.float32).repeat(10, 0).repeat(10, 1)
+        rows.append(image_features(np.clip(arr, 0, 1), float(rng.uniform(0.4, 2.5))))
+    return rows
+
+
+def train_classifier(x: np.ndarray, y: np.ndarray, epochs: int = 500, lr: float = 0.5) -> Dict[str, Any]:
+    """Logistic regression by full-batch gradient descent on standardized features."""
+    mean, std = x.mean(axis=0), x.std(axis=0) + 1e-6
+    z = (x - mean) / std
+    weights, bias = np.zeros(z.shape[1]), 0.0
+    for _ in range(epochs):
+        p = 1.0 / (1.0 + np.exp(-(z @ weights + bias)))
+        weights -= lr * (z.T @ (p - y) / len(y) + 1e-3 * weights)
+        bias -= lr * float(np.mean(p - y))
+    return {"features": list(FEATURES), "mean": mean.tolist(), "std": std.tolist(),
+            "weights": weights.tolist(), "bias": bias, "threshold": 0.5}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or benchmark the input validity gate")
+    parser.add_argument('-d', '--data', default=os.getenv('DATA_DIR', None), help='Base data directory containing train/ and val/')
+    parser.add_argument('--negatives', default=None, help='Directory of non-X-ray images (photos, screenshots, documents)')
+    parser.add_argument('--max-per-class', type=int, default=2000)
+    parser.add_argument('-o', '--output', default=str(GATE_MODEL_PATH))
+    parser.add_argument('--bench', action='store_true', help='Only time the gate on random inputs')
+    args = parser.parse_args()
+
+    if args.bench:
+        gate = InputGate(mode="flag")
+        arr = np.random.default_rng(0).uniform(0, 1, (150, 150, 3)).astype(np.float32)
+        for _ in range(1000):
+            gate.check(None, arr)
+        print(f"Average gate check: {gate.describe()['avg_check_us']:.1f} µs")
+        return
+
+    from train_model import resolve_data_dir
+    base_dir = resolve_data_dir(args.data)
+    splits = {}
+    for split in ("train", "val"):
+        files = _iter_image_files(os.path.join(base_dir, split))
+        rng = np.random.default_rng(0)
+        if len(files) > args.max_per_class:
+            files = [files[i] for i in rng.choice(len(files), args.max_per_class, replace=False)]
+        splits[split] = _features_for_files(files, IMG_SIZE)
+        print(f"{split}: {len(splits[split])} X-ray images")
+
+    negatives = _features_for_files(_iter_image_files(args.negatives), IMG_SIZE) if args.negatives else []
+    print(f"Real negatives: {len(negatives)}")
+    negatives += synthetic_negatives(max(len(splits["train"]) - len(negatives), 200))
+
+    x = np.stack(splits["train"] + negatives)
+    y = np.concatenate([np.ones(len(splits["train"])), np.zeros(len(negatives))])
+    model = train_classifier(x, y)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(model, f, indent=2)
+    print(f"Saved gate classifier to {args.output}")
+
+    # Real radiographs that would be rejected on the validation split
+    gate = InputGate(mode="flag", model_path=Path(args.output))
+    val = np.stack(splits["val"]) if splits["val"] else np.zeros((0, len(FEATURES)))
+    false_rejects = sum(1 for row in val if gate.xray_probability(row) < model["threshold"])
+    if len(val):
+        print(f"Validation X-rays rejected by the classifier: {false_rejects}/{len(val)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""Durable local job queue for asynchronous predictions (POST /jobs).
+
+Large PDFs and multi-image studies do not have to finish inside one HTTP
+request: the upload is written to a SQLite database and acknowledged with a
+job ID, and a background `JobWorker` in the service claims queued jobs in
+batches and runs them through the inference engine. No external broker is
+needed and queued jobs survive a restart.
+
+Delivery guarantees:
+- A job is claimed under a lease (owner + expiry) inside an IMMEDIATE
+  transaction, so two workers never hold the same job.
+- The worker renews the lease while it runs; if the process dies, the lease
+  expires and the job is claimed again after a restart. A job whose lease
+  expires on its last attempt is marked failed rather than re-leased.
+- Results are committed by a single conditional UPDATE that only succeeds for
+  the current lease owner, so each job's result is recorded exactly once.
+  Inference is deterministic, so a job that is re-run after a crash produces
+  the same result.
+
+A claim only leases job rows; each job's inputs are read from the database
+chunk by chunk (at most the scheduler's batch limit) as the job gets slots,
+so a claimed batch does not hold every blob in memory at once. The worker deletes finished jobs older than
+JOB_RETENTION_S about once an hour.
+
+Configuration (environment):
+    JOB_DB            SQLite file (default jobs.sqlite3 next to this module)
+    JOB_BATCH_SIZE    Jobs claimed per worker round (default 8)
+    JOB_LEASE_S       Lease length in seconds (default 60)
+    JOB_MAX_ATTEMPTS  Attempts before a job is marked failed (default 3)
+    JOB_POLL_S        Idle poll interval in seconds (default 0.5)
+    JOB_RETENTION_S   Keep finished jobs this long, 0 = forever (default 604800, 7 days)
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import asyncio
+import threading
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from inference_engine import ImageInput
+from request_scheduler import QueueFull
+
+BASE_DIR = Path(__file__).parent
+JOB_DB = Path(os.getenv("JOB_DB", str(BASE_DIR / "jobs.sqlite3")))
+JOB_BATCH_SIZE = int(os.getenv("JOB_BATCH_SIZE", "8"))
+JOB_LEASE_S = float(os.getenv("JOB_LEASE_S", "60"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_POLL_S = float(os.getenv("JOB_POLL_S", "0.5"))
+JOB_RETENTION_S = float(os.getenv("JOB_RETENTION_S", str(7 * 24 * 3600)))
+PURGE_INTERVAL_S = 3600.0
+
+TERMINAL = ("done", "failed")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    n_items INTEGER NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    client TEXT,
+    meta TEXT,
+    results TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    content_type TEXT,
+    filename TEXT,
+    data BLOB NOT NULL,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+
+class JobQueue:
+    def __init__(self, path: Path = JOB_DB, lease_s: float = JOB_LEASE_S, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.path = Path(path)
+        self.lease_s = lease_s
+        self.max_attempts = max_attempts
+        # One connection shared by the event loop and worker threads, serialized by a lock
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(_SCHEMA)
+
+    def _transaction(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def submit(self, items: List[ImageInput], client: Optional[str] = None,
+               meta: Optional[Dict[str, Any]] = None) -> str:
+        """Persist a job and its inputs; returns the job ID."""
+        if not items:
+            raise ValueError("A job needs at least one file")
+        job_id = uuid.uuid4().hex
+        now = time.time()
+
+        def insert(conn):
+            conn.execute("INSERT INTO jobs (id, status, created_at, updated_at, n_items, client, meta) "
+                         "VALUES (?, 'queued', ?, ?, ?, ?, ?)",
+                         (job_id, now, now, len(items), client, json.dumps(meta or {})))
+            conn.executemany("INSERT INTO job_items (job_id, idx, content_type, filename, data) VALUES (?, ?, ?, ?, ?)",
+                             [(job_id, i, item.content_type, item.filename, sqlite3.Binary(item.data))
+                              for i, item in enumerate(items)])
+        self._transaction(insert)
+        return job_id
+
+    def claim(self, owner: str, limit: int = JOB_BATCH_SIZE) -> List[Dict[str, Any]]:
+        """Lease up to `limit` queued (or lease-expired) jobs, oldest first (inputs via `items`).
+
+        A lease that expired on its last attempt (e.g. the input crashed the
+        worker process every time) marks the job failed instead of re-leasing it.
+        """
+        now = time.time()
+
+        def lease(conn):
+            exhausted = [row["id"] for row in conn.execute(
+                "SELECT id FROM jobs WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                (now, self.max_attempts)).fetchall()]
+            for job_id in exhausted:
+                conn.execute("UPDATE jobs SET status = 'failed', error = ?, lease_owner = NULL, lease_expires = NULL, "
+                             "updated_at = ? WHERE id = ?",
+                             (f"Lease expired on attempt {self.max_attempts}; worker lost", now, job_id))
+                conn.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' "
+                "OR (status = 'running' AND lease_expires < ? AND attempts < ?) "
+                "ORDER BY created_at LIMIT ?", (now, self.max_attempts, limit)).fetchall()
+            jobs = []
+            for row in rows:
+                conn.execute("UPDATE jobs SET status = 'running', lease_owner = ?, lease_expires = ?, "
+                             "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                             (owner, now + self.lease_s, now, row["id"]))
+                jobs.append(dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (row["id"],)).fetchone()))
+            return jobs
+        return self._transaction(lease)
+
+    def items(self, job_id: str, start: int = 0, count: int = -1) -> List[ImageInput]:
+        """A job's inputs (or `count` of them from `start`), in submission order."""
+        with self._lock:
+            rows = self._conn.execute("SELECT content_type, filename, data FROM job_items WHERE job_id = ? "
+                                      "ORDER BY idx LIMIT ? OFFSET ?", (job_id, count, start)).fetchall()
+        return [ImageInput(bytes(row["data"]), row["content_type"], row["filename"]) for row in rows]
+
+    def renew(self, job_ids: List[str], owner: str):
+        """Extend the lease of jobs this owner is still working on."""
+        expires = time.time() + self.lease_s
+        self._transaction(lambda conn: conn.executemany(
+            "UPDATE jobs SET lease_expires = ? WHERE id = ? AND lease_owner = ? AND status = 'running'",
+            [(expires, job_id, owner) for job_id in job_ids]))
+
+    def complete(self, job_id: str, owner: str, results: List[Any]) -> bool:
+        """Record results once; False if the lease was lost to another worker."""
+        def commit(conn):
+            updated = conn.execute(
+                "UPDATE jobs SET status = 'done', results = ?, error = NULL, lease_owner = NULL, updated_at = ? "
+                "WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (json.dumps(results), time.time(), job_id, owner)).rowcount
+            if updated:
+                # Inputs are no longer needed once the result is durable
+                conn.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+            return bool(updated)
+        return self._transaction(commit)
+
+    def fail(self, job_id: str, owner: str, error: str) -> bool:
+        """Requeue after an error, or mark failed once max_attempts is reached."""
+        def record(conn):
+            row = conn.execute("SELECT attempts FROM jobs WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                               (job_id, owner)).fetchone()
+            if row is None:
+                return False
+            status = "failed" if row["attempts"] >= self.max_attempts else "queued"
+            conn.execute("UPDATE jobs SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, "
+                         "updated_at = ? WHERE id = ?", (status, error, time.time(), job_id))
+            if status == "failed":
+                conn.execute("DELETE FROM job_items WHERE job_id = ?", (job_id,))
+            return True
+        return self._transaction(record)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Public view of a job (no inputs)."""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "job_id": row["id"],
+            "status": row["status"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+            "n_items": row["n_items"],
+            "attempts": row["attempts"],
+            "meta": json.loads(row["meta"] or "{}"),
+            "results": json.loads(row["results"]) if row["results"] else None,
+            "error": row["error"],
+        }
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    def purge(self, older_than_s: float) -> int:
+        """Delete finished jobs older than the given age."""
+        cutoff = time.time() - older_than_s
+        return self._transaction(lambda conn: conn.execute(
+            "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,)).rowcount)
+
+
+def _serializable(result: Any) -> Dict[str, Any]:
+    if isinstance(result, Exception):
+        return {"error": str(result), "error_type": type(result).__name__}
+    return result
+
+
+class JobWorker:
+    """Background task that drains the queue through an inference engine."""
+
+    def __init__(self, queue: JobQueue, engine_provider: Callable[[], Any],
+                 batch_size: int = JOB_BATCH_SIZE, poll_s: float = JOB_POLL_S, scheduler=None,
+                 on_results: Optional[Callable[[Dict[str, Any], List[Any]], None]] = None,
+                 retention_s: float = JOB_RETENTION_S):
+        self.queue = queue
+        # Optional request_scheduler.FairScheduler; jobs run in its batch class
+        self.scheduler = scheduler
+        # Optional hook called with (job, results) once a job's results are committed
+        self.on_results = on_results
+        self.engine_provider = engine_provider
+        self.batch_size = batch_size
+        self.poll_s = poll_s
+        self.retention_s = retention_s
+        self._next_purge = 0.0
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {"jobs_done": 0, "jobs_failed": 0, "lease_lost": 0, "jobs_purged": 0}
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._purge_expired()
+            try:
+                jobs = await loop.run_in_executor(None, self.queue.claim, self.owner, self.batch_size)
+            except Exception as e:
+                print(f"❌ Job queue claim failed: {e}")
+                jobs = []
+            if not jobs:
+                await asyncio.sleep(self.poll_s)
+                continue
+            # All claimed jobs go to the engine together so their images share batches
+            keepalive = loop.create_task(self._renew_leases([job["id"] for job in jobs]))
+            try:
+                await asyncio.gather(*(self._process(job) for job in jobs))
+            finally:
+                keepalive.cancel()
+
+    async def _renew_leases(self, job_ids: List[str]):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.queue.lease_s / 3)
+            await loop.run_in_executor(None, self.queue.renew, job_ids, self.owner)
+
+    async def _purge_expired(self):
+        """Delete finished jobs past the retention period, at most once per PURGE_INTERVAL_S."""
+        if not self.retention_s or time.monotonic() < self._next_purge:
+            return
+        self._next_purge = time.monotonic() + PURGE_INTERVAL_S
+        try:
+            purged = await asyncio.get_running_loop().run_in_executor(None, self.queue.purge, self.retention_s)
+        except Exception as e:
+            print(f"❌ Job purge failed: {e}")
+            return
+        self.stats["jobs_purged"] += purged
+        if purged:
+            print(f"🧹 Purged {purged} finished jobs older than {self.retention_s:.0f}s")
+
+    async def _predict(self, job: Dict[str, Any]) -> List[Any]:
+        """Predict a job in chunks of at most the batch class limit, loading each chunk once it may run."""
+        loop = asyncio.get_running_loop()
+        if self.scheduler is None:
+            items = await loop.run_in_executor(None, self.queue.items, job["id"])
+            return await self.engine_provider().apredict(items, return_exceptions=True)
+        size, results = self.scheduler.max_cost("batch"), []
+        for start in range(0, job["n_items"], size):
+            count = min(size, job["n_items"] - start)
+            while True:
+                try:
+                    async with self.scheduler.slot("batch", job.get("client") or "jobs", cost=count):
+                        items = await loop.run_in_executor(None, self.queue.items, job["id"], start, count)
+                        results.extend(await self.engine_provider().apredict(items, return_exceptions=True))
+                    break
+                except QueueFull:
+                    # Batch queue full of synchronous batch requests; the job can wait
+                    await asyncio.sleep(self.poll_s)
+        return results
+
+    async def _process(self, job: Dict[str, Any]):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await self._predict(job)
+            committed = await loop.run_in_executor(
+                None, self.queue.complete, job["id"], self.owner, [_serializable(r) for r in results])
+        except Exception as e:
+            print(f"❌ Job {job['id']} failed: {e}")
+            self.stats["jobs_failed"] += 1
+            await loop.run_in_executor(None, self.queue.fail, job["id"], self.owner, str(e))
+            return
+        self.stats["jobs_done" if committed else "lease_lost"] += 1
+        # The result is durable; a failing hook must not requeue or fail the job
+        if committed and self.on_results is not None:
+            try:
+                self.on_results(job, results)
+            except Exception as e:
+                print(f"❌ Result hook for job {job['id']} failed: {e}")
+
+
+async def job_events(queue: JobQueue, job_id: str, poll_s: float = JOB_POLL_S) -> AsyncIterator[str]:
+    """Server-sent events for a job: one `status` event per change, ending at done/failed."""
+    loop = asyncio.get_running_loop()
+    last = None
+    while True:
+        job = await loop.run_in_executor(None, queue.get, job_id)
+        if job is None:
+            yield "event: error\ndata: {\"detail\": \"Job not found\"}\n\n"
+            return
+        if job["status"] != last:
+            last = job["status"]
+            yield f"event: status\ndata: {json.dumps(job)}\n\n"
+        if job["status"] in TERMINAL:
+            return
+        await asyncio.sleep(poll_s)
@@ -0,0 +1,285 @@
+"""Per-layer cost profile of Keras models: time, memory, FLOPs and parameters.
+
+For each model and batch size, every layer is run on its real input (captured
+from one forward pass) as its own traced tf.function, so the timings contain
+no Python dispatch overhead. Reported per layer:
+
+    wall_ms       median wall time per batch
+    cpu_ms        process CPU time per batch (> wall_ms when TF uses several threads)
+    flops         analytic FLOPs per image (multiply-add = 2) for the layer types used here
+    params        trainable + non-trainable parameters
+    weight_bytes  size of the layer's weights
+    output_bytes  activation memory of the layer's output at that batch size
+
+The hotspot table ranks layers by wall time at the largest batch size and
+shows the achieved GFLOP/s, which separates layers that are expensive because
+they do a lot of work (large convolutions) from ones that are memory bound
+(pooling, batch norm, the Flatten->Dense head). The sum of the layer times is
+compared with one end-to-end forward pass to show the graph overhead.
+
+Usage:
+    python layer_profiler.py                            # all registered models
+    python layer_profiler.py --models pneumonia_detection_model.keras
+    python layer_profiler.py --arch baseline gap separable mobilenet improved
+    python layer_profiler.py --batch-sizes 1 8 32 --repeats 20 --top 15 --output layer_profile.json
+
+Arguments:
+    --model-dir     Registry directory (default: this directory)
+    --models        Registered model names or version IDs (default: all active)
+    --arch          Profile untrained train_model.build_model architectures instead
+    --img-size      Input size for --arch (default 150 150)
+    --batch-sizes   Batch sizes to profile (default 1 8 32)
+    --repeats       Timed runs per layer and batch size (default 10)
+    --top           Rows in each hotspot table (default 15)
+    --output        JSON report path (default layer_profile.json)
+    --device        TensorFlow device (default /CPU:0)
+"""
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import tensorflow as tf
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# Layers that only reshape or are disabled at inference time
+_FREE_LAYERS = ("InputLayer", "Dropout", "SpatialDropout2D", "GaussianNoise", "Flatten", "Reshape")
+
+
+def _numel(shape: Sequence[int]) -> int:
+    return int(np.prod([d for d in shape if d is not None], dtype=np.int64))
+
+
+def _activation_flops(layer, out_shape: Sequence[int]) -> int:
+    activation = getattr(layer, "activation", None)
+    name = getattr(activation, "__name__", "linear")
+    return 0 if activation is None or name == "linear" else _numel(out_shape)
+
+
+def layer_flops(layer, in_shape: Sequence[int], out_shape: Sequence[int]) -> Optional[int]:
+    """Inference FLOPs per image for one layer, from per-image input/output shapes (None if unknown)."""
+    kind = type(layer).__name__
+    out_n = _numel(out_shape)
+    if kind in _FREE_LAYERS:
+        return 0
+    if kind == "DepthwiseConv2D":
+        kh, kw = layer.kernel_size
+        return 2 * kh * kw * out_n + (out_n if layer.use_bias else 0) + _activation_flops(layer, out_shape)
+    if kind == "SeparableConv2D":
+        kh, kw = layer.kernel_size
+        h, w = out_shape[0], out_shape[1]
+        mid = in_shape[-1] * layer.depth_multiplier
+        depthwise = 2 * kh * kw * h * w * mid
+        pointwise = 2 * mid * out_shape[-1] * h * w
+        return depthwise + pointwise + (out_n if layer.use_bias else 0) + _activation_flops(layer, out_shape)
+    if kind == "Conv2D":
+        kh, kw = layer.kernel_size
+        groups = getattr(layer, "groups", 1) or 1
+        macs = kh * kw * (in_shape[-1] // groups) * out_n
+        return 2 * macs + (out_n if layer.use_bias else 0) + _activation_flops(layer, out_shape)
+    if kind == "Dense":
+        macs = _numel(in_shape) * layer.units
+        return 2 * macs + (out_n if layer.use_bias else 0) + _activation_flops(layer, out_shape)
+    if kind == "BatchNormalization":
+        # Folded to one multiply and one add per element at inference time
+        return 2 * out_n
+    if kind in ("ReLU", "Activation", "LeakyReLU", "ELU", "Softmax", "PReLU"):
+        return out_n
+    if kind in ("MaxPooling2D", "AveragePooling2D"):
+        ph, pw = layer.pool_size
+        return ph * pw * out_n
+    if kind in ("GlobalAveragePooling2D", "GlobalMaxPooling2D"):
+        return _numel(in_shape)
+    if kind in ("Add", "Multiply", "Subtract", "Average", "Maximum", "Minimum"):
+        return out_n
+    if kind in ("Rescaling", "Normalization"):
+        return out_n
+    if kind in ("Concatenate", "ZeroPadding2D", "Cropping2D"):
+        return 0
+    return None
+
+
+def _weight_bytes(layer) -> int:
+    return int(sum(_numel(w.shape) * tf.as_dtype(w.dtype).size for w in layer.weights))
+
+
+def _compute_layers(model) -> List[Any]:
+    return [layer for layer in model.layers if type(layer).__name__ != "InputLayer"]
+
+
+def _layer_inputs(model, x: tf.Tensor) -> List[Any]:
+    """The actual input tensor(s) of every layer for input batch x."""
+    layers = _compute_layers(model)
+    if isinstance(model, tf.keras.Sequential):
+        inputs = []
+        for layer in layers:
+            inputs.append(x)
+            x = layer(x, training=False)
+        return inputs
+    # Functional graphs (branches, residuals): read each layer's input from one pass
+    extractor = tf.keras.Model(model.inputs, [layer.input for layer in layers])
+    outputs = extractor(x, training=False)
+    return outputs if isinstance(outputs, (list, tuple)) else [outputs]
+
+
+def _shape(tensor) -> List[int]:
+    if isinstance(tensor, (list, tuple)):
+        return _shape(tensor[0])
+    return [int(d) for d in tensor.shape[1:]]
+
+
+def _time_call(fn, arg, repeats: int, warmup: int = 2) -> Tuple[float, float, Any]:
+    """Median wall ms and mean CPU ms per call."""
+    out = None
+    for _ in range(warmup):
+        out = fn(arg)
+    walls = []
+    cpu_start = time.process_time()
+    for _ in range(repeats):
+        start = time.perf_counter()
+        out = fn(arg)
+        # Force completion (a no-op copy on CPU is cheap relative to the layer)
+        _ = (out[0] if isinstance(out, (list, tuple)) else out).numpy().ravel()[:1]
+        walls.append((time.perf_counter() - start) * 1000)
+    cpu_ms = (time.process_time() - cpu_start) * 1000 / repeats
+    return float(np.median(walls)), cpu_ms, out
+
+
+def model_input_size(model) -> Tuple[int, int]:
+    shape = model.inputs[0].shape
+    return int(shape[2]), int(shape[1])
+
+
+def profile_model(model, img_size: Optional[Tuple[int, int]] = None, batch_sizes: Sequence[int] = (1, 8, 32),
+                  repeats: int = 10, device: str = "/CPU:0") -> Dict[str, Any]:
+    """Per-layer time, memory and FLOPs of `model` at each batch size."""
+    w, h = img_size or model_input_size(model)
+    layers = _compute_layers(model)
+    report: Dict[str, Any] = {
+        "model": model.name,
+        "input_size": [w, h],
+        "device": device,
+        "params": int(model.count_params()),
+        "batch_sizes": list(batch_sizes),
+        "layers": [],
+        "totals": {},
+    }
+    rows = [{"name": layer.name, "type": type(layer).__name__, "params": int(layer.count_params()),
+             "weight_bytes": _weight_bytes(layer), "timing": {}} for layer in layers]
+
+    with tf.device(device):
+        forward = tf.function(lambda t: model(t, training=False))
+        for bs in batch_sizes:
+            x = tf.random.uniform((bs, h, w, 3))
+            inputs = _layer_inputs(model, x)
+            for row, layer, layer_input in zip(rows, layers, inputs):
+                fn = tf.function(lambda t, layer=layer: layer(t, training=False))
+                wall_ms, cpu_ms, out = _time_call(fn, layer_input, repeats)
+                if "flops" not in row:
+                    row["input_shape"] = _shape(layer_input)
+                    row["output_shape"] = _shape(out)
+                    row["flops"] = layer_flops(layer, row["input_shape"], row["output_shape"])
+                row["timing"][str(bs)] = {
+                    "wall_ms": round(wall_ms, 4),
+                    "cpu_ms": round(cpu_ms, 4),
+                    "output_bytes": _numel(row["output_shape"]) * bs * out.dtype.size,
+                }
+            model_ms, model_cpu_ms, _ = _time_call(forward, x, repeats)
+            layer_sum = sum(row["timing"][str(bs)]["wall_ms"] for row in rows)
+            report["totals"][str(bs)] = {
+                "model_wall_ms": round(model_ms, 4),
+                "model_cpu_ms": round(model_cpu_ms, 4),
+                "layer_sum_wall_ms": round(layer_sum, 4),
+                "per_image_ms": round(model_ms / bs, 4),
+                "peak_activation_bytes": max(row["timing"][str(bs)]["output_bytes"] for row in rows) if rows else 0,
+            }
+
+    known = [row["flops"] for row in rows if row.get("flops") is not None]
+    report["flops_per_image"] = int(sum(known))
+    report["flops_unknown_layers"] = [row["name"] for row in rows if row.get("flops") is None]
+    largest = str(max(batch_sizes))
+    total_ms = sum(row["timing"][largest]["wall_ms"] for row in rows) or 1.0
+    for row in rows:
+        t = row["timing"][largest]
+        row["time_share"] = round(t["wall_ms"] / total_ms, 4)
+        row["gflops_per_s"] = (round(row["flops"] * int(largest) / (t["wall_ms"] / 1000) / 1e9, 2)
+                               if row.get("flops") and t["wall_ms"] > 0 else None)
+    report["layers"] = rows
+    return report
+
+
+def format_hotspots(report: Dict[str, Any], top: int = 15) -> str:
+    """Ranked hotspot table for the largest profiled batch size."""
+    bs = str(max(report["batch_sizes"]))
+    rows = sorted(report["layers"], key=lambda r: r["timing"][bs]["wall_ms"], reverse=True)[:top]
+    totals = report["totals"][bs]
+    lines = [
+        f"🔥 {report['model']}  input={report['input_size'][0]}x{report['input_size'][1]}  "
+        f"params={report['params']:,}  GFLOPs/img={report['flops_per_image'] / 1e9:.3f}  "
+        f"batch={bs}: model {totals['model_wall_ms']:.2f} ms, layer sum {totals['layer_sum_wall_ms']:.2f} ms",
+        f"{'#':>3} {'layer':28} {'type':22} {'ms/batch':>9} {'cpu ms':>9} {'share':>6} "
+        f"{'MFLOPs/img':>11} {'GFLOP/s':>8} {'params':>10} {'act MB':>8}",
+    ]
+    for rank, row in enumerate(rows, 1):
+        t = row["timing"][bs]
+        flops = f"{row['flops'] / 1e6:11.2f}" if row.get("flops") is not None else f"{'n/a':>11}"
+        gflops = f"{row['gflops_per_s']:8.1f}" if row.get("gflops_per_s") is not None else f"{'-':>8}"
+        lines.append(
+            f"{rank:>3} {row['name'][:28]:28} {row['type'][:22]:22} {t['wall_ms']:9.3f} {t['cpu_ms']:9.3f} "
+            f"{row['time_share'] * 100:5.1f}% {flops} {gflops} {row['params']:>10,} "
+            f"{t['output_bytes'] / (1024 * 1024):8.2f}")
+    if report["flops_unknown_layers"]:
+        lines.append(f"    (no FLOP formula for: {', '.join(report['flops_unknown_layers'])})")
+    return "\n".join(lines)
+
+
+def profile_registry(model_dir: Path = BASE_DIR, names: Optional[Sequence[str]] = None,
+                     **kwargs) -> Dict[str, Dict[str, Any]]:
+    """Profile registered models (all active versions by default)."""
+    from model_registry import ModelRegistry
+    registry = ModelRegistry(model_dir, auto_refresh=False)
+    registry.refresh()
+    entries = [registry.resolve(n) for n in names] if names else registry.active_versions()
+    reports = {}
+    for entry in entries:
+        if entry is None:
+            continue
+        model = tf.keras.models.load_model(registry.artifact_path(entry), compile=False)
+        print(f"⏱️ Profiling {entry['name']} @ {entry['version_id']}...")
+        reports[entry["name"]] = {"version_id": entry["version_id"], **profile_model(model, **kwargs)}
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-layer time, memory and FLOPs profile of Keras models")
+    parser.add_argument("--model-dir", default=str(BASE_DIR), help="Registry directory")
+    parser.add_argument("--models", nargs="*", help="Registered model names or version IDs (default: all)")
+    parser.add_argument("--arch", nargs="*", help="Profile untrained build_model architectures instead")
+    parser.add_argument("--img-size", type=int, nargs=2, default=[150, 150], help="Input size for --arch")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32], help="Batch sizes to profile")
+    parser.add_argument("--repeats", type=int, default=10, help="Timed runs per layer and batch size")
+    parser.add_argument("--top", type=int, default=15, help="Rows in each hotspot table")
+    parser.add_argument("--output", default="layer_profile.json", help="JSON report path")
+    parser.add_argument("--device", default="/CPU:0", help="TensorFlow device")
+    args = parser.parse_args()
+
+    options = {"batch_sizes": args.batch_sizes, "repeats": args.repeats, "device": args.device}
+    if args.arch:
+        from train_model import build_model
+        reports = {arch: profile_model(build_model(tuple(args.img_size), arch=arch), **options) for arch in args.arch}
+    else:
+        reports = profile_registry(Path(args.model_dir), args.models, **options)
+    if not reports:
+        print("❌ No models to profile")
+        return
+    for report in reports.values():
+        print("\n" + format_hotspots(report, args.top))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"generated_at": time.time(), "models": reports}, f, indent=2)
+    print(f"\n📝 Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Process memory sampling shared by the soak test and the services' debug endpoint.
+
+A sample contains:
+- resident set size (psutil if installed, else /proc/self/status)
+- Python heap traced by tracemalloc (current, peak, top allocating lines)
+- TensorFlow allocator stats for each logical device, when TF is already imported
+- live object counts for the types that usually leak here (PIL images, PyMuPDF documents)
+
+tracemalloc is only started when requested (DEBUG_MEMORY=1 in the services),
+because tracing slows down allocation-heavy code.
+"""
+import os
+import gc
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+try:
+    import psutil
+    _HAS_PSUTIL = True
+except Exception:
+    _HAS_PSUTIL = False
+
+DEBUG_MEMORY = os.getenv("DEBUG_MEMORY", "0") == "1"
+TRACEMALLOC_FRAMES = int(os.getenv("TRACEMALLOC_FRAMES", "1"))
+
+
+def start_tracing(frames: int = TRACEMALLOC_FRAMES):
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(frames)
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size of this process."""
+    if _HAS_PSUTIL:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def top_allocations(limit: int = 10) -> List[Dict[str, Any]]:
+    """Largest traced allocation sites (empty when tracemalloc is off)."""
+    if not tracemalloc.is_tracing():
+        return []
+    stats = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    )).statistics("lineno")
+    return [{
+        "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+        "size_bytes": stat.size,
+        "count": stat.count,
+    } for stat in stats[:limit]]
+
+
+def tf_allocator_stats() -> Dict[str, Any]:
+    """tf.config.experimental.get_memory_info per device; only if TF is already loaded."""
+    tf = sys.modules.get("tensorflow")
+    if tf is None:
+        return {}
+    stats = {}
+    for device in tf.config.list_logical_devices():
+        try:
+            stats[device.name] = tf.config.experimental.get_memory_info(device.name)
+        except Exception:
+            # Not supported for this device type (CPU on most builds)
+            continue
+    return stats
+
+
+def live_objects() -> Dict[str, int]:
+    """Counts of objects that hold native buffers and are easy to leak."""
+    counts = {"PIL.Image": 0, "fitz.Document": 0}
+    image_cls = getattr(sys.modules.get("PIL.Image"), "Image", None)
+    fitz = sys.modules.get("fitz")
+    doc_cls = getattr(fitz, "Document", None) if fitz else None
+    for obj in gc.get_objects():
+        if image_cls is not None and isinstance(obj, image_cls):
+            counts["PIL.Image"] += 1
+        elif doc_cls is not None and isinstance(obj, doc_cls):
+            counts["fitz.Document"] += 1
+    return counts
+
+
+def memory_snapshot(top: int = 10, objects: bool = True) -> Dict[str, Any]:
+    """One memory sample of the current process."""
+    current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (None, None)
+    return {
+        "timestamp": time.time(),
+        "rss_bytes": rss_bytes(),
+        "tracemalloc": {
+            "tracing": tracemalloc.is_tracing(),
+            "current_bytes": current,
+            "peak_bytes": peak,
+            "top": top_allocations(top),
+        },
+        "tensorflow": tf_allocator_stats(),
+        "live_objects": live_objects() if objects else None,
+    }
@@ -1,15 +1,25 @@
-"""Lightweight mock inference API for demo purposes.
+"""Lightweight mock inference API for demos and load tests.
 
 This service mimics the real inference API but does not require TensorFlow.
-It accepts multipart file uploads and returns a random prediction with confidence.
+It accepts multipart file uploads (and binary tensor frames) and answers
+through perf_simulator.SimulatedEngine: realistic per-stage latencies,
+batching, concurrency limits, error/timeout injection and deterministic
+outputs per content hash, optionally replaying a recorded trace. Use it to
+capacity-plan the Next.js + inference stack on machines without TensorFlow.
 
 Run for demo: python mock_inference.py
+    MOCK_PROFILE=instant python mock_inference.py      # old behaviour: answers immediately
+    MOCK_PROFILE=my_profile.json MOCK_TRACE=trace.jsonl python mock_inference.py
+
+See perf_simulator.py for the profile fields and latency specs. GET /metrics
+reports the simulated queue, batch and latency statistics.
 """
-import random
-import io
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from PIL import Image
+from inference_engine import ImageInput, ImageDecodeError
+from overload_control import Overloaded
+from perf_simulator import SimulatedEngine, SimulatedError, SimulatedTimeout
+from tensor_protocol import predict_tensor_request, TensorProtocolError, RESULT_MEDIA_TYPE
 
 app = FastAPI(title="Mock Pneumonia Inference API")
 app.add_middleware(
@@ -20,25 +30,48 @@ app.add_middleware(
     allow_headers=["*"]
 )
 
+engine = SimulatedEngine.from_env()
+
 
 @app.get('/health')
 def health():
     return {"status": "mock ok"}
 
 
+@app.get('/metrics')
+def metrics():
+    return engine.describe()
+
+
 @app.post('/predict')
-async def predict(file: UploadFile = File(...)):
+async def predict(request: Request, file: UploadFile = File(...)):
+    contents = await file.read()
     try:
-        contents = await file.read()
-        Image.open(io.BytesIO(contents))
-    except Exception:
+        # Trace replays send the recorded hash so the recorded output is returned
+        result = (await engine.apredict([ImageInput(contents, file.content_type, file.filename)],
+                                        keys=[request.headers.get('X-Trace-Hash')]))[0]
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': '1'})
+    except ImageDecodeError:
         raise HTTPException(status_code=400, detail='Invalid image')
+    except SimulatedTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except SimulatedError as e:
+        raise HTTPException(status_code=500, detail=f'Prediction error: {e}')
 
-    # Random demo prediction
-    prob = random.uniform(0, 1)
-    label = 'PNEUMONIA' if prob >= 0.5 else 'NORMAL'
-    confidence = prob if label == 'PNEUMONIA' else 1 - prob
-    return { 'prediction': label, 'confidence': round(confidence, 4) }
+    result['filename'] = file.filename or 'unknown'
+    return result
+
+
+@app.post('/predict/tensor')
+async def predict_tensor(request: Request, verbose: bool = False):
+    try:
+        payload = await predict_tensor_request(engine, await request.body(), verbose)
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': '1'})
+    except TensorProtocolError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return Response(content=payload, media_type=RESULT_MEDIA_TYPE)
 
 
 if __name__ == '__main__':
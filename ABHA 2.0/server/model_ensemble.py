@@ -0,0 +1,302 @@
+"""Weighted, calibrated ensemble of registered pneumonia detection models.
+
+Used by enhanced_inference_service.py and by offline tools such as
+distill_model.py, so it has no web framework dependency.
+
+Members may have different input sizes (read from the registry's input_shape).
+Callers preprocess once at the largest size (`input_size`); the ensemble then
+builds a pyramid from that batch and runs every member that shares an input
+size on the same level. Each level is resampled from the top level with the
+same PIL resize as `inference_engine.preprocess`, so smaller members see the
+kind of input they were trained on.
+
+Configuration (environment):
+    ENSEMBLE_MODELS   Comma-separated registry names or version IDs ("*" = all active)
+    STUDENT_MODEL     Serve a single distilled student instead of the ensemble
+    EAGER_MODEL_LOAD  Deserialize members in the background at startup (1/0)
+"""
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Tuple
+import numpy as np
+from PIL import Image
+from model_loader import LazyModel, load_models_parallel
+from model_registry import ModelRegistry, recommend_best, input_size
+
+# Configuration
+# Input size (width, height) for members whose registry entry has no input shape
+IMG_SIZE = (150, 150)
+BASE_DIR = Path(__file__).parent
+MODEL_DIR = BASE_DIR
+EAGER_MODEL_LOAD = os.getenv("EAGER_MODEL_LOAD", "0") == "1"
+# Comma-separated registry names or version IDs; "*" uses every active version
+ENSEMBLE_MODELS = [m.strip() for m in os.getenv(
+    "ENSEMBLE_MODELS", "pneumonia_detection_model.keras,pneumonia_smoke.keras").split(",") if m.strip()]
+# A distilled student (registry name or version ID) served on its own
+STUDENT_MODEL = os.getenv("STUDENT_MODEL")
+
+
+class ModelEnsemble:
+    def __init__(self, registry: Optional[ModelRegistry] = None, members: Optional[List[str]] = None,
+                 student: Optional[str] = STUDENT_MODEL):
+        self.registry = registry or ModelRegistry(MODEL_DIR)
+        self.members = members or ENSEMBLE_MODELS
+        # A distilled student learned the calibrated ensemble output, so it is
+        # served alone and without re-calibration
+        self.student = student
+        self.models = {}
+        self.model_versions = {}
+        self.model_metrics = {}
+        self.model_weights = {}
+        self.model_metadata = {}
+        self.input_groups: Dict[Tuple[int, int], List[str]] = {}
+        # Members are deserialized once per (re)load, not checked on every batch
+        self._warm = False
+        self._warm_lock = threading.Lock()
+        self.load_available_models()
+    
+    def select_versions(self) -> List[Dict[str, Any]]:
+        """Registry entries for the configured ensemble members (names or version IDs)."""
+        if self.student:
+            entry = self.registry.resolve(self.student)
+            return [entry] if entry else []
+        if self.members == ["*"]:
+            return self.registry.active_versions()
+        entries = [self.registry.resolve(name) for name in self.members]
+        return [entry for entry in entries if entry]
+    
+    def load_available_models(self):
+        """Register the configured models from the registry as lazy proxies.
+
+        Only registry metadata is used here; weights are deserialized concurrently
+        the first time the ensemble predicts (or in the background when
+        EAGER_MODEL_LOAD=1). Members whose version ID is unchanged keep their
+        already-loaded model.
+        """
+        models = {}
+        versions = {}
+        metadata = {}
+        for entry in self.select_versions():
+            model_name = entry["name"]
+            if self.model_versions.get(model_name) == entry["version_id"] and model_name in self.models:
+                models[model_name] = self.models[model_name]
+            else:
+                models[model_name] = LazyModel(self.registry.artifact_path(entry), entry)
+                print(f"Registered model: {model_name} @ {entry['version_id']} (lazy)")
+            versions[model_name] = entry["version_id"]
+            metadata[model_name] = entry
+        
+        self.models = models
+        self.model_versions = versions
+        self.model_metadata = metadata
+        # Metrics come from the registry index, no weights needed
+        self.model_metrics = {name: entry["metrics"] for name, entry in metadata.items() if entry.get("metrics")}
+        self.model_weights = {}
+        self.calculate_model_weights()
+        self.group_by_input_size()
+        self._warm = False
+        print(f"Registered {len(self.models)} models for ensemble")
+        
+        if EAGER_MODEL_LOAD and self.models:
+            threading.Thread(target=self.warm_models, daemon=True).start()
+    
+    def reload(self) -> bool:
+        """Re-sync with the registry; only changed version IDs are reloaded."""
+        changed = self.registry.refresh()
+        if changed:
+            self.load_available_models()
+        return changed
+    
+    def warm_models(self):
+        """Deserialize every not-yet-loaded member concurrently, dropping failures."""
+        with self._warm_lock:
+            errors = load_models_parallel(self.models.values())
+            failed = set()
+            for model_name, error in errors.items():
+                if error is None:
+                    print(f"✅ Successfully loaded {model_name}")
+                else:
+                    print(f"❌ Failed to load {model_name}: {error}")
+                    failed.add(model_name)
+            if failed:
+                self.models = {k: v for k, v in self.models.items() if k not in failed}
+                self.model_versions = {k: v for k, v in self.model_versions.items() if k not in failed}
+                self.model_metrics = {k: v for k, v in self.model_metrics.items() if k not in failed}
+                self.model_weights = {}
+                self.calculate_model_weights()
+                self.group_by_input_size()
+            self._warm = True
+    
+    def group_by_input_size(self):
+        """Members keyed by input size (width, height), largest size first."""
+        groups: Dict[Tuple[int, int], List[str]] = {}
+        for model_name in self.models:
+            size = input_size(self.model_metadata.get(model_name), IMG_SIZE)
+            groups.setdefault(size, []).append(model_name)
+        self.input_groups = dict(sorted(groups.items(), key=lambda item: item[0][0] * item[0][1], reverse=True))
+    
+    @property
+    def input_size(self) -> Tuple[int, int]:
+        """The size uploads are preprocessed at: the largest member input."""
+        return next(iter(self.input_groups), IMG_SIZE)
+    
+    def best_member(self) -> Optional[str]:
+        """Best single member by test metrics (same rule as ModelManager.recommend_best_model)."""
+        if not self.models:
+            return None
+        return recommend_best({name: self.model_metrics.get(name) for name in self.models}) or next(iter(self.models))
+    
+    def calculate_model_weights(self):
+        """Calculate weights for ensemble based on model performance."""
+        if self.student:
+            self.model_weights = {name: 1.0 for name in self.models}
+            return
+        if not self.model_metrics:
+            # Give more weight to the main model, less to smoke model
+            for model_name in self.models:
+                if "detection" in model_name:
+                    self.model_weights[model_name] = 0.8
+                else:
+                    self.model_weights[model_name] = 0.2
+            return
+        
+        # Weight models based on F1 score and AUC
+        weights = {}
+        for model_name, metrics in self.model_metrics.items():
+            if metrics.get('test'):
+                test_metrics = metrics['test']
+                # Combine F1 and AUC for weighting
+                f1_score = test_metrics.get('f1', 0.5)
+                roc_auc = test_metrics.get('roc_auc', 0.5)
+                weights[model_name] = (f1_score + roc_auc) / 2
+            else:
+                weights[model_name] = 0.5
+        
+        # Normalize weights
+        total_weight = sum(weights.values())
+        if total_weight > 0:
+            self.model_weights = {k: v/total_weight for k, v in weights.items()}
+        else:
+            # Fallback to weighted approach
+            for model_name in self.models:
+                if "detection" in model_name:
+                    self.model_weights[model_name] = 0.8
+                else:
+                    self.model_weights[model_name] = 0.2
+    
+    def preprocess_image(self, image: Image.Image) -> np.ndarray:
+        """Resize and scale one image, with a batch dimension."""
+        from inference_engine import preprocess
+        return np.expand_dims(preprocess(image, self.input_size), axis=0)
+    
+    def input_pyramid(self, image_array: np.ndarray,
+                      groups: Optional[Dict[Tuple[int, int], List[str]]] = None) -> Dict[Tuple[int, int], np.ndarray]:
+        """The batch at every member input size, each level resampled from the top one."""
+        levels = {}
+        for size in (groups if groups is not None else self.input_groups):
+            w, h = size
+            levels[size] = image_array if image_array.shape[1:3] == (h, w) else resize_batch(image_array, size)
+        return levels
+    
+    def predict_members(self, image_array: np.ndarray) -> Dict[str, np.ndarray]:
+        """Per-member probabilities for a batch; failing members are skipped."""
+        if not self.models:
+            raise RuntimeError("No models loaded")
+        
+        # Members are lazy; the first batch after a (re)load deserializes them concurrently
+        if not self._warm:
+            self.warm_models()
+        if not self.models:
+            raise RuntimeError("No models could be loaded")
+        
+        member_probs = {}
+        groups, models = self.input_groups, self.models
+        for size, level in self.input_pyramid(image_array, groups).items():
+            for model_name in groups[size]:
+                model = models.get(model_name)
+                if model is None:
+                    continue
+                try:
+                    member_probs[model_name] = np.asarray(model.predict(level, verbose=0), dtype=np.float64).ravel()
+                except Exception as e:
+                    print(f"Error with model {model_name}: {e}")
+                    continue
+        
+        if not member_probs:
+            raise RuntimeError("All models failed to predict")
+        return member_probs
+    
+    def ensemble_probabilities(self, image_array: np.ndarray) -> Dict[str, Any]:
+        """Weighted and calibrated ensemble probabilities for a whole batch."""
+        member_probs = self.predict_members(image_array)
+        ensemble_probs = sum(
+            probs * self.model_weights.get(name, 1.0 / len(self.models))
+            for name, probs in member_probs.items()
+        )
+        return {
+            'members': member_probs,
+            'ensemble': ensemble_probs,
+            'calibrated': self.calibrate_probabilities(ensemble_probs),
+        }
+    
+    def predict_ensemble(self, image_array: np.ndarray) -> Dict[str, Any]:
+        """Make prediction using ensemble of models."""
+        probs = self.ensemble_probabilities(image_array)
+        
+        predictions = {}
+        for model_name, member_probs in probs['members'].items():
+            prob = float(member_probs[0])
+            predictions[model_name] = {
+                'probability': prob,
+                'prediction': 'PNEUMONIA' if prob >= 0.5 else 'NORMAL'
+            }
+        
+        ensemble_prob = float(probs['ensemble'][0])
+        calibrated_prob = float(probs['calibrated'][0])
+        
+        # Determine final prediction with adjusted threshold
+        # Use lower threshold (0.3) to catch more pneumonia cases and reduce false negatives
+        threshold = 0.3
+        final_prediction = 'PNEUMONIA' if calibrated_prob >= threshold else 'NORMAL'
+        confidence = calibrated_prob if final_prediction == 'PNEUMONIA' else (1 - calibrated_prob)
+        
+        return {
+            'prediction': final_prediction,
+            'confidence': round(confidence, 4),
+            'ensemble_probability': round(ensemble_prob, 4),
+            'calibrated_probability': round(calibrated_prob, 4),
+            'individual_predictions': predictions,
+            'model_weights': self.model_weights,
+            'model_versions': dict(self.model_versions),
+            'threshold_used': threshold
+        }
+    
+    def calibrate_confidence(self, raw_prob: float) -> float:
+        """Apply confidence calibration to improve reliability."""
+        return float(self.calibrate_probabilities(np.array([raw_prob]))[0])
+    
+    def calibrate_probabilities(self, raw_probs: np.ndarray) -> np.ndarray:
+        """Vectorized confidence calibration for a batch of probabilities."""
+        if self.student:
+            # The student was trained on already-calibrated targets
+            return np.asarray(raw_probs, dtype=np.float64)
+        return calibrate(raw_probs)
+
+
+def calibrate(raw_probs: np.ndarray) -> np.ndarray:
+    """The ensemble's confidence calibration (also used for drift reference profiles)."""
+    # Simple Platt scaling approximation
+    # This helps correct overconfident predictions
+    
+    # For now, apply a simple sigmoid transformation
+    # In production, this should be fitted on a calibration set
+    return 1 / (1 + np.exp(-5 * (np.asarray(raw_probs, dtype=np.float64) - 0.5)))
+
+
+def resize_batch(batch: np.ndarray, size: Tuple[int, int]) -> np.ndarray:
+    """Resize an NxHxWx3 batch in 0-1 to (width, height) with the same PIL call as preprocess."""
+    from inference_engine import preprocess
+    # Preprocessed pixels are uint8 / 255, so this round trip is lossless
+    pixels = np.clip(np.rint(np.asarray(batch) * 255.0), 0, 255).astype(np.uint8)
+    return np.stack([preprocess(Image.fromarray(image), size) for image in pixels])
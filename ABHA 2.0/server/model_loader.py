@@ -0,0 +1,197 @@
+"""Parallel and lazy loading helpers for saved Keras models.
+
+Deserializing a `.keras` file is the slowest part of starting the model manager
+and the inference services. This module lets callers:
+1. Build a metadata-only index (size, parameter count, input shape, metrics)
+   straight from the `.keras` archive without loading any weights
+2. Wrap each model file in a `LazyModel` proxy that only deserializes on first use
+3. Load many proxies concurrently across files with a thread pool
+"""
+
+import os
+import json
+import zipfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Iterable
+
+try:
+    import h5py
+    _HAS_H5PY = True
+except Exception:
+    _HAS_H5PY = False
+
+MAX_LOAD_WORKERS = int(os.getenv("MODEL_LOAD_WORKERS", "4"))
+_WARNED_NO_H5PY = False
+
+
+def metrics_path_for(model_path: Path) -> Path:
+    """Metrics JSON written by train_model.py next to a model file."""
+    model_path = Path(model_path)
+    return model_path.with_name(model_path.stem + "_metrics.json")
+
+
+def _find_input_shape(config: Dict[str, Any]) -> Optional[List[Optional[int]]]:
+    """Pull the batch input shape out of a serialized Keras model config."""
+    build_config = config.get("build_config") or {}
+    if build_config.get("input_shape"):
+        return list(build_config["input_shape"])
+
+    inner = config.get("config") or {}
+    build_config = inner.get("build_config") or {}
+    if build_config.get("input_shape"):
+        return list(build_config["input_shape"])
+
+    for layer in inner.get("layers", []):
+        layer_config = layer.get("config", {})
+        shape = layer_config.get("batch_shape") or layer_config.get("batch_input_shape")
+        if shape:
+            return list(shape)
+    return None
+
+
+def _count_weight_params(weights_file) -> Optional[int]:
+    """Sum the sizes of layer weight datasets without reading their values."""
+    global _WARNED_NO_H5PY
+    if not _HAS_H5PY:
+        if not _WARNED_NO_H5PY:
+            print("⚠️  h5py not installed; model param_count is not indexed. Install with: pip install h5py")
+            _WARNED_NO_H5PY = True
+        return None
+    total = 0
+    with h5py.File(weights_file, "r") as f:
+        root = f["layers"] if "layers" in f else f
+
+        def visit(_name, obj):
+            nonlocal total
+            if isinstance(obj, h5py.Dataset):
+                total += int(obj.size)
+
+        root.visititems(visit)
+    return total
+
+
+def read_model_metadata(model_path: Path) -> Dict[str, Any]:
+    """Describe a `.keras` file without deserializing the model."""
+    model_path = Path(model_path)
+    stat = model_path.stat()
+    metadata: Dict[str, Any] = {
+        "name": model_path.name,
+        "path": str(model_path),
+        "size_bytes": stat.st_size,
+        "mtime": stat.st_mtime,
+        "input_shape": None,
+        "param_count": None,
+        "metrics": None,
+    }
+
+    try:
+        with zipfile.ZipFile(model_path) as archive:
+            names = set(archive.namelist())
+            if "config.json" in names:
+                config = json.loads(archive.read("config.json"))
+                metadata["input_shape"] = _find_input_shape(config)
+            if "model.weights.h5" in names:
+                with archive.open("model.weights.h5") as weights_file:
+                    metadata["param_count"] = _count_weight_params(weights_file)
+    except Exception as e:
+        # Legacy formats (e.g. a renamed .h5) still get size and metrics
+        metadata["error"] = str(e)
+
+    metrics_file = metrics_path_for(model_path)
+    if metrics_file.exists():
+        try:
+            with open(metrics_file, "r") as f:
+                metadata["metrics"] = json.load(f)
+        except Exception as e:
+            print(f"⚠️  Could not read metrics {metrics_file.name}: {e}")
+
+    return metadata
+
+
+def build_metadata_index(model_paths: Iterable[Path], max_workers: int = MAX_LOAD_WORKERS) -> Dict[str, Dict[str, Any]]:
+    """Build a metadata index for many model files concurrently."""
+    model_paths = [Path(p) for p in model_paths]
+    if not model_paths:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(model_paths)))) as pool:
+        results = pool.map(read_model_metadata, model_paths)
+        return {path.name: metadata for path, metadata in zip(model_paths, results)}
+
+
+class LazyModel:
+    """Proxy for a Keras model that is only deserialized when first used.
+
+    Attribute access falls through to the real model, so a `LazyModel` can be
+    used anywhere a `tf.keras.Model` was used before.
+    """
+
+    def __init__(self, path: Path, metadata: Optional[Dict[str, Any]] = None):
+        self.path = Path(path)
+        self.metadata = metadata if metadata is not None else {}
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self):
+        """Deserialize the model once; concurrent callers wait for the same load."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    # Imported here so metadata-only callers never pay for TensorFlow
+                    import tensorflow as tf
+                    self._model = tf.keras.models.load_model(self.path)
+        return self._model
+
+    def unload(self):
+        """Drop the deserialized model so it is reloaded on next use."""
+        with self._lock:
+            self._model = None
+
+    def predict(self, x, **kwargs):
+        return self.load().predict(x, **kwargs)
+
+    def count_params(self) -> int:
+        if not self.loaded and self.metadata.get("param_count") is not None:
+            return self.metadata["param_count"]
+        return self.load().count_params()
+
+    def __getattr__(self, name):
+        # Only reached for attributes not defined on the proxy itself
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self.loaded else "lazy"
+        return f"LazyModel({self.path.name!r}, {state})"
+
+
+def load_models_parallel(models: Iterable[LazyModel], max_workers: int = MAX_LOAD_WORKERS) -> Dict[str, Optional[Exception]]:
+    """Deserialize all not-yet-loaded proxies concurrently.
+
+    Returns a mapping of model name to the exception raised while loading it,
+    or None when it loaded successfully.
+    """
+    pending = [m for m in models if not m.loaded]
+    if not pending:
+        return {}
+
+    def load_one(model: LazyModel) -> Optional[Exception]:
+        try:
+            model.load()
+            return None
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(pending)))) as pool:
+        errors = pool.map(load_one, pending)
+        return {model.name: error for model, error in zip(pending, errors)}
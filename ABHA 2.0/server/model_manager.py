@@ -5,6 +5,7 @@ This script helps manage cached models and improve predictions by:
 2. Creating ensemble combinations
 3. Fine-tuning models on problematic cases
 4. Providing model selection recommendations
+5. Profiling per-layer time, memory and FLOPs (layer_profiler.py)
 """
 
 import os
@@ -14,80 +15,117 @@ import tensorflow as tf
 from pathlib import Path
 from typing import Dict, List, Tuple, Any
 import matplotlib.pyplot as plt
+from model_loader import LazyModel, load_models_parallel
+from model_registry import ModelRegistry, recommend_best
+from train_model import build_model
+from layer_profiler import profile_model, format_hotspots
 
 class ModelManager:
     def __init__(self, model_dir: str = "."):
         self.model_dir = Path(model_dir)
         self.models = {}
         self.metrics = {}
+        self.metadata = {}
+        self.registry = ModelRegistry(self.model_dir, auto_refresh=False)
         self.load_all_models()
     
     def load_all_models(self):
-        """Load all available Keras models in the directory."""
-        keras_files = list(self.model_dir.glob("*.keras"))
+        """Index all registered Keras models as lazy proxies.
+
+        Models are resolved through the model registry; weights are only
+        deserialized when a model is first used for prediction, while summaries
+        and recommendations work from the registry metadata.
+        """
+        self.registry.refresh()
+        entries = self.registry.active_versions()
         
-        print(f"Found {len(keras_files)} model files:")
-        for model_file in keras_files:
-            try:
-                print(f"  Loading {model_file.name}...")
-                model = tf.keras.models.load_model(model_file)
-                self.models[model_file.name] = model
-                
-                # Load corresponding metrics
-                metrics_file = model_file.with_suffix('').with_suffix('_metrics.json')
-                if metrics_file.exists():
-                    with open(metrics_file, 'r') as f:
-                        self.metrics[model_file.name] = json.load(f)
-                
-                print(f"    ✅ Loaded successfully")
-            except Exception as e:
-                print(f"    ❌ Failed to load: {e}")
+        print(f"Found {len(entries)} registered models:")
+        for entry in entries:
+            model_name = entry["name"]
+            self.models[model_name] = LazyModel(self.registry.artifact_path(entry), entry)
+            self.metadata[model_name] = entry
+            
+            # Metrics come from the registry index
+            if entry.get("metrics"):
+                self.metrics[model_name] = entry["metrics"]
+            
+            params = entry.get("param_count")
+            params_text = f"{params:,} params" if params is not None else "unknown params"
+            print(f"  {model_name} @ {entry['version_id']} ({entry['size_bytes'] / (1024 * 1024):.1f} MB, {params_text})")
     
-    def evaluate_models(self):
-        """Evaluate and compare all loaded models."""
+    def warm_models(self):
+        """Deserialize all models concurrently, dropping any that fail to load."""
+        errors = load_models_parallel(self.models.values())
+        for model_name, error in errors.items():
+            if error is None:
+                print(f"    ✅ Loaded {model_name}")
+            else:
+                print(f"    ❌ Failed to load {model_name}: {error}")
+                del self.models[model_name]
+                self.metrics.pop(model_name, None)
+    
+    def evaluate_models(self, show_architecture: bool = False):
+        """Evaluate and compare all indexed models.
+        
+        Architecture summaries require deserializing the model, so they are
+        only printed when show_architecture is set.
+        """
         print("\n" + "="*60)
         print("MODEL EVALUATION SUMMARY")
         print("="*60)
         
+        if show_architecture:
+            self.warm_models()
+        
         for model_name, model in self.models.items():
-            print(f"\n🔍 Model: {model_name}")
+            print(f"\n🔍 Model: {model_name} @ {self.metadata.get(model_name, {}).get('version_id', 'unregistered')}")
             print("-" * 40)
             
-            # Print architecture summary
-            print("Architecture:")
-            model.summary(print_fn=lambda x: print(f"  {x}"))
+            metadata = self.metadata.get(model_name, {})
+            print(f"  Size:        {metadata.get('size_bytes', 0) / (1024 * 1024):.1f} MB")
+            print(f"  Parameters:  {metadata.get('param_count', 'N/A')}")
+            print(f"  Input shape: {metadata.get('input_shape', 'N/A')}")
+            
+            if show_architecture:
+                print("Architecture:")
+                model.summary(print_fn=lambda x: print(f"  {x}"))
             
             # Print metrics if available
             if model_name in self.metrics:
                 metrics = self.metrics[model_name]
-                if 'test' in metrics:
+                if metrics.get('test'):
                     test_metrics = metrics['test']
                     print(f"\n📊 Test Performance:")
-                    print(f"  Accuracy:  {test_metrics.get('accuracy', 'N/A'):.3f}")
-                    print(f"  Precision: {test_metrics.get('precision', 'N/A'):.3f}")
-                    print(f"  Recall:    {test_metrics.get('recall', 'N/A'):.3f}")
-                    print(f"  F1 Score:  {test_metrics.get('f1', 'N/A'):.3f}")
-                    print(f"  ROC AUC:   {test_metrics.get('roc_auc', 'N/A'):.3f}")
+                    print(f"  Accuracy:  {test_metrics.get('accuracy', float('nan')):.3f}")
+                    print(f"  Precision: {test_metrics.get('precision', float('nan')):.3f}")
+                    print(f"  Recall:    {test_metrics.get('recall', float('nan')):.3f}")
+                    print(f"  F1 Score:  {test_metrics.get('f1', float('nan')):.3f}")
+                    print(f"  ROC AUC:   {test_metrics.get('roc_auc', float('nan')):.3f}")
+    
+    def profile_models(self, batch_sizes: Tuple[int, ...] = (1, 8, 32), repeats: int = 10,
+                       output: str = "layer_profile.json", top: int = 15) -> Dict[str, Any]:
+        """Per-layer CPU time, memory, FLOPs and parameters of every model, with a hotspot table each."""
+        self.warm_models()
+        reports = {}
+        for model_name, model in self.models.items():
+            print(f"\n⏱️ Profiling {model_name}...")
+            report = profile_model(model.load(), batch_sizes=batch_sizes, repeats=repeats)
+            reports[model_name] = {"version_id": self.metadata[model_name]["version_id"], **report}
+            print(format_hotspots(report, top))
+        
+        report_path = self.model_dir / output
+        with open(report_path, 'w') as f:
+            json.dump({"models": reports}, f, indent=2)
+        print(f"\n📝 Profile report saved to: {report_path}")
+        return reports
     
     def recommend_best_model(self) -> str:
         """Recommend the best single model based on metrics."""
         if not self.metrics:
             return list(self.models.keys())[0] if self.models else None
         
-        best_model = None
-        best_score = 0
-        
-        for model_name, metrics in self.metrics.items():
-            if 'test' in metrics:
-                test_metrics = metrics['test']
-                # Combine F1 and AUC for overall score
-                f1 = test_metrics.get('f1', 0)
-                auc = test_metrics.get('roc_auc', 0)
-                score = (f1 + auc) / 2
-                
-                if score > best_score:
-                    best_score = score
-                    best_model = model_name
+        # Combine F1 and AUC for overall score
+        best_model = recommend_best(self.metrics)
         
         return best_model or list(self.models.keys())[0]
     
@@ -97,37 +135,8 @@ class ModelManager:
             base_model = self.models[base_model_name]
             print(f"Using {base_model_name} as base model")
         
-        # Create an improved CNN architecture
-        model = tf.keras.Sequential([
-            tf.keras.layers.Input(shape=(150, 150, 3)),
-            
-            # Enhanced feature extraction with residual-like connections
-            tf.keras.layers.Conv2D(32, (3, 3), activation='relu', padding='same'),
-            tf.keras.layers.BatchNormalization(),
-            tf.keras.layers.Conv2D(32, (3, 3), activation='relu', padding='same'),
-            tf.keras.layers.MaxPooling2D((2, 2)),
-            tf.keras.layers.Dropout(0.25),
-            
-            tf.keras.layers.Conv2D(64, (3, 3), activation='relu', padding='same'),
-            tf.keras.layers.BatchNormalization(),
-            tf.keras.layers.Conv2D(64, (3, 3), activation='relu', padding='same'),
-            tf.keras.layers.MaxPooling2D((2, 2)),
-            tf.keras.layers.Dropout(0.25),
-            
-            tf.keras.layers.Conv2D(128, (3, 3), activation='relu', padding='same'),
-            tf.keras.layers.BatchNormalization(),
-            tf.keras.layers.Conv2D(128, (3, 3), activation='relu', padding='same'),
-            tf.keras.layers.MaxPooling2D((2, 2)),
-            tf.keras.layers.Dropout(0.25),
-            
-            # Dense layers with regularization
-            tf.keras.layers.GlobalAveragePooling2D(),
-            tf.keras.layers.Dense(512, activation='relu'),
-            tf.keras.layers.Dropout(0.5),
-            tf.keras.layers.Dense(256, activation='relu'),
-            tf.keras.layers.Dropout(0.3),
-            tf.keras.layers.Dense(1, activation='sigmoid')
-        ])
+        # Shared with train_model.py so it can be trained with --arch improved
+        model = build_model((150, 150), arch='improved')
         
         # Compile with class weights to handle imbalanced data
         model.compile(
@@ -146,6 +155,7 @@ class ModelManager:
         
         print("\n🧪 Testing models on problematic case:")
         print("-" * 40)
+        self.warm_models()
         
         results = {}
         for model_name, model in self.models.items():
@@ -172,7 +182,8 @@ class ModelManager:
         # Update the inference service configuration
         config = {
             "active_model": model_name,
-            "model_path": str(self.model_dir / model_name),
+            "version_id": self.metadata[model_name]["version_id"],
+            "model_path": str(self.registry.artifact_path(self.metadata[model_name])),
             "switch_timestamp": str(pd.Timestamp.now()) if 'pd' in globals() else "unknown"
         }
         
@@ -208,9 +219,10 @@ def main():
         print("2. Switch model")
         print("3. Create improved model")
         print("4. Test models")
-        print("5. Exit")
+        print("5. Profile models (per-layer time, memory, FLOPs)")
+        print("6. Exit")
         
-        choice = input("\nEnter your choice (1-5): ").strip()
+        choice = input("\nEnter your choice (1-6): ").strip()
         
         if choice == '1':
             print("\nAvailable models:")
@@ -241,12 +253,16 @@ def main():
             if save_choice.lower() == 'y':
                 model_path = manager.model_dir / "improved_pneumonia_model.keras"
                 improved_model.save(model_path)
-                print(f"✅ Saved to: {model_path}")
+                entry = manager.registry.register(model_path, source="model_manager")
+                print(f"✅ Saved to: {model_path} (version {entry['version_id']})")
         
         elif choice == '4':
             manager.test_on_problematic_case()
         
         elif choice == '5':
+            manager.profile_models()
+        
+        elif choice == '6':
             print("👋 Goodbye!")
             break
         
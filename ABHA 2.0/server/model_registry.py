@@ -0,0 +1,407 @@
+"""Versioned on-disk registry of trained models.
+
+Every `.keras` file in the model directory is registered under a content-hashed
+version ID. A single index file (model_registry.json) keeps, per version:
+- file name, path, sha256 and size
+- input shape and parameter count (read without loading weights)
+- metrics from the `<stem>_metrics.json` file written by train_model.py
+- backend variants (Keras, TFLite, int8 TFLite) found next to the model
+- calibration artifacts (`<stem>_calibration.json`)
+- drift reference profiles (`<stem>_reference_profile.json`, see drift_monitor.py)
+
+Entries are keyed by relative path and content hash, so byte-identical copies
+under different names are separate entries. Lookups by version ID, relative
+path or file name are dictionary lookups, and refreshing the index only
+re-hashes files whose size or mtime changed. Writes take a file lock
+(model_registry.lock) and merge the index on disk first, so the trainer and
+the services can register versions concurrently.
+
+Usage:
+    python model_registry.py            # refresh and list registered versions
+    python model_registry.py --rehash   # force re-hashing every model file
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Tuple
+
+from model_loader import read_model_metadata, metrics_path_for, MAX_LOAD_WORKERS
+
+try:
+    import fcntl
+    _HAS_FCNTL = True
+except ImportError:  # Windows
+    import msvcrt
+    _HAS_FCNTL = False
+
+REGISTRY_FILE = "model_registry.json"
+# 2: entries keyed by relative path and version ID (1 was keyed by version ID)
+REGISTRY_VERSION = 2
+
+# Backend variants are discovered next to the Keras file by naming convention
+VARIANT_SUFFIXES = {
+    "tflite": ".tflite",
+    "tflite_int8": "_int8.tflite",
+}
+
+
+def _lock_file(f):
+    if _HAS_FCNTL:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _unlock_file(f):
+    if _HAS_FCNTL:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def file_sha256(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """Stream a file through sha256."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def calibration_path_for(model_path: Path) -> Path:
+    """Calibration artifact stored next to a model file."""
+    model_path = Path(model_path)
+    return model_path.with_name(model_path.stem + "_calibration.json")
+
+
+def model_score(metrics: Optional[Dict[str, Any]]) -> Optional[float]:
+    """Overall test score used to rank models: mean of F1 and ROC AUC."""
+    test = (metrics or {}).get("test")
+    if not test:
+        return None
+    return (test.get("f1", 0) + test.get("roc_auc", 0)) / 2
+
+
+def recommend_best(metrics_by_name: Dict[str, Optional[Dict[str, Any]]]) -> Optional[str]:
+    """Name of the best scoring model, or None when no model has test metrics."""
+    best_model = None
+    best_score = 0
+    for model_name, metrics in metrics_by_name.items():
+        score = model_score(metrics)
+        if score is not None and score > best_score:
+            best_score = score
+            best_model = model_name
+    return best_model
+
+
+def reference_profile_path_for(model_path: Path) -> Path:
+    """Drift reference profile written by train_model.py next to a model file."""
+    model_path = Path(model_path)
+    return model_path.with_name(model_path.stem + "_reference_profile.json")
+
+
+def input_size(entry: Optional[Dict[str, Any]], default: Optional[Tuple[int, int]] = None) -> Optional[Tuple[int, int]]:
+    """Model input as (width, height) from the recorded input_shape ([batch, H, W, C])."""
+    shape = (entry or {}).get("input_shape") or []
+    if len(shape) == 4 and shape[1] and shape[2]:
+        return int(shape[2]), int(shape[1])
+    return default
+
+
+class ModelRegistry:
+    """Index of model files, shared by every process that uses the model directory.
+
+    Entries are keyed by relative path and content hash, so byte-identical
+    copies under different names are separate entries. Every write takes a
+    file lock, merges the index on disk (written by other processes, e.g. the
+    trainer registering snapshots) and replaces the file atomically.
+    """
+
+    def __init__(self, model_dir: str = ".", index_file: str = REGISTRY_FILE, auto_refresh: bool = True):
+        self.model_dir = Path(model_dir)
+        self.index_path = self.model_dir / index_file
+        self.lock_path = self.index_path.with_suffix(".lock")
+        # entry key (path@version_id) -> entry
+        self.versions: Dict[str, Dict[str, Any]] = {}
+        # relative path, file name and version ID -> entry key of the current version
+        self.by_path: Dict[str, str] = {}
+        self.by_name: Dict[str, str] = {}
+        self.by_version: Dict[str, str] = {}
+        self._lock = threading.RLock()
+        self.load_index()
+        if auto_refresh:
+            self.refresh()
+
+    # --- Persistence ---
+
+    @staticmethod
+    def entry_key(entry: Dict[str, Any]) -> str:
+        return f"{entry['path']}@{entry['version_id']}"
+
+    def _read_index(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        if not self.index_path.exists():
+            return None
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            print(f"⚠️  Ignoring unreadable registry {self.index_path.name}: {e}")
+            return None
+        # Version 1 indexes were keyed by version ID only
+        return {self.entry_key(entry): entry for entry in data.get("versions", {}).values()}
+
+    def load_index(self):
+        """Merge in the index file (its entries win); a missing or unreadable file changes nothing."""
+        versions = self._read_index()
+        if versions is None:
+            return
+        with self._lock:
+            self.versions = {**self.versions, **versions}
+            self._rebuild_name_index()
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive access to the index across threads and processes, merged with the file on disk."""
+        with self._lock:
+            with open(self.lock_path, "a+") as lock_file:
+                _lock_file(lock_file)
+                try:
+                    on_disk = self._read_index() or {}
+                    # Entries other processes wrote win; entries only this process has are kept
+                    self.versions = {**self.versions, **on_disk}
+                    self._rebuild_name_index()
+                    yield on_disk
+                finally:
+                    _unlock_file(lock_file)
+
+    def save_index(self):
+        """Merge with the index on disk and atomically write it."""
+        with self._locked():
+            self._write_index()
+
+    def _write_index(self):
+        # Caller holds _locked()
+        data = {
+            "registry_version": REGISTRY_VERSION,
+            "updated_at": time.time(),
+            "versions": self.versions,
+        }
+        tmp_path = self.index_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def _rebuild_name_index(self):
+        # Latest active version wins for each path and file name; version IDs
+        # also resolve to inactive entries (active ones first)
+        self.by_path, self.by_name, self.by_version = {}, {}, {}
+        ordered = sorted(self.versions.items(), key=lambda kv: (kv[1].get("active", True), kv[1].get("registered_at", 0)))
+        for key, entry in ordered:
+            self.by_version[entry["version_id"]] = key
+            if entry.get("active", True):
+                self.by_path[entry["path"]] = key
+                self.by_name[entry["name"]] = key
+
+    @staticmethod
+    def _snapshot(versions: Dict[str, Dict[str, Any]]) -> Dict[str, tuple]:
+        return {key: (e.get("active", True), e.get("variants"), e.get("calibration"), e.get("reference_profile"), e.get("metrics"))
+                for key, e in versions.items()}
+
+    # --- Registration ---
+
+    def _relative(self, path: Path) -> str:
+        try:
+            return Path(path).resolve().relative_to(self.model_dir.resolve()).as_posix()
+        except ValueError:
+            return str(Path(path).resolve())
+
+    def _discover_artifacts(self, model_path: Path) -> Dict[str, Any]:
+        variants = {"keras": self._relative(model_path)}
+        for kind, suffix in VARIANT_SUFFIXES.items():
+            candidate = model_path.with_name(model_path.stem + suffix)
+            if candidate.exists():
+                variants[kind] = self._relative(candidate)
+        calibration = calibration_path_for(model_path)
+        profile = reference_profile_path_for(model_path)
+        return {
+            "variants": variants,
+            "calibration": self._relative(calibration) if calibration.exists() else None,
+            "reference_profile": self._relative(profile) if profile.exists() else None,
+        }
+
+    def _build_entry(self, model_path: Path, sha256: Optional[str] = None) -> Dict[str, Any]:
+        sha256 = sha256 or file_sha256(model_path)
+        metadata = read_model_metadata(model_path)
+        entry = {
+            "version_id": sha256[:16],
+            "name": model_path.name,
+            "path": self._relative(model_path),
+            "sha256": sha256,
+            "size_bytes": metadata["size_bytes"],
+            "mtime": metadata["mtime"],
+            "input_shape": metadata["input_shape"],
+            "param_count": metadata["param_count"],
+            "metrics": metadata["metrics"],
+            "registered_at": time.time(),
+            "active": True,
+        }
+        entry.update(self._discover_artifacts(model_path))
+        return entry
+
+    def _store(self, entry: Dict[str, Any]):
+        """Insert an entry, keeping fields recorded for an earlier registration."""
+        key = self.entry_key(entry)
+        with self._lock:
+            existing = self.versions.get(key)
+            if existing:
+                entry["registered_at"] = existing.get("registered_at", entry["registered_at"])
+                for field, value in existing.items():
+                    entry.setdefault(field, value)
+            # Older versions at the same path are superseded
+            for other_key, other in self.versions.items():
+                if other["path"] == entry["path"] and other_key != key:
+                    other["active"] = False
+            self.versions[key] = entry
+
+    def register(self, model_path: Path, save: bool = True, **extra) -> Dict[str, Any]:
+        """Register (or re-register) a single model file and return its entry.
+
+        Extra keyword arguments are stored on the entry (e.g. source="checkpoint").
+        """
+        entry = self._build_entry(Path(model_path))
+        entry.update(extra)
+        if not save:
+            with self._lock:
+                self._store(entry)
+                self._rebuild_name_index()
+            return entry
+        with self._locked():
+            self._store(entry)
+            self._rebuild_name_index()
+            self._write_index()
+        return entry
+
+    def refresh(self, rehash: bool = False) -> bool:
+        """Sync the index with the model directory.
+
+        Files whose size and mtime match their current entry are not re-hashed.
+        Returns True if the set of active versions or their artifacts changed.
+        """
+        model_files = sorted(self.model_dir.glob("*.keras"))
+        with self._lock:
+            before = self._snapshot(self.versions)
+        # Hashing runs outside the file lock; other processes keep registering meanwhile
+        self.load_index()
+        stale: List[Path] = []
+        with self._lock:
+            for model_file in model_files:
+                stat = model_file.stat()
+                current = self.resolve(self._relative(model_file))
+                if (rehash or current is None or current.get("size_bytes") != stat.st_size
+                        or current.get("mtime") != stat.st_mtime):
+                    stale.append(model_file)
+        hashes: List[str] = []
+        if stale:
+            with ThreadPoolExecutor(max_workers=max(1, min(MAX_LOAD_WORKERS, len(stale)))) as pool:
+                hashes = list(pool.map(file_sha256, stale))
+        new_entries = [self._build_entry(model_file, sha256) for model_file, sha256 in zip(stale, hashes)]
+
+        with self._locked() as on_disk:
+            on_disk_state = self._snapshot(on_disk)
+            for entry in new_entries:
+                self._store(entry)
+            for model_file in model_files:
+                current = self.resolve(self._relative(model_file))
+                if current is None or model_file in stale:
+                    continue
+                # Cheap: variants, calibration and metrics may appear after training
+                current.update(self._discover_artifacts(model_file))
+                metrics_file = metrics_path_for(model_file)
+                if current.get("metrics") is None and metrics_file.exists():
+                    current["metrics"] = read_model_metadata(model_file)["metrics"]
+            # Entries outside the top-level scan (e.g. checkpoint snapshots) stay
+            # active for as long as their file exists
+            for entry in self.versions.values():
+                if entry.get("active", True) and not (self.model_dir / entry["path"]).exists():
+                    entry["active"] = False
+            self._rebuild_name_index()
+            after = self._snapshot(self.versions)
+            if after != on_disk_state or not self.index_path.exists():
+                self._write_index()
+        return before != after
+
+    # --- Lookups ---
+
+    def get(self, version_id: str) -> Optional[Dict[str, Any]]:
+        key = self.by_version.get(version_id)
+        return self.versions.get(key) if key else None
+
+    def resolve(self, name_or_version: str) -> Optional[Dict[str, Any]]:
+        """Find an entry by version ID, relative path or file name."""
+        if name_or_version in self.by_version:
+            return self.versions[self.by_version[name_or_version]]
+        path = Path(name_or_version)
+        relative = self._relative(path) if path.is_absolute() else path.as_posix()
+        key = self.by_path.get(relative) or self.by_name.get(path.name)
+        return self.versions.get(key) if key else None
+
+    def active_versions(self) -> List[Dict[str, Any]]:
+        return [self.versions[key] for key in self.by_path.values()]
+
+    def artifact_path(self, entry: Dict[str, Any], variant: str = "keras") -> Optional[Path]:
+        """Absolute path of a model variant, or None if it was never exported."""
+        relative = entry.get("variants", {}).get(variant)
+        return self.model_dir / relative if relative else None
+
+    def load_calibration(self, entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if not entry.get("calibration"):
+            return None
+        with open(self.model_dir / entry["calibration"], "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def load_reference_profile(self, entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        if not entry.get("reference_profile"):
+            return None
+        with open(self.model_dir / entry["reference_profile"], "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def add_variant(self, version_id: str, variant: str, path: Path):
+        with self._locked():
+            for entry in self.versions.values():
+                if entry["version_id"] == version_id:
+                    entry.setdefault("variants", {})[variant] = self._relative(path)
+            self._write_index()
+
+    def fingerprint(self) -> str:
+        """Stable digest of the active version set, for cache invalidation."""
+        ids = ",".join(sorted(self.by_path.values()))
+        return hashlib.sha256(ids.encode()).hexdigest()[:16]
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Refresh and list the local model registry")
+    parser.add_argument("--model-dir", default=str(Path(__file__).parent))
+    parser.add_argument("--rehash", action="store_true", help="Re-hash every model file")
+    args = parser.parse_args()
+
+    registry = ModelRegistry(args.model_dir, auto_refresh=False)
+    registry.refresh(rehash=args.rehash)
+    print(f"📚 Model registry: {registry.index_path}")
+    print("-" * 60)
+    for entry in registry.active_versions():
+        variants = ", ".join(sorted(entry.get("variants", {})))
+        print(f"{entry['version_id']}  {entry['name']:35} {entry['size_bytes'] / (1024 * 1024):6.1f} MB  [{variants}]")
+    print(f"\nFingerprint: {registry.fingerprint()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Overload-aware graceful degradation for the prediction services.
+
+A `DegradationController` watches the number of outstanding images and the
+p95 latency of recent requests and picks a serving tier for each new request:
+
+    full       the full ensemble (or distilled student)
+    single     the single best member (ModelEnsemble.best_member)
+    quantized  the int8 TFLite variant of that member
+    shed       reject with HTTP 503
+
+Tier N+1 is entered as soon as either signal crosses threshold N (queue depth
+or latency). Services admit a request here before it waits in the fair-share
+scheduler, so the depth covers queued as well as running work, a request
+counts once per image (`cost`), and latency includes the scheduler wait. Recovery is gradual: the controller steps down one tier only
+after both signals have stayed below `recovery_ratio` x the thresholds for
+`recovery_s` seconds, so it does not flap at the boundary.
+
+Configuration (environment):
+    OVERLOAD_CONTROL        Enable the controller (1/0, default 1)
+    OVERLOAD_QUEUE_LIMITS   Outstanding images that trigger single,quantized,shed (default 8,16,32)
+    OVERLOAD_LATENCY_MS     p95 latency in ms that triggers single,quantized,shed (default 1000,2000,4000)
+    OVERLOAD_RECOVERY_S     Seconds of calm before stepping back one tier (default 5)
+    OVERLOAD_WINDOW_S       Latency window in seconds (default 10)
+"""
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+TIERS = ("full", "single", "quantized", "shed")
+
+
+def _env_list(name: str, default: str) -> List[float]:
+    return [float(v) for v in os.getenv(name, default).split(",") if v.strip()]
+
+
+OVERLOAD_CONTROL = os.getenv("OVERLOAD_CONTROL", "1") == "1"
+QUEUE_LIMITS = _env_list("OVERLOAD_QUEUE_LIMITS", "8,16,32")
+LATENCY_LIMITS_MS = _env_list("OVERLOAD_LATENCY_MS", "1000,2000,4000")
+RECOVERY_S = float(os.getenv("OVERLOAD_RECOVERY_S", "5"))
+WINDOW_S = float(os.getenv("OVERLOAD_WINDOW_S", "10"))
+
+
+class Overloaded(RuntimeError):
+    """Raised when a request is shed (services map this to HTTP 503)."""
+
+
+class DegradationController:
+    def __init__(self, queue_limits: Sequence[float] = QUEUE_LIMITS,
+                 latency_limits_ms: Sequence[float] = LATENCY_LIMITS_MS,
+                 recovery_s: float = RECOVERY_S, window_s: float = WINDOW_S,
+                 recovery_ratio: float = 0.7, enabled: bool = OVERLOAD_CONTROL):
+        if len(queue_limits) != len(TIERS) - 1 or len(latency_limits_ms) != len(TIERS) - 1:
+            raise ValueError(f"Expected {len(TIERS) - 1} queue and latency thresholds")
+        self.queue_limits = list(queue_limits)
+        self.latency_limits_ms = list(latency_limits_ms)
+        self.recovery_s = recovery_s
+        self.window_s = window_s
+        self.recovery_ratio = recovery_ratio
+        self.enabled = enabled
+        self.level = 0
+        self.in_flight = 0
+        self._latencies: Deque[Tuple[float, float]] = deque(maxlen=2048)
+        self._calm_since: Optional[float] = None
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {tier: 0 for tier in TIERS}
+        self.stats["transitions"] = 0
+
+    @property
+    def tier(self) -> str:
+        return TIERS[self.level]
+
+    def _p95_ms(self, now: float) -> float:
+        while self._latencies and now - self._latencies[0][0] > self.window_s:
+            self._latencies.popleft()
+        if not self._latencies:
+            return 0.0
+        latencies = sorted(ms for _, ms in self._latencies)
+        return latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+
+    def _target(self, depth: int, p95_ms: float, scale: float) -> int:
+        level = 0
+        for i, (queue_limit, latency_limit) in enumerate(zip(self.queue_limits, self.latency_limits_ms)):
+            if depth >= queue_limit * scale or p95_ms >= latency_limit * scale:
+                level = i + 1
+        return level
+
+    def _update(self, now: float):
+        """Escalate immediately, recover one tier at a time. Caller holds the lock."""
+        depth, p95 = self.in_flight, self._p95_ms(now)
+        previous = self.level
+        escalate = self._target(depth, p95, 1.0)
+        if escalate > self.level:
+            self.level = escalate
+            self._calm_since = None
+        elif self._target(depth, p95, self.recovery_ratio) < self.level:
+            if self._calm_since is None:
+                self._calm_since = now
+            elif now - self._calm_since >= self.recovery_s:
+                self.level -= 1
+                self._calm_since = now
+        else:
+            self._calm_since = None
+        if self.level != previous:
+            self.stats["transitions"] += 1
+            print(f"⚠️ Serving tier {TIERS[previous]} -> {self.tier} (outstanding {depth:g}, p95 {p95:.0f} ms)")
+
+    def acquire(self, cost: float = 1.0) -> str:
+        """Admit a request of `cost` images and return its tier; raises Overloaded when shedding."""
+        with self._lock:
+            if self.enabled:
+                self._update(time.monotonic())
+            tier = self.tier
+            self.stats[tier] += 1
+            if tier == "shed":
+                raise Overloaded("Service overloaded, retry later")
+            self.in_flight += cost
+            return tier
+
+    def release(self, latency_s: float, cost: float = 1.0):
+        with self._lock:
+            self.in_flight -= cost
+            self._latencies.append((time.monotonic(), latency_s * 1000.0))
+
+    @contextmanager
+    def admit(self, cost: float = 1.0) -> Iterator[str]:
+        tier = self.acquire(cost)
+        start = time.perf_counter()
+        try:
+            yield tier
+        finally:
+            self.release(time.perf_counter() - start, cost)
+
+    def describe(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            if self.enabled:
+                self._update(now)
+            return {
+                "enabled": self.enabled,
+                "tier": self.tier,
+                "in_flight": self.in_flight,
+                "p95_latency_ms": round(self._p95_ms(now), 1),
+                "queue_limits": self.queue_limits,
+                "latency_limits_ms": self.latency_limits_ms,
+                "stats": dict(self.stats),
+            }
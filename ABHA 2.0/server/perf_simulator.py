@@ -0,0 +1,466 @@
+"""Performance simulator that stands in for the inference engine without TensorFlow.
+
+`SimulatedEngine` has the engine's async interface (apredict, threshold,
+describe), so mock_inference.py and tensor_protocol.predict_tensor_request use
+it unchanged. Requests go through the same stages as in the real services,
+with sampled latencies instead of real work:
+
+    admission    at most max_concurrency requests in flight; beyond max_queue
+                 waiting requests new ones are shed (Overloaded -> 503)
+    decode       per image, in parallel; `real` runs the actual decoder (no TensorFlow
+                 needed), so invalid uploads fail with 400 like in the real services
+    batching     images wait up to batch_wait_ms for a batch of max_batch_size
+    model        model_workers batches at a time; batch time = model_batch + n * model_per_item
+    postprocess  per image
+
+Error injection: error_rate (500), decode_error_rate (400) and timeout_rate
+(the image stalls for timeout_s, then fails with 504). Outputs are
+deterministic per content hash and seed, so the same upload always gets the
+same prediction.
+
+Latency specs are in milliseconds:
+    const:5   uniform:5,20   normal:12,2   lognormal:<median>,<sigma>   exponential:<mean>
+    empirical:3,4,4,5,9     trace (sample the loaded trace's recorded latencies; these
+                            are end-to-end, so they include the recorded queueing)
+
+Profiles: built-in names (instant, cpu_ensemble, cpu_single, gpu) or a JSON
+file with any SimulatorProfile fields.
+
+Traces are prediction-log records (prediction_log.py): a log directory or a
+JSONL export (`python prediction_log.py --since ... > trace.jsonl`). With a
+trace loaded, uploads whose content hash (or X-Trace-Hash header) was recorded
+get the recorded output, and `replay` re-sends the recorded arrivals:
+
+    python perf_simulator.py replay --trace trace.jsonl --url http://localhost:8001/predict --speed 2
+
+Configuration (environment, read by mock_inference.py):
+    MOCK_PROFILE   Profile name or JSON path (default cpu_ensemble)
+    MOCK_TRACE     Trace directory or JSONL file (optional)
+    MOCK_SEED      Seed for outputs and sampled latencies (default 0)
+"""
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+from collections import deque
+from dataclasses import dataclass, fields, asdict
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Sequence
+import numpy as np
+
+from inference_engine import ImageInput, ImageDecodeError, content_hash, decode_image
+from overload_control import Overloaded
+
+MOCK_PROFILE = os.getenv("MOCK_PROFILE", "cpu_ensemble")
+MOCK_TRACE = os.getenv("MOCK_TRACE")
+MOCK_SEED = int(os.getenv("MOCK_SEED", "0"))
+
+
+class SimulatedError(RuntimeError):
+    """Injected model failure (services map this to HTTP 500)."""
+
+
+class SimulatedTimeout(TimeoutError):
+    """Injected stall (services map this to HTTP 504)."""
+
+
+class LatencyDist:
+    """A latency distribution parsed from a spec string; samples are in seconds."""
+
+    def __init__(self, spec: str, trace_latencies: Optional[Sequence[float]] = None):
+        self.spec = spec
+        kind, _, args = spec.partition(":")
+        self.kind = kind.strip().lower()
+        self.args = [float(a) for a in args.split(",") if a.strip()]
+        if self.kind == "trace":
+            if not trace_latencies:
+                raise ValueError("Latency 'trace' needs a trace with recorded latencies")
+            self.kind, self.args = "empirical", list(trace_latencies)
+        expected = {"const": 1, "uniform": 2, "normal": 2, "lognormal": 2, "exponential": 1}
+        if self.kind in expected and len(self.args) != expected[self.kind]:
+            raise ValueError(f"Latency '{spec}' needs {expected[self.kind]} argument(s)")
+        if self.kind not in expected and self.kind not in ("empirical", "real"):
+            raise ValueError(f"Unknown latency distribution '{self.kind}'")
+        if self.kind == "empirical" and not self.args:
+            raise ValueError("Empirical latency needs at least one value")
+
+    def sample(self, rng: random.Random) -> float:
+        a = self.args
+        if self.kind == "const":
+            ms = a[0]
+        elif self.kind == "uniform":
+            ms = rng.uniform(a[0], a[1])
+        elif self.kind == "normal":
+            ms = rng.gauss(a[0], a[1])
+        elif self.kind == "lognormal":
+            ms = rng.lognormvariate(math.log(a[0]), a[1]) if a[0] > 0 else 0.0
+        elif self.kind == "exponential":
+            ms = rng.expovariate(1.0 / a[0]) if a[0] > 0 else 0.0
+        elif self.kind == "real":
+            ms = 0.0
+        else:
+            ms = rng.choice(a)
+        return max(ms, 0.0) / 1000.0
+
+
+@dataclass
+class SimulatorProfile:
+    decode: str = "real"
+    model_batch: str = "lognormal:90,0.2"
+    model_per_item: str = "normal:12,2"
+    postprocess: str = "const:0.3"
+    max_batch_size: int = 16
+    batch_wait_ms: float = 10.0
+    model_workers: int = 1
+    max_concurrency: int = 64
+    max_queue: int = 256
+    error_rate: float = 0.0
+    decode_error_rate: float = 0.0
+    timeout_rate: float = 0.0
+    timeout_s: float = 30.0
+    threshold: float = 0.5
+
+    @classmethod
+    def load(cls, name_or_path: str) -> "SimulatorProfile":
+        if name_or_path in PROFILES:
+            return cls(**PROFILES[name_or_path])
+        with open(name_or_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        known = {f.name for f in fields(cls)}
+        unknown = set(data) - known
+        if unknown:
+            raise ValueError(f"Unknown profile fields: {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+
+# Rough shapes of the real deployments; override with a JSON profile after measuring
+PROFILES: Dict[str, Dict[str, Any]] = {
+    "instant": {"decode": "const:0", "model_batch": "const:0", "model_per_item": "const:0", "postprocess": "const:0",
+                "batch_wait_ms": 0.0, "max_concurrency": 10_000, "max_queue": 100_000},
+    "cpu_ensemble": {},
+    "cpu_single": {"model_batch": "lognormal:25,0.2", "model_per_item": "normal:4,1"},
+    "gpu": {"model_batch": "lognormal:6,0.3", "model_per_item": "normal:0.4,0.1", "max_batch_size": 64,
+            "batch_wait_ms": 5.0},
+}
+
+
+class Trace:
+    """Recorded predictions (prediction-log rows) indexed by content hash."""
+
+    def __init__(self, records: List[Dict[str, Any]]):
+        self.records = sorted(records, key=lambda r: r.get("ts") or 0.0)
+        self.by_hash = {r["content_hash"]: r for r in self.records if r.get("content_hash")}
+        self.latencies_ms = [r["latency_ms"] for r in self.records if r.get("latency_ms") is not None]
+
+    @classmethod
+    def load(cls, path: str) -> "Trace":
+        path = Path(path)
+        if path.is_dir():
+            from prediction_log import query_log
+            return cls(query_log(path, limit=10_000_000))
+        records = []
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("{"):
+                    records.append(json.loads(line))
+        return cls(records)
+
+
+@dataclass
+class _Waiting:
+    key: str
+    future: asyncio.Future
+
+
+class SimulatedEngine:
+    def __init__(self, profile: Optional[SimulatorProfile] = None, trace: Optional[Trace] = None,
+                 seed: int = MOCK_SEED):
+        self.profile = profile or SimulatorProfile()
+        self.trace = trace
+        self.seed = seed
+        self.threshold = self.profile.threshold
+        latencies = trace.latencies_ms if trace else None
+        self.dists = {stage: LatencyDist(getattr(self.profile, stage), latencies)
+                      for stage in ("decode", "model_batch", "model_per_item", "postprocess")}
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self._admission: Optional[asyncio.Semaphore] = None
+        self._model_slots: Optional[asyncio.Semaphore] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._batcher: Optional[asyncio.Task] = None
+        self._model_tasks: set = set()
+        self.waiting = 0
+        self.in_flight = 0
+        self.stats = {"requests": 0, "images": 0, "shed": 0, "errors": 0, "decode_errors": 0, "timeouts": 0,
+                      "batches": 0, "batched_items": 0, "trace_hits": 0}
+        self._queue_ms: Deque[float] = deque(maxlen=4096)
+        self._latency_ms: Deque[float] = deque(maxlen=4096)
+
+    @classmethod
+    def from_env(cls) -> "SimulatedEngine":
+        trace = Trace.load(MOCK_TRACE) if MOCK_TRACE else None
+        return cls(SimulatorProfile.load(MOCK_PROFILE), trace, MOCK_SEED)
+
+    def _sample(self, stage: str) -> float:
+        with self._rng_lock:
+            return self.dists[stage].sample(self._rng)
+
+    def _chance(self, rate: float) -> bool:
+        if rate <= 0:
+            return False
+        with self._rng_lock:
+            return self._rng.random() < rate
+
+    # --- Outputs ---
+
+    def output(self, key: str) -> Dict[str, Any]:
+        """Deterministic result for a content hash (the recorded one if the trace has it)."""
+        recorded = self.trace.by_hash.get(key) if self.trace else None
+        if recorded is not None and recorded.get("probability") is not None:
+            self.stats["trace_hits"] += 1
+            p = float(recorded["probability"])
+            if recorded.get("prediction"):
+                # Replayed as recorded; the profile threshold only applies to synthetic outputs
+                raw, calibrated = recorded.get("raw_probability"), recorded.get("calibrated_probability")
+                return {
+                    "prediction": recorded["prediction"],
+                    "confidence": recorded.get("confidence"),
+                    "threshold_used": recorded.get("threshold"),
+                    "raw_probability": raw if raw is not None else p,
+                    "calibrated_probability": calibrated if calibrated is not None else p,
+                    "content_hash": key,
+                    "model_version_id": "simulated",
+                }
+        else:
+            digest = hashlib.sha256(f"{key}:{self.seed}".encode()).digest()
+            p = int.from_bytes(digest[:8], "big") / float(1 << 64)
+        label = "PNEUMONIA" if p >= self.threshold else "NORMAL"
+        return {
+            "prediction": label,
+            "confidence": round(p if label == "PNEUMONIA" else 1 - p, 4),
+            "threshold_used": self.threshold,
+            "raw_probability": round(p, 4),
+            "calibrated_probability": round(p, 4),
+            "content_hash": key,
+            "model_version_id": "simulated",
+        }
+
+    @staticmethod
+    def _key(item: Any) -> str:
+        if isinstance(item, (bytes, bytearray)):
+            return content_hash(bytes(item))
+        if isinstance(item, ImageInput):
+            return content_hash(item.data)
+        if isinstance(item, np.ndarray):
+            return content_hash(item.tobytes())
+        raise ImageDecodeError(f"Unsupported input type {type(item).__name__}")
+
+    # --- Pipeline ---
+
+    def _ensure_started(self):
+        if self._admission is None:
+            self._admission = asyncio.Semaphore(self.profile.max_concurrency)
+            self._model_slots = asyncio.Semaphore(self.profile.model_workers)
+        if self._batcher is None or self._batcher.done():
+            self._queue = asyncio.Queue()
+            self._batcher = asyncio.get_running_loop().create_task(self._batch_loop())
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.profile.batch_wait_ms / 1000.0
+            while len(batch) < self.profile.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._model_slots.acquire()
+            task = loop.create_task(self._run_batch(batch))
+            self._model_tasks.add(task)
+            task.add_done_callback(self._model_tasks.discard)
+
+    async def _run_batch(self, batch: List[_Waiting]):
+        try:
+            self.stats["batches"] += 1
+            self.stats["batched_items"] += len(batch)
+            service = self._sample("model_batch") + sum(self._sample("model_per_item") for _ in batch)
+            await asyncio.sleep(service)
+            for waiting in batch:
+                if waiting.future.done():
+                    continue
+                if self._chance(self.profile.error_rate):
+                    self.stats["errors"] += 1
+                    waiting.future.set_exception(SimulatedError("Injected model failure"))
+                else:
+                    waiting.future.set_result(self.output(waiting.key))
+        finally:
+            self._model_slots.release()
+
+    async def _predict_one(self, item: Any, key: Optional[str]) -> Dict[str, Any]:
+        key = key or self._key(item)
+        if isinstance(item, (bytes, bytearray)):
+            item = ImageInput(bytes(item))
+        if self.dists["decode"].kind == "real" and isinstance(item, ImageInput):
+            await asyncio.get_running_loop().run_in_executor(
+                None, decode_image, item.data, item.content_type, item.filename)
+        else:
+            await asyncio.sleep(self._sample("decode"))
+        if self._chance(self.profile.decode_error_rate):
+            self.stats["decode_errors"] += 1
+            raise ImageDecodeError("Injected decode failure")
+        if self._chance(self.profile.timeout_rate):
+            self.stats["timeouts"] += 1
+            await asyncio.sleep(self.profile.timeout_s)
+            raise SimulatedTimeout(f"Injected stall of {self.profile.timeout_s:.0f}s")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put(_Waiting(key, future))
+        result = await future
+        await asyncio.sleep(self._sample("postprocess"))
+        return result
+
+    async def apredict(self, images: Sequence[Any], return_exceptions: bool = False,
+                       keys: Optional[Sequence[Optional[str]]] = None) -> List[Any]:
+        """Simulate one request; `keys` can override content hashes (e.g. X-Trace-Hash during replay)."""
+        self._ensure_started()
+        if self.waiting >= self.profile.max_queue:
+            self.stats["shed"] += 1
+            raise Overloaded(f"Simulated queue full ({self.profile.max_queue} waiting)")
+        self.stats["requests"] += 1
+        self.stats["images"] += len(images)
+        started = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._admission.acquire()
+        finally:
+            self.waiting -= 1
+        self._queue_ms.append((time.perf_counter() - started) * 1000)
+        self.in_flight += 1
+        try:
+            keys = list(keys) if keys else [None] * len(images)
+            results = await asyncio.gather(*(self._predict_one(item, key) for item, key in zip(images, keys)),
+                                           return_exceptions=return_exceptions)
+        finally:
+            self.in_flight -= 1
+            self._admission.release()
+            self._latency_ms.append((time.perf_counter() - started) * 1000)
+        return list(results)
+
+    # --- Metrics ---
+
+    @staticmethod
+    def _percentiles(values: Sequence[float]) -> Dict[str, float]:
+        if not values:
+            return {}
+        p = np.percentile(values, [50, 95, 99])
+        return {"p50": round(float(p[0]), 2), "p95": round(float(p[1]), 2), "p99": round(float(p[2]), 2)}
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "backend": "simulated",
+            "profile": asdict(self.profile),
+            "seed": self.seed,
+            "trace_records": len(self.trace.records) if self.trace else 0,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "stats": dict(self.stats),
+            "queue_time_ms": self._percentiles(list(self._queue_ms)),
+            "latency_ms": self._percentiles(list(self._latency_ms)),
+        }
+
+
+# --- Trace replay client ---
+
+def replay(trace: Trace, url: str, speed: float = 1.0, workers: int = 64, limit: Optional[int] = None,
+           seed: int = 0) -> Dict[str, Any]:
+    """Re-send the trace's requests at their recorded inter-arrival times (divided by speed)."""
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+    from soak_test import build_payloads, mutate
+
+    records = [r for r in trace.records if r.get("ts")][:limit]
+    if not records:
+        raise SystemExit("Trace has no timestamped records")
+    payloads = build_payloads(seed)
+    session = requests.Session()
+    outcomes: List[Dict[str, Any]] = []
+    lock = threading.Lock()
+
+    def send(i: int, record: Dict[str, Any]):
+        data, content_type, filename = mutate(payloads[i % len(payloads)], i)
+        headers = {"X-Trace-Hash": record.get("content_hash") or ""}
+        if record.get("client"):
+            headers["X-Client-Id"] = record["client"]
+        start = time.perf_counter()
+        try:
+            status = session.post(url, files={"file": (filename, data, content_type)}, headers=headers,
+                                  timeout=120).status_code
+        except requests.RequestException:
+            status = 0
+        with lock:
+            outcomes.append({"status": status, "latency_ms": (time.perf_counter() - start) * 1000,
+                             "recorded_ms": record.get("latency_ms")})
+
+    t0, first = time.perf_counter(), records[0]["ts"]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for i, record in enumerate(records):
+            delay = (record["ts"] - first) / speed - (time.perf_counter() - t0)
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, i, record)
+    elapsed = time.perf_counter() - t0
+
+    latencies = [o["latency_ms"] for o in outcomes if o["status"] == 200]
+    recorded = [o["recorded_ms"] for o in outcomes if o["recorded_ms"] is not None]
+    statuses: Dict[str, int] = {}
+    for o in outcomes:
+        statuses[str(o["status"])] = statuses.get(str(o["status"]), 0) + 1
+    return {
+        "url": url,
+        "speed": speed,
+        "requests": len(outcomes),
+        "duration_s": round(elapsed, 2),
+        "throughput_rps": round(len(outcomes) / elapsed, 2) if elapsed > 0 else None,
+        "status_counts": statuses,
+        "latency_ms": SimulatedEngine._percentiles(latencies),
+        "recorded_latency_ms": SimulatedEngine._percentiles(recorded),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inference performance simulator utilities")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rp = sub.add_parser("replay", help="Replay a recorded trace against a service")
+    rp.add_argument("--trace", required=True, help="Prediction log directory or JSONL export")
+    rp.add_argument("--url", required=True, help="Predict URL, e.g. http://localhost:8001/predict")
+    rp.add_argument("--speed", type=float, default=1.0, help="Time compression factor (2 = twice as fast)")
+    rp.add_argument("--workers", type=int, default=64, help="Maximum concurrent requests")
+    rp.add_argument("--limit", type=int, help="Replay only the first N records")
+    rp.add_argument("--report", help="Write the JSON report to this path")
+    sub.add_parser("profiles", help="Print the built-in profiles")
+    args = parser.parse_args()
+
+    if args.command == "profiles":
+        for name in PROFILES:
+            print(f"{name}: {json.dumps(asdict(SimulatorProfile.load(name)))}")
+        return
+    trace = Trace.load(args.trace)
+    print(f"▶️ Replaying {len(trace.records)} recorded requests against {args.url} at {args.speed}x")
+    report = replay(trace, args.url, args.speed, args.workers, args.limit)
+    print(json.dumps(report, indent=2))
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
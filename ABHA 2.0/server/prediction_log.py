@@ -0,0 +1,450 @@
+"""Append-only prediction log with write-behind persistence.
+
+Every served prediction is recorded for auditing and for linking results to
+HealthRecord entries (by the upload's content hash and the optional
+X-Record-Id header). The request path only appends a tuple to an in-memory
+ring buffer; a background thread drains the buffer and group-commits it
+(one transaction per flush) to the current SQLite segment.
+
+Storage layout (PREDICTION_LOG_DIR):
+    segment-<start_ms>-<pid>.sqlite3   hot segments, indexed by content hash and time;
+                                       rotated by record count or age
+    compact-<min_ms>-<max_ms>.parquet  closed segments compacted into columnar files
+                                       (.npz column arrays when pyarrow is not installed)
+
+Queries by content hash or time range read the hot segments through their
+indexes and only the columnar files whose time span overlaps the range. The
+columnar files are listed after the segments are read, so a segment that is
+compacted during a query is found in one place or the other; rows seen in both
+are returned once.
+
+If the ring buffer fills faster than the writer drains it, the oldest
+unwritten records are dropped and counted in `stats["dropped"]`, so logging
+never blocks a request.
+
+Usage:
+    python prediction_log.py --hash <sha256>
+    python prediction_log.py --since 2025-01-01T00:00 --until 2025-01-02T00:00 --limit 50
+    python prediction_log.py --compact
+
+Configuration (environment):
+    PREDICTION_LOG           Enable the log (1/0, default 1)
+    PREDICTION_LOG_DIR       Directory for segments (default server/prediction_log)
+    PREDICTION_LOG_RING      Ring buffer capacity in records (default 65536)
+    PREDICTION_LOG_FLUSH_S   Group-commit interval in seconds (default 1.0)
+    PREDICTION_LOG_SEGMENT   Records per segment before rotation (default 100000)
+    PREDICTION_LOG_MAX_AGE_S Segment age before rotation in seconds (default 3600)
+    PREDICTION_LOG_COMPACT_S Compaction interval in seconds, 0 = manual only (default 600)
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import numpy as np
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    _HAS_PYARROW = True
+except Exception:
+    _HAS_PYARROW = False
+
+BASE_DIR = Path(__file__).resolve().parent
+
+PREDICTION_LOG = os.getenv("PREDICTION_LOG", "1") == "1"
+PREDICTION_LOG_DIR = Path(os.getenv("PREDICTION_LOG_DIR", str(BASE_DIR / "prediction_log")))
+RING_SIZE = int(os.getenv("PREDICTION_LOG_RING", "65536"))
+FLUSH_S = float(os.getenv("PREDICTION_LOG_FLUSH_S", "1.0"))
+SEGMENT_RECORDS = int(os.getenv("PREDICTION_LOG_SEGMENT", "100000"))
+SEGMENT_MAX_AGE_S = float(os.getenv("PREDICTION_LOG_MAX_AGE_S", "3600"))
+COMPACT_S = float(os.getenv("PREDICTION_LOG_COMPACT_S", "600"))
+
+# (column, type); the order is the on-disk order in every format
+COLUMNS: Tuple[Tuple[str, type], ...] = (
+    ("ts", float),
+    ("content_hash", str),
+    ("record_id", str),
+    ("endpoint", str),
+    ("client", str),
+    ("filename", str),
+    ("prediction", str),
+    ("probability", float),
+    ("raw_probability", float),
+    ("calibrated_probability", float),
+    ("confidence", float),
+    ("threshold", float),
+    ("serving_tier", str),
+    ("model_versions", str),
+    ("latency_ms", float),
+)
+COLUMN_NAMES = tuple(name for name, _ in COLUMNS)
+# Hashable columns that identify a row across segment and columnar copies
+_KEY_COLUMNS = tuple(name for name in COLUMN_NAMES if name != "model_versions")
+
+_SEGMENT_RE = re.compile(r"segment-(\d+)-(\d+)\.sqlite3$")
+_COMPACT_RE = re.compile(r"compact-(\d+)-(\d+)\.(parquet|npz)$")
+
+
+def _model_versions(result: Dict[str, Any]) -> str:
+    versions = result.get("model_versions")
+    if versions is None and result.get("model_version_id"):
+        versions = {result.get("model_used") or "model": result["model_version_id"]}
+    return json.dumps(versions, sort_keys=True) if versions else ""
+
+
+def record_from_result(result: Dict[str, Any], latency_ms: Optional[float] = None,
+                       **context: Any) -> Tuple[Any, ...]:
+    """Flatten an engine result (and request context) into one log row."""
+    raw = result.get("raw_probability", result.get("ensemble_probability"))
+    calibrated = result.get("calibrated_probability")
+    values = {
+        "ts": time.time(),
+        "content_hash": result.get("content_hash") or "",
+        "prediction": result.get("prediction") or "",
+        "probability": calibrated if calibrated is not None else raw,
+        "raw_probability": raw,
+        "calibrated_probability": calibrated,
+        "confidence": result.get("confidence"),
+        "threshold": result.get("threshold_used"),
+        "serving_tier": result.get("serving_tier") or "",
+        "model_versions": _model_versions(result),
+        "latency_ms": latency_ms,
+        **context,
+    }
+    row = []
+    for name, kind in COLUMNS:
+        value = values.get(name)
+        if kind is float:
+            row.append(float(value) if value is not None else None)
+        else:
+            row.append(str(value) if value is not None else "")
+    return tuple(row)
+
+
+class PredictionLog:
+    def __init__(self, directory: Path = PREDICTION_LOG_DIR, ring_size: int = RING_SIZE, flush_s: float = FLUSH_S,
+                 segment_records: int = SEGMENT_RECORDS, segment_max_age_s: float = SEGMENT_MAX_AGE_S,
+                 compact_s: float = COMPACT_S, start: bool = True):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.flush_s = flush_s
+        self.segment_records = segment_records
+        self.segment_max_age_s = segment_max_age_s
+        self.compact_s = compact_s
+        self._ring: Deque[Tuple[Any, ...]] = deque(maxlen=ring_size)
+        # Serializes the writer, explicit flushes and compaction (never taken by record())
+        self._io_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._segment_path: Optional[Path] = None
+        self._segment_count = 0
+        self._segment_opened = 0.0
+        self._last_compact = time.monotonic()
+        self.stats = {"recorded": 0, "written": 0, "dropped": 0, "flushes": 0, "segments": 0,
+                      "compactions": 0, "write_errors": 0}
+        self._thread: Optional[threading.Thread] = None
+        if start:
+            self.start()
+
+    # --- Request path ---
+
+    def record(self, result: Dict[str, Any], latency_ms: Optional[float] = None, **context: Any):
+        """Queue one prediction; O(1) and never blocks on disk."""
+        if isinstance(result, Exception) or "prediction" not in result:
+            return
+        if len(self._ring) == self._ring.maxlen:
+            self.stats["dropped"] += 1
+        self._ring.append(record_from_result(result, latency_ms, **context))
+        self.stats["recorded"] += 1
+        if len(self._ring) >= self._ring.maxlen // 2:
+            self._wake.set()
+
+    # --- Writer ---
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="prediction-log", daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self.flush()
+        with self._io_lock:
+            self._close_segment()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_s)
+            self._wake.clear()
+            try:
+                self.flush()
+                if self.compact_s and time.monotonic() - self._last_compact >= self.compact_s:
+                    self.compact()
+            except Exception as e:
+                self.stats["write_errors"] += 1
+                print(f"❌ Prediction log write failed: {e}")
+
+    def flush(self) -> int:
+        """Write everything buffered so far in one transaction; returns the number of rows."""
+        with self._io_lock:
+            rows = []
+            while self._ring:
+                try:
+                    rows.append(self._ring.popleft())
+                except IndexError:
+                    break
+            if not rows:
+                return 0
+            conn = self._segment()
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO predictions ({', '.join(COLUMN_NAMES)}) "
+                    f"VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+            self._segment_count += len(rows)
+            self.stats["written"] += len(rows)
+            self.stats["flushes"] += 1
+            return len(rows)
+
+    def _segment(self) -> sqlite3.Connection:
+        expired = time.time() - self._segment_opened >= self.segment_max_age_s
+        if self._conn is not None and (self._segment_count >= self.segment_records or expired):
+            self._close_segment()
+        if self._conn is None:
+            self._segment_opened = time.time()
+            self._segment_path = self.directory / f"segment-{int(self._segment_opened * 1000)}-{os.getpid()}.sqlite3"
+            self._conn = _open_segment(self._segment_path)
+            self._segment_count = 0
+            self.stats["segments"] += 1
+        return self._conn
+
+    def _close_segment(self):
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = None
+        self._segment_path = None
+
+    # --- Compaction ---
+
+    def compact(self) -> Optional[Path]:
+        """Merge closed segments into one columnar file and delete them."""
+        with self._io_lock:
+            self._last_compact = time.monotonic()
+            now = time.time()
+            closed = []
+            for path in self.directory.glob("segment-*.sqlite3"):
+                match = _SEGMENT_RE.search(path.name)
+                if not match or path == self._segment_path:
+                    continue
+                if int(match.group(2)) != os.getpid() and now - path.stat().st_mtime < 2 * self.segment_max_age_s:
+                    # Possibly still open in another worker process
+                    continue
+                closed.append(path)
+            if not closed:
+                return None
+            rows: List[Tuple[Any, ...]] = []
+            for path in sorted(closed):
+                conn = sqlite3.connect(str(path))
+                try:
+                    rows.extend(conn.execute(f"SELECT {', '.join(COLUMN_NAMES)} FROM predictions ORDER BY ts"))
+                finally:
+                    conn.close()
+            target = None
+            if rows:
+                columns = _to_columns(rows)
+                lo, hi = int(columns["ts"].min() * 1000), int(columns["ts"].max() * 1000)
+                target = self.directory / f"compact-{lo}-{hi}.{'parquet' if _HAS_PYARROW else 'npz'}"
+                _write_columnar(target, columns)
+            for path in closed:
+                for suffix in ("", "-wal", "-shm"):
+                    Path(str(path) + suffix).unlink(missing_ok=True)
+            self.stats["compactions"] += 1
+            return target
+
+    # --- Queries ---
+
+    def query(self, content_hash: Optional[str] = None, since: Optional[float] = None,
+              until: Optional[float] = None, record_id: Optional[str] = None,
+              limit: int = 1000) -> List[Dict[str, Any]]:
+        return query_log(self.directory, content_hash, since, until, record_id, limit)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "buffered": len(self._ring),
+            "ring_size": self._ring.maxlen,
+            "directory": str(self.directory),
+            "columnar_format": "parquet" if _HAS_PYARROW else "npz",
+            "hot_segments": len(list(self.directory.glob("segment-*.sqlite3"))),
+            "compacted_files": len([p for p in self.directory.glob("compact-*") if _COMPACT_RE.search(p.name)]),
+        }
+
+
+def _open_segment(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(str(path), check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    definition = ", ".join(f"{name} {'REAL' if kind is float else 'TEXT'}" for name, kind in COLUMNS)
+    conn.execute(f"CREATE TABLE IF NOT EXISTS predictions ({definition})")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_predictions_hash ON predictions (content_hash)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_predictions_ts ON predictions (ts)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_predictions_record ON predictions (record_id)")
+    return conn
+
+
+def _to_columns(rows: List[Tuple[Any, ...]]) -> Dict[str, np.ndarray]:
+    columns = {}
+    for i, (name, kind) in enumerate(COLUMNS):
+        values = [row[i] for row in rows]
+        if kind is float:
+            columns[name] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+        else:
+            columns[name] = np.array([v or "" for v in values], dtype=str)
+    return columns
+
+
+def _write_columnar(path: Path, columns: Dict[str, np.ndarray]):
+    tmp = path.with_name(path.name + ".tmp")
+    if path.suffix == ".parquet":
+        pq.write_table(pa.table({name: columns[name] for name in COLUMN_NAMES}), str(tmp))
+    else:
+        with open(tmp, "wb") as f:
+            np.savez(f, **columns)
+    os.replace(tmp, path)
+
+
+def _read_columnar(path: Path, content_hash: Optional[str], since: Optional[float],
+                   until: Optional[float], record_id: Optional[str]) -> List[Dict[str, Any]]:
+    if path.suffix == ".parquet":
+        filters = []
+        if content_hash is not None:
+            filters.append(("content_hash", "=", content_hash))
+        if record_id is not None:
+            filters.append(("record_id", "=", record_id))
+        if since is not None:
+            filters.append(("ts", ">=", since))
+        if until is not None:
+            filters.append(("ts", "<", until))
+        table = pq.read_table(str(path), filters=filters or None)
+        return table.to_pylist()
+    with np.load(path, allow_pickle=False) as data:
+        columns = {name: data[name] for name in COLUMN_NAMES if name in data.files}
+    mask = np.ones(len(columns["ts"]), dtype=bool)
+    if content_hash is not None:
+        mask &= columns["content_hash"] == content_hash
+    if record_id is not None:
+        mask &= columns["record_id"] == record_id
+    if since is not None:
+        mask &= columns["ts"] >= since
+    if until is not None:
+        mask &= columns["ts"] < until
+    rows = []
+    for i in np.flatnonzero(mask):
+        rows.append({name: values[i].item() for name, values in columns.items()})
+    return rows
+
+
+def _normalize(row: Dict[str, Any]) -> Dict[str, Any]:
+    row = dict(row)
+    for name, kind in COLUMNS:
+        value = row.get(name)
+        if kind is float and value is not None and value != value:
+            row[name] = None
+        elif kind is str and value == "":
+            row[name] = None
+    if row.get("model_versions"):
+        row["model_versions"] = json.loads(row["model_versions"])
+    return row
+
+
+def query_log(directory: Path = PREDICTION_LOG_DIR, content_hash: Optional[str] = None,
+              since: Optional[float] = None, until: Optional[float] = None,
+              record_id: Optional[str] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+    """Predictions matching all given filters, newest first."""
+    directory = Path(directory)
+    rows: List[Dict[str, Any]] = []
+    clauses, params = [], []
+    for column, op, value in (("content_hash", "=", content_hash), ("record_id", "=", record_id),
+                              ("ts", ">=", since), ("ts", "<", until)):
+        if value is not None:
+            clauses.append(f"{column} {op} ?")
+            params.append(value)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    for path in directory.glob("segment-*.sqlite3"):
+        match = _SEGMENT_RE.search(path.name)
+        if not match or (until is not None and int(match.group(1)) / 1000 >= until):
+            continue
+        try:
+            conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        except sqlite3.Error:
+            continue
+        try:
+            conn.row_factory = sqlite3.Row
+            cursor = conn.execute(f"SELECT * FROM predictions {where} ORDER BY ts DESC LIMIT ?", (*params, limit))
+            rows.extend(dict(r) for r in cursor)
+        except sqlite3.Error:
+            # Segment removed by a concurrent compaction
+            pass
+        finally:
+            conn.close()
+    for path in directory.glob("compact-*"):
+        match = _COMPACT_RE.search(path.name)
+        if not match:
+            continue
+        lo, hi = int(match.group(1)) / 1000, int(match.group(2)) / 1000
+        if (since is not None and hi < since) or (until is not None and lo >= until):
+            continue
+        if match.group(3) == "parquet" and not _HAS_PYARROW:
+            continue
+        rows.extend(_read_columnar(path, content_hash, since, until, record_id))
+    # A segment compacted mid-query can be read from both files; the full row identifies a record
+    unique = {}
+    for row in map(_normalize, rows):
+        unique.setdefault(tuple(row.get(name) for name in _KEY_COLUMNS), row)
+    return sorted(unique.values(), key=lambda r: r["ts"], reverse=True)[:limit]
+
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query or compact the prediction log")
+    parser.add_argument("--dir", default=str(PREDICTION_LOG_DIR), help="Prediction log directory")
+    parser.add_argument("--hash", help="Content hash (sha256) of the upload")
+    parser.add_argument("--record-id", help="HealthRecord ID passed as X-Record-Id")
+    parser.add_argument("--since", help="Start time (ISO 8601 or Unix seconds)")
+    parser.add_argument("--until", help="End time (ISO 8601 or Unix seconds)")
+    parser.add_argument("--limit", type=int, default=100, help="Maximum rows to print")
+    parser.add_argument("--compact", action="store_true", help="Compact closed segments into columnar files")
+    args = parser.parse_args()
+
+    if args.compact:
+        log = PredictionLog(Path(args.dir), start=False)
+        target = log.compact()
+        print(f"✅ Compacted into {target}" if target else "ℹ️ No closed segments to compact")
+        return
+    rows = query_log(Path(args.dir), args.hash, _parse_time(args.since), _parse_time(args.until),
+                     args.record_id, args.limit)
+    for row in rows:
+        print(json.dumps(row))
+    print(f"📊 {len(rows)} prediction(s)")
+
+
+if __name__ == "__main__":
+    main()
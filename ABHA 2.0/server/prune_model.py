@@ -0,0 +1,313 @@
+"""prune_model.py
+
+Structured channel pruning for trained Sequential pneumonia models.
+
+Takes a trained `.keras` model (e.g. from `build_model` or
+`ModelManager.create_improved_model`), ranks the output channels of every
+Conv2D / SeparableConv2D and hidden Dense layer by weight magnitude (or by the
+BatchNormalization scale that follows them), and rebuilds a physically smaller
+model with only the kept channels. Surviving weights are copied across,
+including the matching BatchNormalization statistics and the input slices of
+the next layer. A short fine-tune on the training data then recovers accuracy.
+
+Optionally, unstructured magnitude pruning (--weight-sparsity) zeroes the
+smallest remaining weights and keeps them at zero while fine-tuning, which
+shrinks the compressed artifact size.
+
+Usage examples:
+    python prune_model.py pneumonia_detection_model.keras --ratio 0.5
+    python prune_model.py improved_pneumonia_model.keras --ratio 0.3 --method bn_gamma --finetune-epochs 2
+    python prune_model.py pneumonia_detection_model.keras --ratio 0.5 --weight-sparsity 0.5
+
+Arguments:
+    model               Input .keras file (registry name or path)
+    --ratio             Fraction of channels to remove per prunable layer (default 0.5)
+    --method            l1|l2|bn_gamma channel importance (default l1)
+    --min-channels      Never keep fewer channels than this per layer (default 8)
+    --weight-sparsity   Additional unstructured magnitude sparsity of kept weights (default 0)
+    --finetune-epochs   Fine-tuning epochs (default 1, 0 disables)
+    --finetune-steps    Limit steps per fine-tuning epoch (optional)
+    --data / -d         Dataset base directory (auto-detected if omitted)
+    --output / -o       Output file (default <model>_pruned.keras)
+"""
+
+import os
+import gzip
+import json
+import argparse
+from typing import Dict, List, Optional, Any, Tuple
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.optimizers import Adam
+
+from model_registry import ModelRegistry
+from train_model import (
+    build_perf_datasets, benchmark_model, format_benchmark, resolve_data_dir,
+    collect_probs_and_labels, compute_metrics, _HAS_SKLEARN,
+)
+
+L = tf.keras.layers
+PRUNABLE = (L.Conv2D, L.SeparableConv2D, L.Dense)
+# Layers whose output channels are exactly their input channels
+PASS_THROUGH = (L.MaxPooling2D, L.AveragePooling2D, L.Dropout, L.ReLU, L.Activation, L.SpatialDropout2D)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Structured channel pruning for Sequential models")
+    parser.add_argument('model', help='Input .keras model (path, registry name or version ID)')
+    parser.add_argument('--ratio', type=float, default=0.5, help='Fraction of channels to remove per layer')
+    parser.add_argument('--method', choices=['l1', 'l2', 'bn_gamma'], default='l1')
+    parser.add_argument('--min-channels', type=int, default=8)
+    parser.add_argument('--weight-sparsity', type=float, default=0.0, help='Unstructured magnitude sparsity applied after channel pruning')
+    parser.add_argument('--finetune-epochs', type=int, default=1)
+    parser.add_argument('--finetune-steps', type=int, default=None)
+    parser.add_argument('--lr', type=float, default=1e-4)
+    parser.add_argument('-b', '--batch-size', type=int, default=32)
+    parser.add_argument('-d', '--data', default=os.getenv('DATA_DIR', None))
+    parser.add_argument('-o', '--output', default=None)
+    return parser.parse_args()
+
+
+def _is_prunable(layer) -> bool:
+    # DepthwiseConv2D subclasses Conv2D in older Keras, but its channels follow its input
+    return isinstance(layer, PRUNABLE) and not isinstance(layer, L.DepthwiseConv2D)
+
+
+def channel_importance(layer, next_layer, method: str) -> np.ndarray:
+    """Importance score per output channel of a prunable layer."""
+    if method == 'bn_gamma' and isinstance(next_layer, L.BatchNormalization):
+        return np.abs(next_layer.get_weights()[0])
+    # Output channels are the last kernel axis for Conv2D, Dense and the pointwise kernel
+    kernel = layer.get_weights()[1] if isinstance(layer, L.SeparableConv2D) else layer.get_weights()[0]
+    axes = tuple(range(kernel.ndim - 1))
+    if method == 'l2':
+        return np.sqrt(np.sum(kernel ** 2, axis=axes))
+    return np.sum(np.abs(kernel), axis=axes)
+
+
+def _keep_indices(scores: np.ndarray, ratio: float, min_channels: int) -> np.ndarray:
+    n_keep = max(min_channels, int(round(len(scores) * (1 - ratio))))
+    n_keep = min(n_keep, len(scores))
+    # Keep original channel order so spatial layouts stay consistent
+    return np.sort(np.argsort(scores)[::-1][:n_keep])
+
+
+def prune_sequential(model: tf.keras.Model, ratio: float, method: str = 'l1', min_channels: int = 8) -> Tuple[tf.keras.Model, List[Dict[str, Any]]]:
+    """Rebuild a Sequential model with the least important channels removed."""
+    if not isinstance(model, tf.keras.Sequential):
+        raise ValueError("Structured pruning currently supports Sequential models only")
+
+    layers = model.layers
+    weighted = [i for i, layer in enumerate(layers) if layer.get_weights()]
+    last_weighted = weighted[-1] if weighted else -1
+
+    keep: Optional[np.ndarray] = None          # kept channels of the current tensor
+    flatten_shape: Optional[Tuple[int, int, int]] = None
+    new_layers, new_weights, summary = [], [], []
+
+    for i, layer in enumerate(layers):
+        config = layer.get_config()
+        weights = layer.get_weights()
+        next_layer = layers[i + 1] if i + 1 < len(layers) else None
+
+        if isinstance(layer, L.Dense) and flatten_shape is not None and keep is not None:
+            # Rows are laid out as (H, W, C); slice the kept channels per position
+            h, w, c = flatten_shape
+            kernel = weights[0].reshape(h, w, c, -1)[:, :, keep, :].reshape(h * w * len(keep), -1)
+            weights = [kernel] + weights[1:]
+            flatten_shape = None
+        elif isinstance(layer, L.SeparableConv2D) and keep is not None:
+            mult = weights[0].shape[-1]
+            rows = np.array([c * mult + m for c in keep for m in range(mult)])
+            weights = [weights[0][:, :, keep, :], weights[1][:, :, rows, :]] + weights[2:]
+        elif isinstance(layer, (L.Conv2D, L.Dense)) and not isinstance(layer, L.DepthwiseConv2D) and keep is not None:
+            kernel = weights[0]
+            kernel = kernel[:, :, keep, :] if kernel.ndim == 4 else kernel[keep, :]
+            weights = [kernel] + weights[1:]
+
+        if _is_prunable(layer) and i != last_weighted:
+            scores = channel_importance(layer, next_layer, method)
+            out_keep = _keep_indices(scores, ratio, min_channels)
+            key = 'units' if isinstance(layer, L.Dense) else 'filters'
+            summary.append({'layer': layer.name, 'before': int(config[key]), 'after': int(len(out_keep))})
+            config[key] = int(len(out_keep))
+            weights = _slice_outputs(layer, weights, out_keep)
+            keep = out_keep
+        elif _is_prunable(layer):
+            keep = None
+        elif isinstance(layer, L.DepthwiseConv2D):
+            if keep is not None:
+                mult = weights[0].shape[-1]
+                outs = np.array([c * mult + m for c in keep for m in range(mult)])
+                weights = [weights[0][:, :, keep, :]] + ([w[outs] for w in weights[1:]])
+                keep = outs
+        elif isinstance(layer, L.BatchNormalization):
+            if keep is not None:
+                weights = [w[keep] for w in weights]
+        elif isinstance(layer, L.Flatten):
+            if keep is not None:
+                flatten_shape = tuple(int(d) for d in layer.input.shape[1:])
+        elif isinstance(layer, (L.GlobalAveragePooling2D, L.GlobalMaxPooling2D)) or isinstance(layer, PASS_THROUGH):
+            pass
+        else:
+            raise ValueError(f"Unsupported layer for pruning: {layer.__class__.__name__} ({layer.name})")
+
+        new_layers.append(layer.__class__.from_config(config))
+        new_weights.append(weights)
+
+    pruned = tf.keras.Sequential([tf.keras.Input(shape=model.input_shape[1:])] + new_layers, name=f"{model.name}_pruned")
+    for layer, weights in zip(pruned.layers, new_weights):
+        if weights:
+            layer.set_weights(weights)
+    return pruned, summary
+
+
+def _slice_outputs(layer, weights: List[np.ndarray], out_keep: np.ndarray) -> List[np.ndarray]:
+    """Keep only the selected output channels of a prunable layer's weights."""
+    if isinstance(layer, L.SeparableConv2D):
+        # [depthwise, pointwise, (bias)]; outputs live on the pointwise kernel
+        sliced = [weights[0], weights[1][..., out_keep]]
+        return sliced + [w[out_keep] for w in weights[2:]]
+    # [kernel, (bias)]
+    return [weights[0][..., out_keep]] + [w[out_keep] for w in weights[1:]]
+
+
+class SparsityMask(tf.keras.callbacks.Callback):
+    """Zero the smallest-magnitude kernel weights and keep them at zero while training."""
+
+    def __init__(self, sparsity: float):
+        super().__init__()
+        self.sparsity = sparsity
+        self.masks: Dict[str, List[np.ndarray]] = {}
+
+    def apply(self, model):
+        for layer in model.layers:
+            if not isinstance(layer, PRUNABLE + (L.DepthwiseConv2D,)):
+                continue
+            weights = layer.get_weights()
+            masks = []
+            for j, w in enumerate(weights):
+                if w.ndim < 2:  # biases stay dense
+                    masks.append(None)
+                    continue
+                threshold = np.quantile(np.abs(w), self.sparsity)
+                masks.append(np.abs(w) > threshold)
+            self.masks[layer.name] = masks
+            self._reapply(layer)
+
+    def _reapply(self, layer):
+        masks = self.masks.get(layer.name)
+        if masks:
+            layer.set_weights([w * m if m is not None else w for w, m in zip(layer.get_weights(), masks)])
+
+    def on_train_batch_end(self, batch, logs=None):
+        for layer in self.model.layers:
+            self._reapply(layer)
+
+
+def compressed_size_mb(path: str) -> float:
+    """Size after gzip, which is where weight sparsity pays off."""
+    with open(path, 'rb') as f:
+        return len(gzip.compress(f.read(), compresslevel=6)) / (1024 * 1024)
+
+
+def evaluate(model, ds) -> Optional[Dict[str, Any]]:
+    if ds is None or not _HAS_SKLEARN:
+        return None
+    y_true, y_prob = collect_probs_and_labels(model, ds)
+    if not len(y_true):
+        return None
+    metrics = compute_metrics(y_true, y_prob)
+    metrics.pop('classification_report', None)
+    return metrics
+
+
+def prune():
+    args = parse_args()
+    model_dir = os.path.dirname(os.path.abspath(args.model)) if os.path.exists(args.model) else os.path.dirname(os.path.abspath(__file__))
+    registry = ModelRegistry(model_dir)
+    entry = registry.resolve(args.model)
+    model_path = str(registry.artifact_path(entry)) if entry else args.model
+    if not os.path.exists(model_path):
+        raise SystemExit(f"Model not found: {args.model}")
+    output = args.output or os.path.splitext(model_path)[0] + '_pruned.keras'
+
+    model = tf.keras.models.load_model(model_path)
+    img_size = tuple(int(d) for d in model.input_shape[1:3])
+
+    base_dir = resolve_data_dir(args.data)
+    train_ds = val_ds = None
+    try:
+        train_ds, val_ds = build_perf_datasets(os.path.join(base_dir, 'train'), os.path.join(base_dir, 'val'),
+                                               img_size, args.batch_size, augment=True)
+    except FileNotFoundError as e:
+        print(f"{e}\nSkipping fine-tuning and accuracy evaluation")
+
+    print("\n--- Original model ---")
+    before = {'benchmark': benchmark_model(model, img_size, model_path=model_path), 'validation': evaluate(model, val_ds)}
+    before['benchmark']['compressed_size_mb'] = compressed_size_mb(model_path)
+    print(format_benchmark('original', before['benchmark'], before['validation']))
+
+    print(f"\n--- Pruning {args.ratio:.0%} of channels ({args.method}) ---")
+    pruned, summary = prune_sequential(model, args.ratio, args.method, args.min_channels)
+    for item in summary:
+        print(f"  {item['layer']:30} {item['before']:5} -> {item['after']:5}")
+
+    pruned.compile(optimizer=Adam(learning_rate=args.lr), loss='binary_crossentropy', metrics=['accuracy'])
+    callbacks = []
+    if args.weight_sparsity > 0:
+        mask = SparsityMask(args.weight_sparsity)
+        mask.apply(pruned)
+        callbacks.append(mask)
+    if train_ds is not None and args.finetune_epochs > 0:
+        print("\n--- Fine-tuning pruned model ---")
+        fit_kwargs = {'steps_per_epoch': args.finetune_steps} if args.finetune_steps else {}
+        pruned.fit(train_ds, validation_data=val_ds, epochs=args.finetune_epochs, callbacks=callbacks, **fit_kwargs)
+
+    pruned.save(output)
+    after = {'benchmark': benchmark_model(pruned, img_size, model_path=output), 'validation': evaluate(pruned, val_ds)}
+    after['benchmark']['compressed_size_mb'] = compressed_size_mb(output)
+
+    print("\n--- Pruning result ---")
+    print(format_benchmark('original', before['benchmark'], before['validation']))
+    print(format_benchmark('pruned', after['benchmark'], after['validation']))
+    b, a = before['benchmark'], after['benchmark']
+    deltas = {
+        'params_pct': 100.0 * (a['params'] - b['params']) / b['params'],
+        'file_size_pct': 100.0 * (a['file_size_mb'] - b['file_size_mb']) / b['file_size_mb'],
+        'compressed_size_pct': 100.0 * (a['compressed_size_mb'] - b['compressed_size_mb']) / b['compressed_size_mb'],
+    }
+    for key in a['latency_ms']:
+        deltas[f'latency_{key}_pct'] = 100.0 * (a['latency_ms'][key]['p50'] - b['latency_ms'][key]['p50']) / b['latency_ms'][key]['p50']
+    if before['validation'] and after['validation']:
+        deltas['accuracy'] = after['validation']['accuracy'] - before['validation']['accuracy']
+        deltas['f1'] = after['validation']['f1'] - before['validation']['f1']
+    for key, value in deltas.items():
+        print(f"  {key:28} {value:+.2f}")
+
+    report_json = os.path.splitext(output)[0] + '_metrics.json'
+    with open(report_json, 'w', encoding='utf-8') as f:
+        json.dump({
+            'validation': after['validation'],
+            'test': None,
+            'benchmark': after['benchmark'],
+            'pruning': {
+                'source_model': os.path.basename(model_path),
+                'source_version': entry['version_id'] if entry else None,
+                'ratio': args.ratio,
+                'method': args.method,
+                'weight_sparsity': args.weight_sparsity,
+                'layers': summary,
+                'before': before,
+                'deltas': deltas,
+            },
+        }, f, indent=2)
+    print(f"\nPruned model saved as '{output}', report in {report_json}")
+
+    registry = ModelRegistry(os.path.dirname(os.path.abspath(output)), auto_refresh=False)
+    pruned_entry = registry.register(output, source='pruning', parent=entry['version_id'] if entry else None)
+    print(f"Registered pruned model as version {pruned_entry['version_id']}")
+
+
+if __name__ == '__main__':
+    prune()
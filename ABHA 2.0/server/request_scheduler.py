@@ -0,0 +1,281 @@
+"""Priority and fair-share admission scheduler for the model execution path.
+
+Requests wait here before they reach the inference engine, instead of
+competing in one FIFO:
+
+- Priority classes: a waiting `interactive` request is always admitted before
+  any `batch` request, so bulk re-scoring cannot queue ahead of a clinician.
+- Weighted fair queuing inside a class: each client (API key or client ID)
+  gets a share of the class proportional to its weight, whatever the number
+  of requests it submits. A request's virtual finish time is
+  max(class virtual time, client's last finish) + cost / weight.
+- Per-class limits: maximum concurrent cost in flight, an optional token
+  bucket rate limit (cost units per second) and a bound on waiting requests
+  (a full queue raises `QueueFull`, which services map to HTTP 503).
+- Headroom: lower classes may only use the total concurrency minus a reserve,
+  so interactive requests find capacity even while batch work is running.
+- Per-class queue-time metrics (p50/p95/p99 wait, admitted, waiting, in flight).
+
+Cost is the number of images, so a 50-image study weighs 50 single uploads.
+One acquisition may not cost more than `max_cost(cls)`; callers split larger
+work (multi-image jobs and tensor requests) into chunks of at most that size.
+The scheduler runs on the service's event loop and needs no locks.
+
+Configuration (environment):
+    SCHED_TOTAL_CONCURRENCY        Images in flight across all classes (default 32)
+    SCHED_INTERACTIVE_CONCURRENCY  Interactive images in flight (default 32)
+    SCHED_BATCH_CONCURRENCY        Batch images in flight (default 8)
+    SCHED_INTERACTIVE_RATE         Interactive images per second, 0 = unlimited (default 0)
+    SCHED_BATCH_RATE               Batch images per second, 0 = unlimited (default 0)
+    SCHED_INTERACTIVE_QUEUE        Waiting interactive requests, 0 = unlimited (default 256)
+    SCHED_BATCH_QUEUE              Waiting batch requests, 0 = unlimited (default 64)
+    SCHED_INTERACTIVE_RESERVE      Images of the total only interactive requests may use (default 8)
+    SCHED_CLIENT_WEIGHTS           Per-client weights, e.g. "er-dashboard=4,rescoring=1" (default weight 1)
+"""
+import os
+import heapq
+import asyncio
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+
+
+def _parse_weights(value: str) -> Dict[str, float]:
+    weights = {}
+    for pair in value.split(","):
+        if "=" in pair:
+            client, weight = pair.split("=", 1)
+            weights[client.strip()] = float(weight)
+    return weights
+
+
+TOTAL_CONCURRENCY = int(os.getenv("SCHED_TOTAL_CONCURRENCY", "32"))
+INTERACTIVE_RESERVE = float(os.getenv("SCHED_INTERACTIVE_RESERVE", "8"))
+CLIENT_WEIGHTS = _parse_weights(os.getenv("SCHED_CLIENT_WEIGHTS", ""))
+
+
+@dataclass
+class ClassConfig:
+    name: str
+    priority: int               # lower is served first
+    max_concurrency: float
+    rate_per_s: float = 0.0     # token bucket refill; 0 = unlimited
+    burst: float = 0.0          # bucket size (defaults to one second of rate)
+    max_queue: int = 0          # waiting requests before QueueFull; 0 = unlimited
+
+
+def default_classes() -> List[ClassConfig]:
+    return [
+        ClassConfig(INTERACTIVE, 0, float(os.getenv("SCHED_INTERACTIVE_CONCURRENCY", "32")),
+                    float(os.getenv("SCHED_INTERACTIVE_RATE", "0")),
+                    max_queue=int(os.getenv("SCHED_INTERACTIVE_QUEUE", "256"))),
+        ClassConfig(BATCH, 1, float(os.getenv("SCHED_BATCH_CONCURRENCY", "8")),
+                    float(os.getenv("SCHED_BATCH_RATE", "0")),
+                    max_queue=int(os.getenv("SCHED_BATCH_QUEUE", "64"))),
+    ]
+
+
+class QueueFull(RuntimeError):
+    """The class's wait queue is full (services map this to HTTP 503)."""
+
+
+@dataclass
+class _ClassState:
+    config: ClassConfig
+    heap: List[Any] = field(default_factory=list)
+    virtual_time: float = 0.0
+    last_finish: Dict[str, float] = field(default_factory=dict)
+    in_flight: float = 0.0
+    # Total concurrency this class may fill (the total minus the reserve for lower classes)
+    total_limit: float = 0.0
+    waiting: int = 0
+    tokens: float = 0.0
+    refilled_at: float = field(default_factory=time.monotonic)
+    admitted: int = 0
+    rate_limited: int = 0
+    rejected: int = 0
+    # Sequence numbers of waiters already counted in rate_limited
+    limited_seqs: set = field(default_factory=set)
+    waits_ms: Deque[float] = field(default_factory=lambda: deque(maxlen=4096))
+
+
+class FairScheduler:
+    def __init__(self, classes: Optional[List[ClassConfig]] = None, total_concurrency: float = TOTAL_CONCURRENCY,
+                 client_weights: Optional[Dict[str, float]] = None, reserve: float = INTERACTIVE_RESERVE):
+        self.total_concurrency = total_concurrency
+        self.reserve = min(reserve, total_concurrency - 1)
+        self.client_weights = CLIENT_WEIGHTS if client_weights is None else client_weights
+        self.classes: Dict[str, _ClassState] = {}
+        for i, config in enumerate(sorted(classes or default_classes(), key=lambda c: c.priority)):
+            if config.rate_per_s and not config.burst:
+                config.burst = max(config.rate_per_s, 1.0)
+            total_limit = total_concurrency if i == 0 else total_concurrency - self.reserve
+            self.classes[config.name] = _ClassState(config, total_limit=total_limit, tokens=config.burst)
+        self.in_flight = 0.0
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def weight(self, client: str) -> float:
+        return max(self.client_weights.get(client, 1.0), 1e-6)
+
+    def max_cost(self, cls: str) -> int:
+        """Largest cost one acquisition in this class may have; split larger work into chunks."""
+        state = self.classes[cls]
+        limit = min(state.config.max_concurrency, state.total_limit)
+        if state.config.rate_per_s:
+            limit = min(limit, state.config.burst)
+        return max(1, int(limit))
+
+    # --- Admission ---
+
+    async def acquire(self, cls: str, client: str = "anonymous", cost: float = 1.0) -> float:
+        """Wait for a slot; returns the queue time in seconds."""
+        state = self.classes.get(cls)
+        if state is None:
+            raise ValueError(f"Unknown priority class '{cls}'")
+        if cost > self.max_cost(cls):
+            raise ValueError(f"Cost {cost} exceeds the {cls} limit of {self.max_cost(cls)}; split the request")
+        if state.config.max_queue and state.waiting >= state.config.max_queue:
+            state.rejected += 1
+            raise QueueFull(f"Too many queued {cls} requests, retry later")
+        start = max(state.virtual_time, state.last_finish.get(client, 0.0))
+        finish = start + cost / self.weight(client)
+        state.last_finish[client] = finish
+        future = asyncio.get_running_loop().create_future()
+        enqueued = time.monotonic()
+        heapq.heappush(state.heap, (finish, next(self._seq), start, cost, future, enqueued))
+        state.waiting += 1
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Admitted just before the caller went away; give the slot back
+                self.release(cls, cost)
+            else:
+                state.waiting -= 1
+            raise
+        return time.monotonic() - enqueued
+
+    def release(self, cls: str, cost: float = 1.0):
+        state = self.classes[cls]
+        state.in_flight -= cost
+        self.in_flight -= cost
+        if not state.heap and state.in_flight <= 0:
+            # Idle class: start a new fair-queuing period (and forget old clients)
+            state.virtual_time = 0.0
+            state.last_finish.clear()
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, cls: str, client: str = "anonymous", cost: float = 1.0) -> AsyncIterator[float]:
+        waited = await self.acquire(cls, client, cost)
+        try:
+            yield waited
+        finally:
+            self.release(cls, cost)
+
+    def _refill(self, state: _ClassState, now: float):
+        rate = state.config.rate_per_s
+        if rate:
+            state.tokens = min(state.config.burst, state.tokens + (now - state.refilled_at) * rate)
+        state.refilled_at = now
+
+    @staticmethod
+    def _fits(used: float, limit: float, cost: float) -> bool:
+        return used + cost <= limit
+
+    def _dispatch(self):
+        now = time.monotonic()
+        retry_in = None
+        progress = True
+        while progress:
+            progress = False
+            for state in self.classes.values():
+                # Drop waiters whose callers were cancelled
+                while state.heap and state.heap[0][4].done():
+                    state.limited_seqs.discard(heapq.heappop(state.heap)[1])
+                if not state.heap:
+                    continue
+                _, seq, start, cost, future, enqueued = state.heap[0]
+                if not self._fits(self.in_flight, state.total_limit, cost):
+                    # Strict priority: lower classes wait for capacity too
+                    break
+                if not self._fits(state.in_flight, state.config.max_concurrency, cost):
+                    continue
+                self._refill(state, now)
+                if state.config.rate_per_s and state.tokens < cost:
+                    if seq not in state.limited_seqs:
+                        state.limited_seqs.add(seq)
+                        state.rate_limited += 1
+                    wait = (cost - state.tokens) / state.config.rate_per_s
+                    retry_in = wait if retry_in is None else min(retry_in, wait)
+                    continue
+                heapq.heappop(state.heap)
+                state.limited_seqs.discard(seq)
+                state.waiting -= 1
+                if state.config.rate_per_s:
+                    state.tokens -= cost
+                state.virtual_time = max(state.virtual_time, start)
+                state.in_flight += cost
+                self.in_flight += cost
+                state.admitted += 1
+                state.waits_ms.append((now - enqueued) * 1000.0)
+                future.set_result(None)
+                progress = True
+                # Re-evaluate from the highest priority class after every admission
+                break
+        if retry_in is not None and self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(retry_in, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+    # --- Metrics ---
+
+    @staticmethod
+    def _percentile(values: List[float], q: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def describe(self) -> Dict[str, Any]:
+        classes = {}
+        for name, state in self.classes.items():
+            waits = list(state.waits_ms)
+            classes[name] = {
+                "priority": state.config.priority,
+                "max_concurrency": state.config.max_concurrency,
+                "rate_per_s": state.config.rate_per_s,
+                "max_queue": state.config.max_queue,
+                "max_cost": self.max_cost(name),
+                "waiting": state.waiting,
+                "in_flight": state.in_flight,
+                "admitted": state.admitted,
+                "rate_limited": state.rate_limited,
+                "rejected": state.rejected,
+                "queue_time_ms": {
+                    "p50": round(self._percentile(waits, 0.50), 2),
+                    "p95": round(self._percentile(waits, 0.95), 2),
+                    "p99": round(self._percentile(waits, 0.99), 2),
+                    "max": round(max(waits), 2) if waits else 0.0,
+                },
+            }
+        return {"total_concurrency": self.total_concurrency, "reserve": self.reserve, "in_flight": self.in_flight,
+                "classes": classes}
+
+
+def request_identity(headers, client_host: Optional[str], default_class: str = INTERACTIVE):
+    """(priority class, client) for a request from X-Priority and X-API-Key / X-Client-Id."""
+    cls = (headers.get("X-Priority") or default_class).lower()
+    client = headers.get("X-API-Key") or headers.get("X-Client-Id") or client_host or "anonymous"
+    return cls, client
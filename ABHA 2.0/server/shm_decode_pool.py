@@ -0,0 +1,249 @@
+"""Process pool for decoding uploads into a shared-memory ring of batch slots.
+
+PIL and PyMuPDF decoding holds the GIL for much of its run time, so decode
+threads compete with the inference path. This pool decodes in separate
+processes without pickling images back: the ring is one shared-memory array
+
+    ring[n_batches, batch_size, H, W, 3]  float32
+
+and a decode worker writes the preprocessed tensor for an upload straight into
+the position it was given. Only the compressed upload bytes go to the worker,
+and only (width, height) comes back.
+
+One pool (ring + worker processes) is shared by all engines in a process with
+the same input size and batch size (`shared_pool`); each engine has its own
+open batch slot, because a batch goes to one model.
+
+Positions are handed out in arrival order into the engine's open batch slot.
+A slot closes when it is full or batch_wait has passed since its first
+reservation, and it is dispatched once every reserved position has been
+decoded (or has failed). The model thread then gets `ring[slot, :n]`, a
+contiguous view, so the batch is never stacked or copied on our side. Failed
+positions stay in the batch as holes whose outputs are discarded. The slot is
+returned to the free list only after the model is done with it. When all
+slots are busy, new reservations wait, which gives natural backpressure.
+
+Workers are started with the `spawn` method so they never inherit a
+TensorFlow runtime from the service process.
+
+Configuration (environment, read by inference_engine.InferenceEngine):
+    INFERENCE_SHM_DECODE    Use this pool for async uploads (1/0, default 0)
+    INFERENCE_SHM_BATCHES   Batch slots in the ring (default 8)
+    INFERENCE_DECODE_WORKERS  Decode processes (shared with the thread pool setting)
+"""
+import os
+import atexit
+import asyncio
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+import numpy as np
+
+from inference_engine import decode_image
+
+SHM_BATCHES = int(os.getenv("INFERENCE_SHM_BATCHES", "8"))
+
+# Set in each worker process by _attach
+_worker_shm: Optional[shared_memory.SharedMemory] = None
+_worker_ring: Optional[np.ndarray] = None
+
+
+def _open_existing(name: str) -> shared_memory.SharedMemory:
+    try:
+        # Python 3.13+: the segment is owned (and unlinked) by the service process
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Spawned workers share the parent's resource tracker, which already knows the segment
+        return shared_memory.SharedMemory(name=name)
+
+
+def _attach(name: str, shape: Tuple[int, ...]):
+    global _worker_shm, _worker_ring
+    _worker_shm = _open_existing(name)
+    _worker_ring = np.ndarray(shape, dtype=np.float32, buffer=_worker_shm.buf)
+
+
+def _decode_into(slot: int, position: int, data: bytes, content_type: Optional[str], filename: Optional[str],
+                 size: Tuple[int, int]) -> Tuple[int, int]:
+    """Decode one upload into ring[slot, position]; same result as inference_engine.preprocess."""
+    image = decode_image(data, content_type, filename)
+    resized = image.convert("RGB").resize(size)
+    np.divide(np.asarray(resized), np.float32(255.0), out=_worker_ring[slot, position])
+    return image.width, image.height
+
+
+class DecodedSize:
+    """Original upload dimensions; stands in for the PIL image in gate and drift checks."""
+
+    __slots__ = ("width", "height")
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+
+
+RunBatch = Callable[[np.ndarray, List[Any]], Awaitable[None]]
+
+
+class RingBatch:
+    __slots__ = ("slot", "run_batch", "entries", "pending", "closed", "dispatched", "timer")
+
+    def __init__(self, slot: int, run_batch: RunBatch):
+        self.slot = slot
+        # Called with (ring view [n, H, W, 3], entries) on the event loop; owns the model call
+        self.run_batch = run_batch
+        # One entry per reserved position: the caller's pending item, or None for a hole
+        self.entries: List[Any] = []
+        self.pending = 0
+        self.closed = False
+        self.dispatched = False
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class ShmDecodePool:
+    def __init__(self, image_size: Tuple[int, int], batch_size: int, batch_wait_s: float,
+                 n_batches: int = SHM_BATCHES, workers: Optional[int] = None):
+        w, h = image_size
+        self.image_size = (w, h)
+        self.batch_size = batch_size
+        self.batch_wait_s = batch_wait_s
+        self.shape = (n_batches, batch_size, h, w, 3)
+        nbytes = int(np.prod(self.shape)) * np.dtype(np.float32).itemsize
+        self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self.ring = np.ndarray(self.shape, dtype=np.float32, buffer=self.shm.buf)
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=_attach, initargs=(self.shm.name, self.shape))
+        self._free: Deque[int] = deque(range(n_batches))
+        self._slot_waiters: Deque[asyncio.Future] = deque()
+        self._open: Dict[RunBatch, RingBatch] = {}
+        self._closed = False
+        self.stats = {"decoded": 0, "decode_errors": 0, "holes": 0, "batches": 0, "slot_waits": 0}
+        atexit.register(self.close)
+
+    # --- Reservation ---
+
+    async def reserve(self, run_batch: RunBatch) -> Tuple[RingBatch, int]:
+        """A position in the caller's open batch slot, waiting for a free slot if the ring is full."""
+        loop = asyncio.get_running_loop()
+        while run_batch not in self._open:
+            if self._free:
+                batch = RingBatch(self._free.popleft(), run_batch)
+                batch.timer = loop.call_later(self.batch_wait_s, self._close_batch, batch)
+                self._open[run_batch] = batch
+                break
+            self.stats["slot_waits"] += 1
+            waiter = loop.create_future()
+            self._slot_waiters.append(waiter)
+            await waiter
+        batch = self._open[run_batch]
+        position = len(batch.entries)
+        batch.entries.append(None)
+        batch.pending += 1
+        if len(batch.entries) >= self.batch_size:
+            self._close_batch(batch)
+        return batch, position
+
+    async def decode(self, batch: RingBatch, position: int, data: bytes, content_type: Optional[str] = None,
+                     filename: Optional[str] = None) -> DecodedSize:
+        """Decode an upload into its reserved position.
+
+        If the caller is cancelled, the position becomes a hole only after the
+        worker has finished writing, so a slot is never reused under a writer.
+        """
+        decode = asyncio.get_running_loop().run_in_executor(
+            self.executor, _decode_into, batch.slot, position, data, content_type, filename, self.image_size)
+        try:
+            width, height = await asyncio.shield(decode)
+        except asyncio.CancelledError:
+            decode.add_done_callback(lambda _: self.resolve(batch, position, None))
+            raise
+        except Exception:
+            self.stats["decode_errors"] += 1
+            self.resolve(batch, position, None)
+            raise
+        self.stats["decoded"] += 1
+        return DecodedSize(width, height)
+
+    def view(self, batch: RingBatch, position: int) -> np.ndarray:
+        return self.ring[batch.slot, position]
+
+    def resolve(self, batch: RingBatch, position: int, entry: Any):
+        """Mark a reserved position as ready (entry) or failed (None)."""
+        batch.entries[position] = entry
+        batch.pending -= 1
+        if entry is None:
+            self.stats["holes"] += 1
+        self._maybe_dispatch(batch)
+
+    # --- Dispatch ---
+
+    def _close_batch(self, batch: RingBatch):
+        if batch.closed:
+            return
+        batch.closed = True
+        if batch.timer is not None:
+            batch.timer.cancel()
+        if self._open.get(batch.run_batch) is batch:
+            del self._open[batch.run_batch]
+        self._maybe_dispatch(batch)
+
+    def _maybe_dispatch(self, batch: RingBatch):
+        if batch.closed and batch.pending == 0 and not batch.dispatched:
+            batch.dispatched = True
+            asyncio.get_running_loop().create_task(self._dispatch(batch))
+
+    async def _dispatch(self, batch: RingBatch):
+        try:
+            if any(entry is not None for entry in batch.entries):
+                self.stats["batches"] += 1
+                await batch.run_batch(self.ring[batch.slot, :len(batch.entries)], batch.entries)
+        finally:
+            self._release(batch.slot)
+
+    def _release(self, slot: int):
+        self._free.append(slot)
+        while self._slot_waiters:
+            waiter = self._slot_waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    # --- Lifecycle ---
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "slots": self.shape[0],
+            "free_slots": len(self._free),
+            "ring_mb": round(self.shm.size / (1024 * 1024), 1),
+            "workers": self.workers,
+        }
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        # Drop our view before closing the mapping
+        self.ring = None
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except (BufferError, FileNotFoundError):
+            pass
+
+
+_pools: Dict[Tuple[Tuple[int, int], int], ShmDecodePool] = {}
+
+
+def shared_pool(image_size: Tuple[int, int], batch_size: int, batch_wait_s: float,
+                workers: Optional[int] = None) -> ShmDecodePool:
+    """The process-wide pool for this input size and batch size."""
+    key = (tuple(image_size), batch_size)
+    if key not in _pools:
+        _pools[key] = ShmDecodePool(image_size, batch_size, batch_wait_s, workers=workers)
+    return _pools[key]
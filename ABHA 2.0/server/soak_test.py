@@ -0,0 +1,293 @@
+"""soak_test.py
+
+Long-running soak test that tracks memory growth of the inference services.
+
+Drives predictions for a long time with a mix of JPEG, PNG, PDF and animated
+GIF inputs, samples memory at a fixed interval and fails (exit code 1) when
+memory grows faster than the allowed slope after warm-up. The slope is a
+least-squares fit over all post-warm-up samples, so one-off spikes (cache
+fill, lazy model load) do not fail the run but steady growth does.
+
+Two modes:
+    HTTP        against a running inference_service / enhanced_inference_service
+                started with DEBUG_MEMORY=1; memory is read from GET /debug/memory
+    in-process  builds the inference engine in this process (--backend) and
+                samples it directly; no web server needed
+
+Usage examples:
+    DEBUG_MEMORY=1 python enhanced_inference_service.py &
+    python soak_test.py --url http://localhost:8002 --duration 4h
+    python soak_test.py --backend mock --duration 10m --sample-interval 5
+    python soak_test.py --backend keras --inputs ./chest_xray/test --max-rss-slope 10
+
+Arguments:
+    --url               Service base URL (HTTP mode)
+    --backend           In-process engine backend: mock, keras, ensemble, student, tflite, tflite_int8
+    --duration          Run time, e.g. 3600, 30m, 4h (default 1h)
+    --concurrency       Parallel clients (default 4)
+    --sample-interval   Seconds between memory samples (default 30)
+    --warmup            Fraction of samples ignored for the slope (default 0.2)
+    --max-rss-slope     Allowed RSS growth in MB/hour (default 20)
+    --max-heap-slope    Allowed traced Python heap growth in MB/hour (default 5)
+    --inputs            Directory of extra images/PDFs to mix in
+    --report            JSON report path (default soak_report.json)
+"""
+
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+from memory_probe import start_tracing, memory_snapshot
+
+Payload = Tuple[bytes, str, str]  # data, content type, filename
+MB = 1024 * 1024
+
+
+def parse_duration(value: str) -> float:
+    units = {"s": 1, "m": 60, "h": 3600}
+    value = value.strip().lower()
+    if value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Soak test the inference services and track memory growth")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help='Service base URL (started with DEBUG_MEMORY=1)')
+    target.add_argument('--backend', help='Run the inference engine in-process with this backend')
+    parser.add_argument('--duration', type=parse_duration, default=3600.0)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--sample-interval', type=float, default=30.0)
+    parser.add_argument('--warmup', type=float, default=0.2)
+    parser.add_argument('--max-rss-slope', type=float, default=20.0, help='MB/hour')
+    parser.add_argument('--max-heap-slope', type=float, default=5.0, help='MB/hour')
+    parser.add_argument('--inputs', default=None, help='Directory of extra images/PDFs')
+    parser.add_argument('--seed', type=int, default=1337)
+    parser.add_argument('--report', default='soak_report.json')
+    return parser.parse_args()
+
+
+# --- Inputs ---
+
+def synthetic_xray(rng: np.random.Generator, size: Tuple[int, int]) -> Image.Image:
+    """Grayscale radiograph-like image (passes the input gate)."""
+    w, h = size
+    y, x = np.mgrid[0:h, 0:w]
+    lungs = np.exp(-(((x - w * 0.33) / (w * 0.15)) ** 2 + ((y - h * 0.5) / (h * 0.3)) ** 2))
+    lungs += np.exp(-(((x - w * 0.67) / (w * 0.15)) ** 2 + ((y - h * 0.5) / (h * 0.3)) ** 2))
+    pixels = 0.7 - 0.4 * lungs + rng.normal(0, 0.05, (h, w))
+    return Image.fromarray((np.clip(pixels, 0, 1) * 255).astype(np.uint8), mode="L")
+
+
+def build_payloads(seed: int, inputs_dir: Optional[str] = None) -> List[Payload]:
+    """JPEG, PNG, single-page PDF and animated GIF variants of synthetic X-rays."""
+    rng = np.random.default_rng(seed)
+    payloads: List[Payload] = []
+    for i, size in enumerate([(512, 512), (1024, 900), (300, 360), (2048, 2048)]):
+        image = synthetic_xray(rng, size)
+        for fmt, content_type, kwargs in (("JPEG", "image/jpeg", {"quality": 90}), ("PNG", "image/png", {}),
+                                          ("PDF", "application/pdf", {})):
+            buf = io.BytesIO()
+            image.convert("RGB").save(buf, format=fmt, **kwargs)
+            payloads.append((buf.getvalue(), content_type, f"synthetic_{i}.{fmt.lower()}"))
+        frames = [image] + [synthetic_xray(rng, size) for _ in range(2)]
+        buf = io.BytesIO()
+        frames[0].save(buf, format="GIF", save_all=True, append_images=frames[1:], duration=100, loop=0)
+        payloads.append((buf.getvalue(), "image/gif", f"synthetic_{i}_animated.gif"))
+    if inputs_dir:
+        types = {".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".png": "image/png",
+                 ".gif": "image/gif", ".pdf": "application/pdf"}
+        for path in sorted(Path(inputs_dir).rglob("*")):
+            if path.suffix.lower() in types:
+                payloads.append((path.read_bytes(), types[path.suffix.lower()], path.name))
+    return payloads
+
+
+def mutate(payload: Payload, counter: int) -> Payload:
+    """Append a counter to the file bytes so the result cache does not hide leaks."""
+    data, content_type, filename = payload
+    return data + counter.to_bytes(8, "little"), content_type, filename
+
+
+# --- Targets ---
+
+class HttpTarget:
+    def __init__(self, url: str):
+        import requests
+        self.url = url.rstrip("/")
+        self.session = requests.Session()
+
+    def predict(self, payload: Payload):
+        data, content_type, filename = payload
+        response = self.session.post(f"{self.url}/predict", files={"file": (filename, data, content_type)}, timeout=120)
+        response.raise_for_status()
+
+    def sample(self) -> Dict[str, Any]:
+        response = self.session.get(f"{self.url}/debug/memory", params={"top": 15}, timeout=60)
+        if response.status_code == 404:
+            raise SystemExit("The service must be started with DEBUG_MEMORY=1 for memory sampling")
+        response.raise_for_status()
+        return response.json()
+
+
+class InProcessTarget:
+    def __init__(self, backend: str):
+        from inference_engine import ImageInput, create_engine
+        from input_gate import InputGate
+        start_tracing()
+        self._input = ImageInput
+        self.engine = create_engine(backend, gate=InputGate())
+
+    def predict(self, payload: Payload):
+        data, content_type, filename = payload
+        self.engine.predict([self._input(data, content_type, filename)])
+
+    def sample(self) -> Dict[str, Any]:
+        return memory_snapshot(15)
+
+
+# --- Analysis ---
+
+def growth_slope(samples: List[Dict[str, Any]], value: Callable[[Dict[str, Any]], Optional[float]],
+                 warmup: float) -> Optional[float]:
+    """Least-squares growth in MB/hour over the post-warm-up samples."""
+    points = [(s["elapsed_s"], value(s)) for s in samples[int(len(samples) * warmup):]]
+    points = [(t, v) for t, v in points if v is not None]
+    if len(points) < 3:
+        return None
+    t = np.array([p[0] for p in points]) / 3600.0
+    v = np.array([p[1] for p in points], dtype=np.float64) / MB
+    if np.ptp(t) == 0:
+        return None
+    return float(np.polyfit(t, v, 1)[0])
+
+
+def top_growth(first: Dict[str, Any], last: Dict[str, Any], limit: int = 10) -> List[Dict[str, Any]]:
+    """Allocation sites that grew most between two samples."""
+    before = {a["location"]: a["size_bytes"] for a in first["tracemalloc"]["top"]}
+    growth = [{"location": a["location"], "growth_bytes": a["size_bytes"] - before.get(a["location"], 0),
+               "size_bytes": a["size_bytes"]} for a in last["tracemalloc"]["top"]]
+    return sorted(growth, key=lambda g: g["growth_bytes"], reverse=True)[:limit]
+
+
+# --- Driver ---
+
+def run_soak(target, payloads: List[Payload], duration: float, concurrency: int,
+             sample_interval: float, seed: int) -> Dict[str, Any]:
+    stop = threading.Event()
+    lock = threading.Lock()
+    counters = {"requests": 0, "errors": 0}
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+
+    def client(worker: int):
+        rng = random.Random(seed + worker)
+        while not stop.is_set():
+            with lock:
+                counter = counters["requests"]
+                counters["requests"] += 1
+            start = time.perf_counter()
+            try:
+                target.predict(mutate(rng.choice(payloads), counter))
+                elapsed = time.perf_counter() - start
+                with lock:
+                    # Bounded reservoir of latencies so the harness itself does not grow
+                    if len(latencies) < 100000:
+                        latencies.append(elapsed)
+                    else:
+                        latencies[rng.randrange(len(latencies))] = elapsed
+            except Exception as e:
+                with lock:
+                    counters["errors"] += 1
+                    errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    samples: List[Dict[str, Any]] = []
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for worker in range(concurrency):
+            pool.submit(client, worker)
+        try:
+            while True:
+                elapsed = time.time() - started
+                sample = target.sample()
+                sample["elapsed_s"] = elapsed
+                sample["requests"] = counters["requests"]
+                samples.append(sample)
+                rss = sample.get("rss_bytes")
+                heap = sample["tracemalloc"].get("current_bytes")
+                print(f"[{elapsed / 60:7.1f} min] requests {counters['requests']:8d}  errors {counters['errors']:5d}  "
+                      f"RSS {rss / MB if rss else float('nan'):8.1f} MB  heap {heap / MB if heap else float('nan'):7.1f} MB")
+                if elapsed >= duration:
+                    break
+                time.sleep(min(sample_interval, max(0.0, duration - elapsed)))
+        finally:
+            stop.set()
+    return {"samples": samples, "requests": counters["requests"], "errors": counters["errors"],
+            "error_types": errors, "latency_s": latencies, "wall_time_s": time.time() - started}
+
+
+def main():
+    args = parse_args()
+    target = HttpTarget(args.url) if args.url else InProcessTarget(args.backend)
+    payloads = build_payloads(args.seed, args.inputs)
+    print(f"Soak test: {len(payloads)} inputs, {args.concurrency} clients, {args.duration / 60:.1f} min")
+
+    run = run_soak(target, payloads, args.duration, args.concurrency, args.sample_interval, args.seed)
+    samples = run["samples"]
+    rss_slope = growth_slope(samples, lambda s: s.get("rss_bytes"), args.warmup)
+    heap_slope = growth_slope(samples, lambda s: s["tracemalloc"].get("current_bytes"), args.warmup)
+    failures = []
+    if rss_slope is not None and rss_slope > args.max_rss_slope:
+        failures.append(f"RSS grows {rss_slope:.1f} MB/h (limit {args.max_rss_slope})")
+    if heap_slope is not None and heap_slope > args.max_heap_slope:
+        failures.append(f"Python heap grows {heap_slope:.1f} MB/h (limit {args.max_heap_slope})")
+    if rss_slope is None:
+        print("⚠️ Not enough samples after warm-up to compute a slope; increase --duration")
+
+    latencies = np.array(run["latency_s"]) * 1000 if run["latency_s"] else np.zeros(1)
+    warm_index = int(len(samples) * args.warmup)
+    report = {
+        "target": args.url or f"in-process:{args.backend}",
+        "duration_s": run["wall_time_s"],
+        "requests": run["requests"],
+        "errors": run["errors"],
+        "error_types": run["error_types"],
+        "latency_ms": {"p50": float(np.percentile(latencies, 50)), "p99": float(np.percentile(latencies, 99))},
+        "rss_slope_mb_per_hour": rss_slope,
+        "heap_slope_mb_per_hour": heap_slope,
+        "limits": {"rss_mb_per_hour": args.max_rss_slope, "heap_mb_per_hour": args.max_heap_slope},
+        "top_growth": top_growth(samples[min(warm_index, len(samples) - 1)], samples[-1]) if samples else [],
+        "passed": not failures,
+        "failures": failures,
+        "samples": [{**{k: v for k, v in s.items() if k != "tracemalloc"},
+                     "heap_bytes": s["tracemalloc"].get("current_bytes")} for s in samples],
+        "final_snapshot": samples[-1] if samples else None,
+    }
+    with open(args.report, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\nRequests: {run['requests']}  errors: {run['errors']}  "
+          f"p50 {report['latency_ms']['p50']:.1f} ms  p99 {report['latency_ms']['p99']:.1f} ms")
+    print(f"RSS slope: {rss_slope if rss_slope is not None else float('nan'):.2f} MB/h  "
+          f"heap slope: {heap_slope if heap_slope is not None else float('nan'):.2f} MB/h")
+    for growth in report["top_growth"][:5]:
+        print(f"  {growth['growth_bytes'] / 1024:10.1f} KiB  {growth['location']}")
+    print(f"Report saved to {args.report}")
+    if failures:
+        print("❌ Soak test failed: " + "; ".join(failures))
+        sys.exit(1)
+    print("✅ No memory growth beyond the limits")
+
+
+if __name__ == '__main__':
+    main()
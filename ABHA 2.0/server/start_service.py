@@ -12,32 +12,37 @@ import sys
 import subprocess
 import json
 from pathlib import Path
+from model_registry import ModelRegistry
 
 def check_models():
-    """Check for available trained models."""
+    """Check for available trained models in the model registry."""
     model_dir = Path(__file__).parent
-    keras_files = list(model_dir.glob("*.keras"))
+    registry = ModelRegistry(model_dir)
+    entries = registry.active_versions()
     
     print("🔍 Checking for trained models...")
     print("-" * 40)
     
-    if not keras_files:
+    if not entries:
         print("❌ No trained models found!")
         print("   Please train a model first using: python train_model.py")
         return False
     
-    for model_file in keras_files:
-        size_mb = model_file.stat().st_size / (1024 * 1024)
-        print(f"✅ {model_file.name} ({size_mb:.1f} MB)")
+    for entry in entries:
+        size_mb = entry["size_bytes"] / (1024 * 1024)
+        print(f"✅ {entry['name']} @ {entry['version_id']} ({size_mb:.1f} MB)")
         
         # Check for metrics
-        metrics_file = model_file.with_name(model_file.stem + "_metrics.json")
-        if metrics_file.exists():
+        if entry.get("metrics"):
             print(f"   📊 Metrics available")
         else:
             print(f"   ⚠️  No metrics file")
+        
+        extra_variants = sorted(set(entry.get("variants", {})) - {"keras"})
+        if extra_variants:
+            print(f"   📦 Variants: {', '.join(extra_variants)}")
     
-    print(f"\nFound {len(keras_files)} trained models")
+    print(f"\nFound {len(entries)} trained models (registry {registry.fingerprint()})")
     return True
 
 def start_enhanced_service():
@@ -0,0 +1,513 @@
+"""Hyperparameter sweep over train_model.py settings with successive halving.
+
+Runs many train_model configurations (learning rate, batch size, input size,
+augmentation, architecture) as trials in a pool of worker processes and ranks
+them in one leaderboard.
+
+Shared dataset cache
+    The dataset is decoded once per input size, with the serving decode path
+    (inference_engine.decode_image + RGB resize), into uint8 .npy files under
+    <out>/cache/<key>/. Trials memory-map these files read-only, so the page
+    cache is shared between trials and no trial decodes a JPEG.
+
+Thread budgets
+    Every trial runs in a fresh spawned process with its TF intra-op pool set
+    to --threads-per-trial, and on Linux it is pinned to its own CPU set, so
+    concurrent trials do not oversubscribe the cores.
+
+Successive halving (asynchronous, ASHA)
+    Rungs are at min_epochs * eta^k epochs, up to max_epochs. A trial that
+    finishes a rung is promoted to the next one if it is in the top 1/eta of
+    the results reported at that rung so far; otherwise a free worker starts
+    a new trial. Trials that are never promoted are stopped early. A promoted
+    trial resumes from its saved model (weights and optimizer state).
+
+After each rung, the trial is scored with train_model.compute_metrics on the
+validation split and its batch-1 CPU latency is measured with
+train_model.benchmark_model. The leaderboard (<out>/leaderboard.json) is
+rewritten after every result.
+
+Search space (JSON): a list is a set of choices, {"log_uniform": [lo, hi]} and
+{"uniform": [lo, hi]} are sampled (random search only), any other value is
+fixed. Example:
+
+    {"lr": {"log_uniform": [1e-5, 1e-3]}, "batch_size": [16, 32, 64],
+     "img_size": [[150, 150], [224, 224]], "augment": [true, false],
+     "arch": ["baseline", "gap", "separable"]}
+
+Usage:
+    python sweep.py --trials 16 --workers 4
+    python sweep.py --space space.json --grid --min-epochs 1 --max-epochs 9 --eta 3
+    python sweep.py --trials 8 --metric f1 --out sweeps/f1_run
+
+Arguments:
+    --space             Search space JSON file (default: DEFAULT_SPACE)
+    --data / -d         Base directory containing train/ and val/ (auto-detected if omitted)
+    --trials            Random configurations to sample (default 12)
+    --grid              Run every combination of the choices instead of sampling
+    --workers           Concurrent trials (default: cores / threads-per-trial)
+    --threads-per-trial TF intra-op threads per trial (default: cores / workers, or 2)
+    --min-epochs        Epochs at the first rung (default 1)
+    --max-epochs        Epochs at the last rung (default 9)
+    --eta               Promotion ratio between rungs (default 3)
+    --metric            Ranking metric from compute_metrics (default roc_auc)
+    --seed              Sampling and shuffle seed (default 1337)
+    --out               Output directory (default sweeps/latest)
+"""
+import os
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+
+DEFAULT_SPACE: Dict[str, Any] = {
+    "lr": {"log_uniform": [1e-5, 1e-3]},
+    "batch_size": [16, 32, 64],
+    "img_size": [[150, 150], [224, 224]],
+    "augment": [True, False],
+    "arch": ["baseline", "gap", "separable", "mobilenet"],
+}
+DEFAULTS: Dict[str, Any] = {"lr": 1e-4, "batch_size": 32, "img_size": [150, 150], "augment": True, "arch": "baseline"}
+IMAGE_EXTS = {".jpeg", ".jpg", ".png", ".bmp", ".gif"}
+# compute_metrics keys where smaller is better
+LOWER_IS_BETTER = {"log_loss", "brier_score", "mse"}
+
+
+# --- Search space ---
+
+def _is_distribution(value: Any) -> bool:
+    return isinstance(value, dict) and len(value) == 1 and next(iter(value)) in ("log_uniform", "uniform")
+
+
+def sample_space(space: Dict[str, Any], n: int, seed: int) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(n):
+        config = dict(DEFAULTS)
+        for key, value in space.items():
+            if _is_distribution(value):
+                kind, (lo, hi) = next(iter(value.items()))
+                config[key] = math.exp(rng.uniform(math.log(lo), math.log(hi))) if kind == "log_uniform" else rng.uniform(lo, hi)
+            elif isinstance(value, list):
+                config[key] = rng.choice(value)
+            else:
+                config[key] = value
+        configs.append(config)
+    return configs
+
+
+def grid_space(space: Dict[str, Any]) -> List[Dict[str, Any]]:
+    keys = list(space)
+    for key in keys:
+        if _is_distribution(space[key]):
+            raise ValueError(f"--grid needs explicit choices, '{key}' is a distribution")
+    choices = [space[k] if isinstance(space[k], list) else [space[k]] for k in keys]
+    return [{**DEFAULTS, **dict(zip(keys, combo))} for combo in itertools.product(*choices)]
+
+
+def rung_epochs(min_epochs: int, max_epochs: int, eta: int) -> List[int]:
+    rungs = []
+    epochs = max(1, min_epochs)
+    while epochs < max_epochs:
+        rungs.append(epochs)
+        epochs *= eta
+    rungs.append(max_epochs)
+    return rungs
+
+
+# --- Shared dataset cache ---
+
+def _list_split(split_dir: Path) -> Tuple[List[Path], List[int]]:
+    """Image paths and labels; classes are the sorted subdirectories (NORMAL=0, PNEUMONIA=1)."""
+    classes = sorted(p.name for p in split_dir.iterdir() if p.is_dir())
+    paths, labels = [], []
+    for label, name in enumerate(classes):
+        for path in sorted((split_dir / name).iterdir()):
+            if path.suffix.lower() in IMAGE_EXTS:
+                paths.append(path)
+                labels.append(label)
+    return paths, labels
+
+
+def _decode_for_cache(job: Tuple[str, Tuple[int, int]]) -> Optional[np.ndarray]:
+    from inference_engine import decode_image, ImageDecodeError
+    path, (h, w) = job
+    try:
+        image = decode_image(Path(path).read_bytes(), filename=Path(path).name)
+    except (ImageDecodeError, OSError):
+        return None
+    return np.asarray(image.convert("RGB").resize((w, h)), dtype=np.uint8)
+
+
+def cache_key(data_dir: Path, img_size: Tuple[int, int]) -> str:
+    digest = hashlib.sha256(f"{data_dir.resolve()}|{img_size[0]}x{img_size[1]}".encode())
+    for split in ("train", "val"):
+        for path in _list_split(data_dir / split)[0]:
+            stat = path.stat()
+            digest.update(f"{path.name}:{stat.st_size}:{int(stat.st_mtime)}".encode())
+    return digest.hexdigest()[:16]
+
+
+def build_cache(data_dir: Path, img_size: Tuple[int, int], cache_root: Path, workers: int) -> Path:
+    """Decode train/ and val/ once into <cache_root>/<key>/{split}_x.npy and {split}_y.npy."""
+    target = cache_root / cache_key(data_dir, img_size)
+    if (target / "meta.json").exists():
+        return target
+    target.mkdir(parents=True, exist_ok=True)
+    h, w = img_size
+    meta: Dict[str, Any] = {"data_dir": str(data_dir.resolve()), "img_size": [h, w]}
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(workers) as pool:
+        for split in ("train", "val"):
+            paths, labels = _list_split(data_dir / split)
+            start = time.perf_counter()
+            x = np.lib.format.open_memmap(target / f"{split}_x.npy", mode="w+", dtype=np.uint8,
+                                          shape=(len(paths), h, w, 3))
+            kept: List[int] = []
+            jobs = [(str(p), (h, w)) for p in paths]
+            for i, arr in enumerate(pool.imap(_decode_for_cache, jobs, chunksize=16)):
+                if arr is not None:
+                    x[len(kept)] = arr
+                    kept.append(labels[i])
+            x.flush()
+            del x
+            np.save(target / f"{split}_y.npy", np.asarray(kept, dtype=np.float32))
+            meta[split] = len(kept)
+            print(f"🗜️  Cached {split} at {h}x{w}: {len(kept)}/{len(paths)} images "
+                  f"in {time.perf_counter() - start:.1f}s")
+    with open(target / "meta.json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    return target
+
+
+def _load_split(cache_dir: Path, split: str) -> Tuple[np.ndarray, np.ndarray]:
+    with open(cache_dir / "meta.json", "r", encoding="utf-8") as f:
+        n = json.load(f)[split]
+    # Rows past n are left over from undecodable files
+    x = np.load(cache_dir / f"{split}_x.npy", mmap_mode="r")[:n]
+    y = np.load(cache_dir / f"{split}_y.npy")
+    return x, y
+
+
+# --- Trials (run in worker processes) ---
+
+def _cached_dataset(tf, x: np.ndarray, y: np.ndarray, batch_size: int, shuffle: bool, seed: int, augmentation=None):
+    n, h, w, c = x.shape
+
+    def load(idx):
+        idx = np.sort(idx)  # sequential reads from the memory map
+        return x[idx], y[idx]
+
+    ds = tf.data.Dataset.range(n)
+    if shuffle:
+        ds = ds.shuffle(n, seed=seed, reshuffle_each_iteration=True)
+    ds = ds.batch(batch_size)
+
+    def fetch(idx):
+        images, labels = tf.numpy_function(load, [idx], [tf.uint8, tf.float32])
+        images.set_shape((None, h, w, c))
+        labels.set_shape((None,))
+        return tf.cast(images, tf.float32) / 255.0, tf.expand_dims(labels, -1)
+
+    ds = ds.map(fetch, num_parallel_calls=tf.data.AUTOTUNE)
+    if augmentation is not None:
+        ds = ds.map(lambda a, b: (augmentation(a, training=True), b), num_parallel_calls=tf.data.AUTOTUNE)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+def run_trial(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Train one trial from job['from_epoch'] to job['to_epoch'] and score it."""
+    threads = job["threads"]
+    if job.get("cpus") and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, job["cpus"])
+    # Before TensorFlow (and its OpenMP/oneDNN pools) is imported
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    import tensorflow as tf
+    from tensorflow.keras.optimizers import Adam
+    from train_model import build_augmentation, build_model, benchmark_model, compute_metrics, configure_threads
+    configure_threads(threads, 1)
+
+    config = job["config"]
+    img_size = tuple(config["img_size"])
+    trial_dir = Path(job["trial_dir"])
+    trial_dir.mkdir(parents=True, exist_ok=True)
+    model_path = trial_dir / "model.keras"
+    cache_dir = Path(job["cache_dir"])
+    x_train, y_train = _load_split(cache_dir, "train")
+    x_val, y_val = _load_split(cache_dir, "val")
+
+    augmentation = build_augmentation() if config["augment"] else None
+    # A different seed per rung, so a resumed trial does not replay the same epoch order
+    train_ds = _cached_dataset(tf, x_train, y_train, config["batch_size"], True, job["seed"] + job["from_epoch"], augmentation)
+    val_ds = _cached_dataset(tf, x_val, y_val, config["batch_size"], False, job["seed"])
+
+    if job["from_epoch"] > 0 and model_path.exists():
+        model = tf.keras.models.load_model(model_path)
+    else:
+        model = build_model(img_size, arch=config["arch"])
+        model.compile(optimizer=Adam(learning_rate=config["lr"]), loss='binary_crossentropy', metrics=['accuracy'])
+
+    start = time.perf_counter()
+    history = model.fit(train_ds, validation_data=val_ds, initial_epoch=job["from_epoch"],
+                        epochs=job["to_epoch"], verbose=0)
+    train_s = time.perf_counter() - start
+    model.save(model_path)
+
+    y_prob = model.predict(val_ds, verbose=0).ravel()
+    metrics = compute_metrics(y_val.astype(int), y_prob)
+    bench = benchmark_model(model, img_size, batch_sizes=(1,), repeats=10, model_path=str(model_path))
+    return {
+        "trial": job["trial"],
+        "rung": job["rung"],
+        "epochs": job["to_epoch"],
+        "metrics": metrics,
+        "latency_ms": bench["latency_ms"]["batch_1"],
+        "params": bench["params"],
+        "file_size_mb": bench["file_size_mb"],
+        "history": {k: [float(v) for v in values] for k, values in history.history.items()},
+        "train_s": train_s,
+        "images_per_sec": len(y_train) * (job["to_epoch"] - job["from_epoch"]) / train_s if train_s > 0 else 0.0,
+    }
+
+
+# --- Scheduler ---
+
+def _score(result: Dict[str, Any], metric: str) -> float:
+    """Larger is better; NaN/missing ranks last."""
+    value = result["metrics"].get(metric)
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return -math.inf
+    return -value if metric in LOWER_IS_BETTER else value
+
+
+class Sweep:
+    def __init__(self, configs: List[Dict[str, Any]], data_dir: Path, out_dir: Path, workers: int,
+                 threads_per_trial: int, rungs: List[int], eta: int, metric: str, seed: int):
+        self.configs = configs
+        self.data_dir = data_dir
+        self.out_dir = out_dir
+        self.workers = workers
+        self.threads = threads_per_trial
+        self.rungs = rungs
+        self.eta = eta
+        self.metric = metric
+        self.seed = seed
+        self.trials: List[Dict[str, Any]] = [
+            {"trial": i, "config": config, "status": "pending", "rung": -1, "results": []}
+            for i, config in enumerate(configs)]
+        # rung index -> trials that reported there; promoted trial ids per rung
+        self.reported: List[List[Dict[str, Any]]] = [[] for _ in rungs]
+        self.promoted: List[set] = [set() for _ in rungs]
+        self._next_new = 0
+        self._caches: Dict[Tuple[int, int], Path] = {}
+        self._cpu_sets = self._split_cpus()
+        self.started_at = time.time()
+
+    def _split_cpus(self) -> List[Optional[List[int]]]:
+        if not hasattr(os, "sched_getaffinity"):
+            return [None] * self.workers
+        cpus = sorted(os.sched_getaffinity(0))
+        if len(cpus) < self.workers * self.threads:
+            # Not enough cores for disjoint sets; the thread budget still applies
+            return [None] * self.workers
+        return [cpus[i * self.threads:(i + 1) * self.threads] for i in range(self.workers)]
+
+    def _cache(self, img_size: Tuple[int, int]) -> Path:
+        if img_size not in self._caches:
+            self._caches[img_size] = build_cache(self.data_dir, img_size, self.out_dir / "cache",
+                                                 workers=os.cpu_count() or 1)
+        return self._caches[img_size]
+
+    def _next_job(self) -> Optional[Tuple[Dict[str, Any], int]]:
+        """(trial, rung) to run next: a promotion if one is due, else a new trial."""
+        for k in range(len(self.rungs) - 2, -1, -1):
+            ranked = sorted(self.reported[k], key=lambda r: _score(r, self.metric), reverse=True)
+            for result in ranked[:len(ranked) // self.eta]:
+                if result["trial"] not in self.promoted[k]:
+                    self.promoted[k].add(result["trial"])
+                    return self.trials[result["trial"]], k + 1
+        if self._next_new < len(self.trials):
+            trial = self.trials[self._next_new]
+            self._next_new += 1
+            return trial, 0
+        return None
+
+    def _job(self, trial: Dict[str, Any], rung: int, slot: int) -> Dict[str, Any]:
+        img_size = tuple(trial["config"]["img_size"])
+        return {
+            "trial": trial["trial"],
+            "rung": rung,
+            "config": trial["config"],
+            "from_epoch": self.rungs[rung - 1] if rung > 0 else 0,
+            "to_epoch": self.rungs[rung],
+            "cache_dir": str(self._cache(img_size)),
+            "trial_dir": str(self.out_dir / f"trial_{trial['trial']:03d}"),
+            "threads": self.threads,
+            "cpus": self._cpu_sets[slot],
+            "seed": self.seed + trial["trial"],
+        }
+
+    def run(self) -> Dict[str, Any]:
+        ctx = multiprocessing.get_context("spawn")
+        # One task per process: every trial gets a fresh TF runtime with its own thread budget
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx, max_tasks_per_child=1)
+        running: Dict[Future, Tuple[Dict[str, Any], int]] = {}
+        free_slots = list(range(self.workers))
+        try:
+            while True:
+                while free_slots:
+                    nxt = self._next_job()
+                    if nxt is None:
+                        break
+                    trial, rung = nxt
+                    slot = free_slots.pop()
+                    trial["status"] = "running"
+                    trial["rung"] = rung
+                    print(f"🚀 trial {trial['trial']:3d} rung {rung} -> {self.rungs[rung]} epochs  {_describe(trial['config'])}")
+                    running[executor.submit(run_trial, self._job(trial, rung, slot))] = (trial, slot)
+                if not running:
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    trial, slot = running.pop(future)
+                    free_slots.append(slot)
+                    self._record(trial, future)
+                self.write()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+        # Trials that reported but were never promoted were stopped by successive halving
+        for trial in self.trials:
+            if trial["status"] == "reported":
+                trial["status"] = "complete" if trial["rung"] == len(self.rungs) - 1 else "stopped"
+        return self.write()
+
+    def _record(self, trial: Dict[str, Any], future: Future):
+        try:
+            result = future.result()
+        except Exception as e:
+            trial["status"] = "failed"
+            trial["error"] = f"{type(e).__name__}: {e}"
+            print(f"❌ trial {trial['trial']:3d} failed: {trial['error']}")
+            return
+        trial["status"] = "reported"
+        trial["results"].append(result)
+        self.reported[result["rung"]].append(result)
+        value = result["metrics"].get(self.metric, float("nan"))
+        print(f"✅ trial {trial['trial']:3d} rung {result['rung']}: {self.metric}={value:.4f}  "
+              f"latency p50 {result['latency_ms']['p50']:.2f} ms  ({result['train_s']:.0f}s)")
+
+    def leaderboard(self) -> List[Dict[str, Any]]:
+        rows = []
+        for trial in self.trials:
+            last = trial["results"][-1] if trial["results"] else None
+            rows.append({
+                "trial": trial["trial"],
+                "status": trial["status"],
+                "config": trial["config"],
+                "epochs": last["epochs"] if last else 0,
+                "metrics": last["metrics"] if last else None,
+                "latency_ms": last["latency_ms"] if last else None,
+                "params": last["params"] if last else None,
+                "file_size_mb": last["file_size_mb"] if last else None,
+                "model_path": str(self.out_dir / f"trial_{trial['trial']:03d}" / "model.keras") if last else None,
+                "rungs": trial["results"],
+                **({"error": trial["error"]} if "error" in trial else {}),
+            })
+        # Deeper rungs first (more training), then by metric
+        rows.sort(key=lambda r: (r["epochs"], _score(r, self.metric) if r["metrics"] else -math.inf), reverse=True)
+        return rows
+
+    def write(self) -> Dict[str, Any]:
+        report = {
+            "started_at": self.started_at,
+            "updated_at": time.time(),
+            "metric": self.metric,
+            "rungs": self.rungs,
+            "eta": self.eta,
+            "workers": self.workers,
+            "threads_per_trial": self.threads,
+            "data_dir": str(self.data_dir),
+            "leaderboard": self.leaderboard(),
+        }
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.out_dir / "leaderboard.json", "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        return report
+
+
+def _describe(config: Dict[str, Any]) -> str:
+    h, w = config["img_size"]
+    return (f"arch={config['arch']} lr={config['lr']:.2e} bs={config['batch_size']} "
+            f"img={h}x{w} aug={'on' if config['augment'] else 'off'}")
+
+
+def format_leaderboard(report: Dict[str, Any], top: int = 20) -> str:
+    metric = report["metric"]
+    lines = [f"{'#':>3} {'trial':>5} {'status':9} {'ep':>3} {metric:>9} {'acc':>6} {'f1':>6} {'p50 ms':>8} {'params':>10}  config"]
+    for rank, row in enumerate(report["leaderboard"][:top], 1):
+        m = row["metrics"] or {}
+        latency = row["latency_ms"]["p50"] if row["latency_ms"] else float("nan")
+        params = f"{row['params']:,}" if row["params"] is not None else "-"
+        lines.append(f"{rank:>3} {row['trial']:>5} {row['status']:9} {row['epochs']:>3} "
+                     f"{m.get(metric, float('nan')):>9.4f} {m.get('accuracy', float('nan')):>6.3f} "
+                     f"{m.get('f1', float('nan')):>6.3f} {latency:>8.2f} {params:>10}  {_describe(row['config'])}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hyperparameter sweep with successive halving")
+    parser.add_argument("--space", default=None, help="Search space JSON file (default: built-in space)")
+    parser.add_argument("-d", "--data", default=os.getenv("DATA_DIR", None), help="Base directory containing train/ and val/")
+    parser.add_argument("--trials", type=int, default=12, help="Random configurations to sample")
+    parser.add_argument("--grid", action="store_true", help="Run every combination of the choices")
+    parser.add_argument("--workers", type=int, default=None, help="Concurrent trials")
+    parser.add_argument("--threads-per-trial", type=int, default=None, help="TF intra-op threads per trial")
+    parser.add_argument("--min-epochs", type=int, default=1, help="Epochs at the first rung")
+    parser.add_argument("--max-epochs", type=int, default=9, help="Epochs at the last rung")
+    parser.add_argument("--eta", type=int, default=3, help="Promotion ratio between rungs")
+    parser.add_argument("--metric", default="roc_auc", help="Ranking metric from compute_metrics")
+    parser.add_argument("--seed", type=int, default=1337, help="Sampling and shuffle seed")
+    parser.add_argument("--out", default=os.path.join("sweeps", "latest"), help="Output directory")
+    args = parser.parse_args()
+
+    if args.eta < 2:
+        parser.error("--eta must be at least 2")
+    space = DEFAULT_SPACE
+    if args.space:
+        with open(args.space, "r", encoding="utf-8") as f:
+            space = json.load(f)
+    configs = grid_space(space) if args.grid else sample_space(space, args.trials, args.seed)
+
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    if args.workers and args.threads_per_trial:
+        workers, threads = args.workers, args.threads_per_trial
+    elif args.workers:
+        workers, threads = args.workers, max(1, cores // args.workers)
+    else:
+        threads = args.threads_per_trial or min(2, cores)
+        workers = max(1, cores // threads)
+    workers = min(workers, len(configs))
+
+    from train_model import resolve_data_dir
+    data_dir = Path(resolve_data_dir(args.data))
+    rungs = rung_epochs(args.min_epochs, args.max_epochs, args.eta)
+    print(f"🔎 Sweep: {len(configs)} trials, rungs {rungs} epochs (eta {args.eta}), "
+          f"{workers} workers x {threads} threads, ranking by {args.metric}")
+
+    sweep = Sweep(configs, data_dir, Path(args.out), workers, threads, rungs, args.eta, args.metric, args.seed)
+    report = sweep.run()
+    print("\n" + format_leaderboard(report))
+    print(f"\n📝 Leaderboard written to {Path(args.out) / 'leaderboard.json'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Binary raw-tensor prediction protocol (POST /predict/tensor).
+
+For upstream systems that already hold decoded, resized pixels: tensors are
+sent as length-prefixed binary frames and go straight into the inference
+engine, skipping image encode/decode on both ends and JSON on the hot path.
+They still pass the engine's input gate and drift sketch like uploads (the gate
+sees no original upload, so its aspect-ratio rule does not apply).
+
+Request body: one or more frames, each `uint32 length` + frame bytes.
+A frame is a 24-byte little-endian header followed by the raw tensor:
+    magic   4s   b"PXT1"
+    dtype   u8   1 = uint8 (0-255), 2 = float32 (already scaled 0-1)
+    flags   u8   bit 0 = verbose (include per-model details)
+    -       u16  reserved
+    n, h, w, c   4 x u32, c in {1, 3}
+    data    n*h*w*c values, C-contiguous
+
+Response body (application/x-pneumonia-result):
+    magic b"PXR1", u32 count, f32 threshold
+    count records of: u8 status (0 NORMAL, 1 PNEUMONIA, 255 error), 3 pad bytes,
+                      f32 probability, f32 confidence
+    if any request frame was verbose: u32 length + UTF-8 JSON list with the
+    remaining result fields (individual_predictions, model_weights, ...)
+
+Clients can use `encode_request` / `decode_response` from this module.
+"""
+import json
+import struct
+from typing import Any, Dict, Iterable, List, Tuple
+import numpy as np
+
+MEDIA_TYPE = "application/x-pneumonia-tensor"
+RESULT_MEDIA_TYPE = "application/x-pneumonia-result"
+
+FRAME_MAGIC = b"PXT1"
+RESULT_MAGIC = b"PXR1"
+_LENGTH = struct.Struct("<I")
+_HEADER = struct.Struct("<4sBBHIIII")
+_RESULT_HEADER = struct.Struct("<4sIf")
+_RECORD = struct.Struct("<Bxxxff")
+
+DTYPES = {1: np.uint8, 2: np.float32}
+DTYPE_CODES = {np.dtype(np.uint8): 1, np.dtype(np.float32): 2}
+FLAG_VERBOSE = 0x01
+STATUS = {"NORMAL": 0, "PNEUMONIA": 1}
+STATUS_ERROR = 255
+LABELS = {v: k for k, v in STATUS.items()}
+# Fields packed into the compact record, so they are left out of the verbose JSON trailer
+COMPACT_FIELDS = ("prediction", "confidence", "threshold_used", "raw_probability", "calibrated_probability")
+MAX_FRAME_BYTES = 256 * 1024 * 1024
+
+
+class TensorProtocolError(ValueError):
+    """Malformed request body (services map this to HTTP 400)."""
+
+
+def decode_frames(body: bytes) -> Tuple[List[np.ndarray], bool]:
+    """Split a request body into per-image arrays and the verbose flag.
+
+    The arrays are read-only views into `body`, so decoding copies nothing; the
+    engine copies each image when it converts it to float32 and stacks the batch.
+    """
+    view = memoryview(body)
+    images: List[np.ndarray] = []
+    verbose = False
+    offset = 0
+    while offset < len(view):
+        if offset + _LENGTH.size > len(view):
+            raise TensorProtocolError("Truncated frame length")
+        (length,) = _LENGTH.unpack_from(view, offset)
+        offset += _LENGTH.size
+        if length < _HEADER.size or length > MAX_FRAME_BYTES or offset + length > len(view):
+            raise TensorProtocolError("Invalid frame length")
+        magic, dtype_code, flags, _, n, h, w, c = _HEADER.unpack_from(view, offset)
+        if magic != FRAME_MAGIC:
+            raise TensorProtocolError("Bad frame magic")
+        if dtype_code not in DTYPES:
+            raise TensorProtocolError(f"Unsupported dtype code {dtype_code}")
+        if c not in (1, 3):
+            raise TensorProtocolError("Channel count must be 1 or 3")
+        dtype = np.dtype(DTYPES[dtype_code]).newbyteorder("<")
+        expected = n * h * w * c * dtype.itemsize
+        if length - _HEADER.size != expected:
+            raise TensorProtocolError(f"Frame payload is {length - _HEADER.size} bytes, expected {expected}")
+        tensor = np.frombuffer(view, dtype=dtype, count=n * h * w * c, offset=offset + _HEADER.size)
+        images.extend(tensor.reshape(n, h, w, c))
+        verbose = verbose or bool(flags & FLAG_VERBOSE)
+        offset += length
+    if not images:
+        raise TensorProtocolError("Empty request")
+    return images, verbose
+
+
+def encode_results(results: List[Any], threshold: float, verbose: bool = False) -> bytes:
+    """Pack engine results (dicts or exceptions) into the binary response."""
+    parts = [_RESULT_HEADER.pack(RESULT_MAGIC, len(results), threshold)]
+    details: List[Dict[str, Any]] = []
+    for result in results:
+        if isinstance(result, Exception):
+            parts.append(_RECORD.pack(STATUS_ERROR, 0.0, 0.0))
+            details.append({"error": str(result)})
+            continue
+        prob = result.get("calibrated_probability", result.get("raw_probability", 0.0))
+        parts.append(_RECORD.pack(STATUS[result["prediction"]], prob, result["confidence"]))
+        details.append({k: v for k, v in result.items() if k not in COMPACT_FIELDS})
+    if verbose:
+        trailer = json.dumps(details, separators=(",", ":")).encode("utf-8")
+        parts.append(_LENGTH.pack(len(trailer)) + trailer)
+    return b"".join(parts)
+
+
+async def predict_tensor_request(engine, body: bytes, verbose: bool = False) -> bytes:
+    """Decode a request body, run it through the engine and encode the response."""
+    images, frame_verbose = decode_frames(body)
+    results = await engine.apredict(images, return_exceptions=True)
+    return encode_results(results, engine.threshold, verbose or frame_verbose)
+
+
+# --- Client helpers ---
+
+def encode_request(tensors: Iterable[np.ndarray], verbose: bool = False) -> bytes:
+    """Encode NxHxWxC (or HxWxC) uint8/float32 arrays as request frames."""
+    parts = []
+    for tensor in tensors:
+        tensor = np.asarray(tensor)
+        if tensor.ndim == 3:
+            tensor = tensor[None]
+        if tensor.dtype not in DTYPE_CODES:
+            tensor = tensor.astype(np.float32)
+        tensor = np.ascontiguousarray(tensor, dtype=tensor.dtype.newbyteorder("<"))
+        n, h, w, c = tensor.shape
+        header = _HEADER.pack(FRAME_MAGIC, DTYPE_CODES[np.dtype(tensor.dtype.type)], FLAG_VERBOSE if verbose else 0, 0, n, h, w, c)
+        payload = tensor.tobytes()
+        parts.append(_LENGTH.pack(len(header) + len(payload)) + header + payload)
+    return b"".join(parts)
+
+
+def decode_response(body: bytes) -> List[Dict[str, Any]]:
+    """Unpack a binary response into result dicts."""
+    magic, count, threshold = _RESULT_HEADER.unpack_from(body, 0)
+    if magic != RESULT_MAGIC:
+        raise TensorProtocolError("Bad result magic")
+    offset = _RESULT_HEADER.size
+    results = []
+    for _ in range(count):
+        status, prob, confidence = _RECORD.unpack_from(body, offset)
+        offset += _RECORD.size
+        if status == STATUS_ERROR:
+            results.append({"error": True})
+        else:
+            results.append({"prediction": LABELS[status], "probability": prob,
+                            "confidence": confidence, "threshold_used": threshold})
+    if offset < len(body):
+        (length,) = _LENGTH.unpack_from(body, offset)
+        details = json.loads(bytes(body[offset + _LENGTH.size:offset + _LENGTH.size + length]))
+        for result, extra in zip(results, details):
+            result.update(extra)
+    return results
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The server modules are flat scripts; make them importable as in the services
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
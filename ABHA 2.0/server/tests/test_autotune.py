@@ -0,0 +1,81 @@
+"""Autotune re-tune lock, profile fingerprint and when a re-tune starts."""
+import os
+
+import pytest
+
+import autotune
+from model_registry import ModelRegistry
+
+
+def write_model(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+
+
+@pytest.fixture
+def registry(tmp_path):
+    write_model(tmp_path / "a.keras", b"model a")
+    return ModelRegistry(tmp_path)
+
+
+def test_lock_is_exclusive_and_released_on_close(tmp_path):
+    lock_path = tmp_path / "autotune_profile.lock"
+    fd = autotune._acquire_lock(lock_path)
+    assert fd is not None
+    assert autotune._acquire_lock(lock_path) is None
+    os.close(fd)
+    # A leftover file is not a held lock
+    assert lock_path.exists()
+    again = autotune._acquire_lock(lock_path)
+    assert again is not None
+    os.close(again)
+
+
+def test_checkpoint_snapshots_do_not_change_the_fingerprint(tmp_path, registry):
+    before = autotune.models_fingerprint(registry)
+    write_model(tmp_path / "ckpt" / "a_epoch001.keras", b"snapshot")
+    registry.register(tmp_path / "ckpt" / "a_epoch001.keras", source="checkpoint")
+    assert autotune.models_fingerprint(registry) == before
+
+    write_model(tmp_path / "b.keras", b"model b")
+    registry.refresh()
+    assert autotune.models_fingerprint(registry) != before
+
+
+@pytest.fixture
+def retunes(monkeypatch):
+    started = []
+    monkeypatch.setattr(autotune, "AUTOTUNE_MODE", "auto")
+    monkeypatch.delenv("AUTOTUNE_PROFILE", raising=False)
+    monkeypatch.setattr(autotune, "retune_in_background", lambda model_dir, on_update=None: started.append(model_dir))
+    return started
+
+
+def profile(registry, fingerprint=None):
+    return {"profile_version": autotune.PROFILE_VERSION, "host": autotune.host_signature(),
+            "registry_fingerprint": fingerprint or autotune.models_fingerprint(registry), "models": {}}
+
+
+def test_missing_profile_is_tuned_in_the_background(tmp_path, registry, retunes):
+    assert autotune.ensure_profile(tmp_path, registry) is None
+    assert retunes == [tmp_path]
+
+
+def test_stale_profile_is_applied_without_a_retune(tmp_path, registry, retunes):
+    autotune.write_profile(tmp_path / autotune.PROFILE_NAME, profile(registry, fingerprint="old"))
+
+    loaded = autotune.ensure_profile(tmp_path, registry)
+
+    assert loaded is not None and autotune.profile_status(loaded, registry) == "stale"
+    assert retunes == []
+
+
+def test_fresh_profile_survives_a_training_snapshot(tmp_path, registry, retunes):
+    autotune.write_profile(tmp_path / autotune.PROFILE_NAME, profile(registry))
+    write_model(tmp_path / "ckpt" / "a_epoch002.keras", b"snapshot")
+    registry.register(tmp_path / "ckpt" / "a_epoch002.keras", source="checkpoint")
+
+    loaded = autotune.ensure_profile(tmp_path, registry)
+
+    assert autotune.profile_status(loaded, registry) == "fresh"
+    assert retunes == []
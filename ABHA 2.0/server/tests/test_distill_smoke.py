@@ -0,0 +1,44 @@
+"""One distillation step end to end on a tiny synthetic dataset (needs TensorFlow)."""
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+from PIL import Image
+
+from distill_model import load_split, teacher_targets, train_student, agreement
+from train_model import collect_probs_and_labels
+
+IMG_SIZE = (32, 32)
+
+
+class FakeEnsemble:
+    """Teacher with the ModelEnsemble.ensemble_probabilities interface."""
+
+    def ensemble_probabilities(self, batch):
+        brightness = batch.mean(axis=(1, 2, 3))
+        return {"members": {}, "ensemble": brightness, "calibrated": brightness}
+
+
+@pytest.fixture
+def split_dir(tmp_path):
+    rng = np.random.default_rng(0)
+    for label, level in (("NORMAL", 60), ("PNEUMONIA", 190)):
+        (tmp_path / label).mkdir()
+        for i in range(6):
+            pixels = np.clip(rng.normal(level, 20, IMG_SIZE + (3,)), 0, 255).astype(np.uint8)
+            Image.fromarray(pixels).save(tmp_path / label / f"{i}.png")
+    return tmp_path
+
+
+def test_distillation_step(split_dir):
+    ds = load_split(str(split_dir), 4, IMG_SIZE)
+    soft, hard = teacher_targets(FakeEnsemble(), ds)
+    assert soft.shape == hard.shape == (12,)
+    assert hard.sum() == 6
+
+    student = train_student(ds, 0.1 * hard + 0.9 * soft, IMG_SIZE, "gap", batch_size=4, lr=1e-3, epochs=1)
+    y_true, student_probs = collect_probs_and_labels(student, ds)
+    assert np.array_equal(y_true, hard)
+    report = agreement(student_probs, soft)
+    assert 0.0 <= report["label_agreement_at_0.5"] <= 1.0
+    assert np.isfinite(report["mean_abs_prob_diff"])
@@ -0,0 +1,64 @@
+"""InferenceEngine batching, caching and ordering against the mock backend."""
+import asyncio
+import io
+
+import numpy as np
+from PIL import Image
+
+from inference_engine import ImageDecodeError, ImageInput, InferenceEngine, MockBackend
+
+
+def png_bytes(seed: int, size=(12, 10)) -> bytes:
+    gray = np.random.default_rng(seed).integers(30, 220, size=(size[1], size[0]), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(gray).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def engine(**kwargs) -> InferenceEngine:
+    return InferenceEngine(MockBackend(), image_size=(8, 8), **kwargs)
+
+
+def test_predict_batches_and_keeps_order():
+    eng = engine(max_batch_size=2, cache_size=0)
+    uploads = [png_bytes(i) for i in range(5)]
+
+    results = eng.predict(uploads)
+
+    assert eng.stats["batches"] == 3
+    assert eng.stats["batched_items"] == 5
+    # Same inputs one by one give the same, deterministic results
+    assert [r["raw_probability"] for r in results] == [eng.predict([u])[0]["raw_probability"] for u in uploads]
+    for r in results:
+        assert r["prediction"] == ("PNEUMONIA" if r["raw_probability"] >= eng.threshold else "NORMAL")
+
+
+def test_cache_hits_skip_the_model():
+    eng = engine()
+    data = png_bytes(0)
+    first = eng.predict([ImageInput(data, "image/png", "a.png")])[0]
+    second = eng.predict([data])[0]
+
+    assert second == first
+    assert eng.stats["cache_hits"] == 1
+    assert eng.stats["batched_items"] == 1
+
+
+def test_decode_errors():
+    eng = engine()
+    results = eng.predict([b"not an image", png_bytes(1)], return_exceptions=True)
+    assert isinstance(results[0], ImageDecodeError)
+    assert "prediction" in results[1]
+
+
+def test_concurrent_async_callers_share_batches():
+    eng = engine(max_batch_size=8, batch_wait_ms=20, cache_size=0)
+
+    async def run():
+        return await asyncio.gather(*(eng.apredict([png_bytes(i)]) for i in range(6)))
+
+    results = asyncio.run(run())
+
+    assert len(results) == 6
+    assert eng.stats["batched_items"] == 6
+    assert eng.stats["batches"] < 6
@@ -0,0 +1,174 @@
+"""JobQueue leases, exactly-once completion, retention and the JobWorker loop."""
+import asyncio
+import io
+import json
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import job_queue
+from inference_engine import ImageInput, InferenceEngine, MockBackend
+from job_queue import JobQueue, JobWorker
+from request_scheduler import BATCH, INTERACTIVE, ClassConfig, FairScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(job_queue, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(tmp_path / "jobs.sqlite3", lease_s=60, max_attempts=2)
+
+
+def png(seed: int) -> bytes:
+    gray = np.random.default_rng(seed).integers(30, 220, size=(10, 10), dtype=np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(gray).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def submit(queue, n=2, **kwargs):
+    return queue.submit([ImageInput(png(i), "image/png", f"{i}.png") for i in range(n)], **kwargs)
+
+
+def test_claim_leases_rows_and_loads_items_separately(queue, clock):
+    job_id = submit(queue, 3, client="c1", meta={"filenames": ["0.png", "1.png", "2.png"]})
+
+    jobs = queue.claim("w1")
+
+    assert [job["id"] for job in jobs] == [job_id]
+    assert "items" not in jobs[0]
+    assert jobs[0]["n_items"] == 3 and jobs[0]["attempts"] == 1
+    assert [item.filename for item in queue.items(job_id)] == ["0.png", "1.png", "2.png"]
+    # Leased jobs are not handed out twice
+    assert queue.claim("w2") == []
+
+
+def test_expired_lease_is_reclaimed_and_only_the_owner_completes(queue, clock):
+    job_id = submit(queue)
+    queue.claim("w1")
+    clock.now += 61
+
+    assert [job["id"] for job in queue.claim("w2")] == [job_id]
+    assert queue.complete(job_id, "w1", [{"stale": True}]) is False
+    assert queue.complete(job_id, "w2", [{"ok": 1}]) is True
+    assert queue.complete(job_id, "w2", [{"ok": 2}]) is False
+
+    job = queue.get(job_id)
+    assert job["status"] == "done" and job["results"] == [{"ok": 1}] and job["attempts"] == 2
+    assert queue.items(job_id) == []
+
+
+def test_renew_keeps_the_lease(queue, clock):
+    job_id = submit(queue)
+    queue.claim("w1")
+    clock.now += 50
+    queue.renew([job_id], "w1")
+    clock.now += 50
+    assert queue.claim("w2") == []
+
+
+def test_lease_expiring_on_last_attempt_fails_the_job(queue, clock):
+    job_id = submit(queue)
+    queue.claim("w1")
+    clock.now += 61
+    queue.claim("w2")
+    clock.now += 61
+
+    assert queue.claim("w3") == []
+    job = queue.get(job_id)
+    assert job["status"] == "failed" and "Lease expired" in job["error"]
+
+
+def test_fail_requeues_until_max_attempts(queue, clock):
+    job_id = submit(queue)
+    queue.claim("w1")
+    assert queue.fail(job_id, "w1", "boom") is True
+    assert queue.get(job_id)["status"] == "queued"
+    queue.claim("w1")
+    queue.fail(job_id, "w1", "boom again")
+    assert queue.get(job_id)["status"] == "failed"
+    # Not the lease owner any more
+    assert queue.fail(job_id, "w1", "late") is False
+
+
+def test_purge_removes_only_old_finished_jobs(queue, clock):
+    done = submit(queue)
+    queue.claim("w1")
+    queue.complete(done, "w1", [])
+    pending = submit(queue)
+    clock.now += 100
+    assert queue.purge(50) == 1
+    assert queue.get(done) is None
+    assert queue.get(pending)["status"] == "queued"
+
+
+def run_worker(worker, until, timeout=5.0):
+    async def main():
+        worker.start()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not until() and loop.time() < deadline:
+            await asyncio.sleep(0.01)
+        await worker.stop()
+    asyncio.run(main())
+
+
+def test_worker_completes_jobs_and_survives_a_failing_hook(queue):
+    engine = InferenceEngine(MockBackend(), image_size=(8, 8))
+    job_id = submit(queue, 2, meta={"filenames": ["0.png", "1.png"]})
+    seen = []
+
+    def hook(job, results):
+        seen.append((json.loads(job["meta"])["filenames"], len(results)))
+        raise RuntimeError("log down")
+
+    worker = JobWorker(queue, lambda: engine, poll_s=0.01, on_results=hook, retention_s=0)
+    run_worker(worker, lambda: queue.get(job_id)["status"] == "done" and seen)
+
+    job = queue.get(job_id)
+    assert job["status"] == "done" and job["attempts"] == 1
+    assert all("prediction" in r for r in job["results"])
+    assert seen == [(["0.png", "1.png"], 2)]
+    assert worker.stats["jobs_done"] == 1 and worker.stats["jobs_failed"] == 0
+
+
+def test_worker_purges_expired_jobs(queue, clock):
+    old = submit(queue)
+    queue.claim("w1")
+    queue.complete(old, "w1", [])
+    clock.now += 1000
+    worker = JobWorker(queue, lambda: None, poll_s=0.01, retention_s=500)
+
+    run_worker(worker, lambda: worker.stats["jobs_purged"])
+
+    assert queue.get(old) is None
+
+
+def test_worker_runs_large_jobs_in_scheduler_sized_chunks(queue):
+    sched = FairScheduler([ClassConfig(INTERACTIVE, 0, 4), ClassConfig(BATCH, 1, 2)],
+                          total_concurrency=4, client_weights={}, reserve=1)
+    engine = InferenceEngine(MockBackend(), image_size=(8, 8))
+    job_id = submit(queue, 5)
+    worker = JobWorker(queue, lambda: engine, poll_s=0.01, scheduler=sched, retention_s=0)
+
+    run_worker(worker, lambda: queue.get(job_id)["status"] == "done")
+
+    assert len(queue.get(job_id)["results"]) == 5
+    assert sched.describe()["classes"][BATCH]["admitted"] == 3
@@ -0,0 +1,81 @@
+"""ModelEnsemble input pyramid and one-time member warm-up (fake members, no TensorFlow)."""
+import numpy as np
+from PIL import Image
+
+import model_ensemble
+from inference_engine import preprocess
+from model_ensemble import ModelEnsemble, resize_batch
+from model_registry import ModelRegistry
+
+
+class FakeMember:
+    """Stands in for a LazyModel; predicts the mean brightness of each input."""
+
+    def __init__(self, name):
+        self.name = name
+        self.loaded = False
+        self.inputs = []
+
+    def predict(self, batch, verbose=0):
+        self.inputs.append(batch)
+        return batch.mean(axis=(1, 2, 3))[:, None]
+
+
+def ensemble_with(tmp_path, sizes):
+    ensemble = ModelEnsemble(ModelRegistry(tmp_path), members=["none"])
+    ensemble.models = {f"m{w}": FakeMember(f"m{w}") for w, _ in sizes}
+    ensemble.model_metadata = {f"m{w}": {"name": f"m{w}", "input_shape": [None, h, w, 3]} for w, h in sizes}
+    ensemble.model_versions = {name: f"{name}-v1" for name in ensemble.models}
+    ensemble.group_by_input_size()
+    return ensemble
+
+
+def photo(seed, size=(300, 260)):
+    gray = np.random.default_rng(seed).integers(0, 256, size=(size[1], size[0]), dtype=np.uint8)
+    return Image.fromarray(gray)
+
+
+def test_resize_batch_matches_preprocess():
+    top = np.stack([preprocess(photo(i), (224, 224)) for i in range(2)])
+    small = resize_batch(top, (150, 120))
+    assert small.shape == (2, 120, 150, 3) and small.dtype == np.float32
+    for i in range(2):
+        pil_top = Image.fromarray(np.rint(top[i] * 255).astype(np.uint8))
+        np.testing.assert_array_equal(small[i], preprocess(pil_top, (150, 120)))
+
+
+def test_pyramid_levels_are_resampled_from_the_top(tmp_path):
+    ensemble = ensemble_with(tmp_path, [(224, 224), (150, 150), (96, 96)])
+    assert ensemble.input_size == (224, 224)
+    top = np.stack([preprocess(photo(0), ensemble.input_size)])
+
+    levels = ensemble.input_pyramid(top)
+
+    assert list(levels) == [(224, 224), (150, 150), (96, 96)]
+    assert levels[(224, 224)] is top
+    np.testing.assert_array_equal(levels[(96, 96)], resize_batch(top, (96, 96)))
+
+
+def test_members_are_warmed_once_per_load(tmp_path, monkeypatch):
+    calls = []
+
+    def load(models):
+        models = list(models)
+        calls.append([m.name for m in models])
+        for m in models:
+            m.loaded = True
+        return {m.name: None for m in models}
+
+    monkeypatch.setattr(model_ensemble, "load_models_parallel", load)
+    ensemble = ensemble_with(tmp_path, [(64, 64), (32, 32)])
+    batch = np.stack([preprocess(photo(1), (64, 64))])
+
+    for _ in range(3):
+        probs = ensemble.ensemble_probabilities(batch)
+
+    assert len(calls) == 1
+    assert set(probs["members"]) == {"m64", "m32"}
+    assert ensemble.models["m32"].inputs[0].shape == (1, 32, 32, 3)
+    # A reload re-arms the warm-up
+    ensemble.load_available_models()
+    assert ensemble._warm is False
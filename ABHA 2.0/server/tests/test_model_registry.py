@@ -0,0 +1,84 @@
+import json
+import os
+import shutil
+
+from model_registry import ModelRegistry, REGISTRY_FILE
+
+
+def write_model(path, content: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return path
+
+
+def on_disk_paths(model_dir):
+    with open(model_dir / REGISTRY_FILE, "r", encoding="utf-8") as f:
+        versions = json.load(f)["versions"]
+    return sorted(e["path"] for e in versions.values() if e.get("active", True))
+
+
+def test_refresh_registers_and_is_idempotent(tmp_path):
+    write_model(tmp_path / "a.keras", b"model a")
+    registry = ModelRegistry(tmp_path, auto_refresh=False)
+    assert registry.refresh() is True
+    assert registry.refresh() is False
+    assert registry.resolve("a.keras")["path"] == "a.keras"
+
+
+def test_modified_file_supersedes_old_version(tmp_path):
+    model = write_model(tmp_path / "a.keras", b"version 1")
+    registry = ModelRegistry(tmp_path)
+    old_id = registry.resolve("a.keras")["version_id"]
+
+    model.write_bytes(b"version 2, longer")
+    assert registry.refresh() is True
+    entry = registry.resolve("a.keras")
+    assert entry["version_id"] != old_id
+    assert registry.get(old_id)["active"] is False
+    assert [e["version_id"] for e in registry.active_versions()] == [entry["version_id"]]
+
+
+def test_identical_files_are_separate_entries(tmp_path):
+    write_model(tmp_path / "best.keras", b"same bytes")
+    shutil.copy(tmp_path / "best.keras", tmp_path / "pneumonia_detection_model.keras")
+    registry = ModelRegistry(tmp_path, auto_refresh=False)
+    assert registry.refresh() is True
+    assert [registry.refresh() for _ in range(3)] == [False, False, False]
+    assert registry.resolve("best.keras")["path"] == "best.keras"
+    assert registry.resolve("pneumonia_detection_model.keras")["path"] == "pneumonia_detection_model.keras"
+    assert len(registry.active_versions()) == 2
+
+
+def test_refresh_keeps_entries_registered_by_another_process(tmp_path):
+    write_model(tmp_path / "a.keras", b"model a")
+    service = ModelRegistry(tmp_path)
+    trainer = ModelRegistry(tmp_path)
+
+    snapshot = write_model(tmp_path / "ckpt" / "a_epoch001.keras", b"snapshot")
+    trainer.register(snapshot, source="checkpoint")
+    write_model(tmp_path / "b.keras", b"model b")
+    write_model(tmp_path / "c.keras", b"model c")
+    os.remove(tmp_path / "a.keras")
+
+    assert service.refresh() is True
+    assert on_disk_paths(tmp_path) == ["b.keras", "c.keras", "ckpt/a_epoch001.keras"]
+    assert service.resolve("ckpt/a_epoch001.keras")["source"] == "checkpoint"
+    assert service.resolve("a_epoch001.keras") is not None
+
+
+def test_save_merges_instead_of_overwriting(tmp_path):
+    first = ModelRegistry(tmp_path)
+    second = ModelRegistry(tmp_path)
+    first.register(write_model(tmp_path / "x.keras", b"x"))
+    second.register(write_model(tmp_path / "y.keras", b"y"))
+    assert on_disk_paths(tmp_path) == ["x.keras", "y.keras"]
+
+
+def test_reads_version_1_index(tmp_path):
+    write_model(tmp_path / "a.keras", b"model a")
+    legacy = ModelRegistry(tmp_path).resolve("a.keras")
+    with open(tmp_path / REGISTRY_FILE, "w", encoding="utf-8") as f:
+        json.dump({"registry_version": 1, "versions": {legacy["version_id"]: legacy}}, f)
+    registry = ModelRegistry(tmp_path, auto_refresh=False)
+    assert registry.resolve(legacy["version_id"])["path"] == "a.keras"
+    assert registry.refresh() is False
@@ -0,0 +1,104 @@
+"""DegradationController escalation, hysteresis and request cost."""
+import pytest
+
+import overload_control
+from overload_control import DegradationController, Overloaded
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(overload_control.time, "monotonic", clock)
+    return clock
+
+
+def controller(**kwargs):
+    return DegradationController(queue_limits=(4, 8, 12), latency_limits_ms=(100, 200, 400),
+                                 recovery_s=5, window_s=10, recovery_ratio=0.5, enabled=True, **kwargs)
+
+
+def test_cost_counts_every_image(clock):
+    ctl = controller()
+    assert ctl.acquire(cost=4) == "full"
+    assert ctl.in_flight == 4
+    # The depth is checked before the new request is added
+    assert ctl.acquire() == "single"
+    assert ctl.acquire(cost=3) == "single"
+    assert ctl.acquire() == "quantized"
+    ctl.acquire(cost=4)
+    with pytest.raises(Overloaded):
+        ctl.acquire()
+    # A shed request is not outstanding
+    assert ctl.in_flight == 13
+
+
+def test_recovers_one_tier_at_a_time(clock):
+    ctl = controller()
+    ctl.acquire(cost=12)
+    with pytest.raises(Overloaded):
+        ctl.acquire()
+    ctl.release(0.01, cost=12)
+
+    # Calm starts counting at the first check below the recovery thresholds
+    assert ctl.describe()["tier"] == "shed"
+    clock.now += 4.9
+    assert ctl.describe()["tier"] == "shed"
+    clock.now += 0.2
+    assert ctl.describe()["tier"] == "quantized"
+    clock.now += 5.1
+    assert ctl.describe()["tier"] == "single"
+    clock.now += 5.1
+    assert ctl.describe()["tier"] == "full"
+    assert ctl.stats["transitions"] == 4
+
+
+def test_no_recovery_between_recovery_and_escalation_thresholds(clock):
+    ctl = controller()
+    ctl.acquire(cost=4)
+    assert ctl.acquire() == "single"
+    ctl.release(0.01, cost=2)
+    # Depth 3 is below the escalation limit (4) but above 0.5 x 4, so the tier holds
+    for _ in range(5):
+        clock.now += 5
+        assert ctl.describe()["tier"] == "single"
+    ctl.release(0.01, cost=2)
+    clock.now += 1
+    ctl.describe()
+    clock.now += 5
+    assert ctl.describe()["tier"] == "full"
+
+
+def test_latency_escalates_and_ages_out(clock):
+    ctl = controller()
+    ctl.acquire()
+    ctl.release(0.25)
+    assert ctl.acquire() == "quantized"
+    ctl.release(0.01)
+    # Slow requests leave the window, then recovery proceeds as usual
+    clock.now += 11
+    ctl.describe()
+    clock.now += 5
+    assert ctl.describe()["tier"] == "single"
+
+
+def test_admit_releases_cost_on_error(clock):
+    ctl = controller()
+    with pytest.raises(RuntimeError):
+        with ctl.admit(cost=3):
+            assert ctl.in_flight == 3
+            raise RuntimeError("boom")
+    assert ctl.in_flight == 0
+
+
+def test_disabled_controller_always_serves_full(clock):
+    ctl = DegradationController(queue_limits=(1, 2, 3), latency_limits_ms=(1, 2, 3), enabled=False)
+    for _ in range(5):
+        assert ctl.acquire(cost=10) == "full"
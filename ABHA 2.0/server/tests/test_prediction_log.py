@@ -0,0 +1,86 @@
+"""PredictionLog write-behind flush, compaction and queries."""
+import shutil
+
+import prediction_log
+from prediction_log import PredictionLog, query_log
+
+
+def result(i: int):
+    return {"prediction": "PNEUMONIA" if i % 2 else "NORMAL", "confidence": 0.8, "threshold_used": 0.3,
+            "raw_probability": 0.1 * i, "calibrated_probability": 0.1 * i, "content_hash": f"h{i}",
+            "model_versions": {"m": "v1"}}
+
+
+def fill(log, n, per_flush=2):
+    for i in range(n):
+        log.record(result(i), latency_ms=5.0, endpoint="/predict", record_id=f"r{i}")
+        if (i + 1) % per_flush == 0:
+            log.flush()
+    log.flush()
+
+
+def test_flush_writes_buffered_rows_and_skips_errors(tmp_path):
+    log = PredictionLog(tmp_path, start=False)
+    log.record(result(1), latency_ms=3.0, endpoint="/predict")
+    log.record(ValueError("bad"))
+    assert log.describe()["buffered"] == 1
+
+    assert log.flush() == 1
+    assert log.flush() == 0
+    rows = log.query(content_hash="h1")
+    assert len(rows) == 1
+    assert rows[0]["prediction"] == "PNEUMONIA"
+    assert rows[0]["model_versions"] == {"m": "v1"}
+    assert rows[0]["client"] is None
+    log.close()
+
+
+def test_ring_drops_oldest_when_full(tmp_path):
+    log = PredictionLog(tmp_path, ring_size=2, start=False)
+    for i in range(3):
+        log.record(result(i))
+    log.flush()
+    assert log.stats["dropped"] == 1
+    assert [r["content_hash"] for r in log.query()] == ["h2", "h1"]
+    log.close()
+
+
+def test_query_filters_including_zero_bounds(tmp_path):
+    log = PredictionLog(tmp_path, start=False)
+    fill(log, 3)
+    assert len(log.query(since=0)) == 3
+    assert log.query(until=0) == []
+    assert [r["record_id"] for r in log.query(record_id="r2")] == ["r2"]
+    assert len(log.query(limit=2)) == 2
+    log.close()
+
+
+def test_compact_moves_closed_segments_and_keeps_results(tmp_path, monkeypatch):
+    monkeypatch.setattr(prediction_log, "_HAS_PYARROW", False)
+    log = PredictionLog(tmp_path, segment_records=2, start=False)
+    fill(log, 5)
+    before = log.query()
+    assert log.describe()["hot_segments"] == 3
+
+    log.close()
+    target = log.compact()
+
+    assert target is not None and target.suffix == ".npz"
+    assert log.describe()["hot_segments"] == 0
+    assert log.query() == before
+    assert query_log(tmp_path, until=0) == []
+    assert [r["content_hash"] for r in query_log(tmp_path, content_hash="h3")] == ["h3"]
+
+
+def test_rows_in_both_a_segment_and_a_compacted_file_are_returned_once(tmp_path, monkeypatch):
+    monkeypatch.setattr(prediction_log, "_HAS_PYARROW", False)
+    log = PredictionLog(tmp_path, start=False)
+    fill(log, 4)
+    log.close()
+    segment = next(tmp_path.glob("segment-*.sqlite3"))
+    shutil.copy(segment, tmp_path / "copy.tmp")
+    log.compact()
+    # A query that read the segment just before compaction deleted it
+    shutil.copy(tmp_path / "copy.tmp", segment)
+
+    assert len(query_log(tmp_path)) == 4
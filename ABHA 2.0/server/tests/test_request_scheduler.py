@@ -0,0 +1,118 @@
+"""FairScheduler priority, weighted fair queuing, limits and the token bucket."""
+import asyncio
+
+import pytest
+
+from request_scheduler import BATCH, INTERACTIVE, ClassConfig, FairScheduler, QueueFull
+
+
+def scheduler(total=4, interactive=4, batch=2, reserve=1, batch_rate=0.0, batch_queue=0, weights=None):
+    return FairScheduler([ClassConfig(INTERACTIVE, 0, interactive),
+                          ClassConfig(BATCH, 1, batch, batch_rate, max_queue=batch_queue)],
+                         total_concurrency=total, client_weights=weights or {}, reserve=reserve)
+
+
+async def hold(sched, cls, client, order, cost=1.0):
+    async with sched.slot(cls, client, cost):
+        order.append((cls, client))
+        await asyncio.sleep(0)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_interactive_is_admitted_before_batch():
+    async def main():
+        sched = scheduler(total=1, reserve=0)
+        order = []
+        blocker = await sched.acquire(INTERACTIVE, "x")
+        tasks = [asyncio.ensure_future(hold(sched, BATCH, f"b{i}", order)) for i in range(3)]
+        tasks += [asyncio.ensure_future(hold(sched, INTERACTIVE, f"i{i}", order)) for i in range(2)]
+        await settle()
+        sched.release(INTERACTIVE)
+        await asyncio.gather(*tasks)
+        return blocker, order
+
+    _, order = asyncio.run(main())
+    assert [cls for cls, _ in order] == [INTERACTIVE] * 2 + [BATCH] * 3
+
+
+def test_weighted_fair_order_within_a_class():
+    async def main():
+        sched = scheduler(total=1, interactive=1, reserve=0, weights={"heavy": 2})
+        order = []
+        await sched.acquire(INTERACTIVE, "x")
+        tasks = [asyncio.ensure_future(hold(sched, INTERACTIVE, "light", order)) for _ in range(4)]
+        tasks += [asyncio.ensure_future(hold(sched, INTERACTIVE, "heavy", order)) for _ in range(4)]
+        await settle()
+        sched.release(INTERACTIVE)
+        await asyncio.gather(*tasks)
+        return order
+
+    clients = [client for _, client in asyncio.run(main())]
+    # Virtual finish times: light 1,2,3,4; heavy 0.5,1,1.5,2 (ties go to the earlier arrival)
+    assert clients == ["heavy", "light", "heavy", "heavy", "light", "heavy", "light", "light"]
+
+
+def test_batch_leaves_headroom_for_interactive():
+    async def main():
+        sched = scheduler(total=4, interactive=4, batch=4, reserve=2)
+        assert sched.max_cost(BATCH) == 2
+        with pytest.raises(ValueError, match="split"):
+            await sched.acquire(BATCH, "b", cost=3)
+        await sched.acquire(BATCH, "b", cost=2)
+        waiting = asyncio.ensure_future(sched.acquire(BATCH, "b", cost=1))
+        await settle()
+        assert not waiting.done()
+        # The reserved capacity still admits interactive work immediately
+        await asyncio.wait_for(sched.acquire(INTERACTIVE, "i", cost=2), 0.1)
+        waiting.cancel()
+        return sched
+
+    sched = asyncio.run(main())
+    assert sched.describe()["classes"][BATCH]["waiting"] == 0
+
+
+def test_queue_limit_rejects():
+    async def main():
+        sched = scheduler(total=1, batch=1, reserve=0, batch_queue=2)
+        await sched.acquire(BATCH, "b")
+        waiters = [asyncio.ensure_future(sched.acquire(BATCH, "b")) for _ in range(2)]
+        await settle()
+        with pytest.raises(QueueFull):
+            await sched.acquire(BATCH, "b")
+        sched.release(BATCH)
+        await settle()
+        # One waiter was admitted, so there is room in the queue again
+        extra = asyncio.ensure_future(sched.acquire(BATCH, "b"))
+        await settle()
+        stats = sched.describe()["classes"][BATCH]
+        for task in waiters + [extra]:
+            task.cancel()
+        return stats
+
+    stats = asyncio.run(main())
+    assert stats["rejected"] == 1
+    assert stats["waiting"] == 2
+
+
+def test_token_bucket_paces_and_counts_each_waiter_once():
+    async def main():
+        sched = scheduler(total=8, batch=8, reserve=0, batch_rate=20.0)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        order = []
+        # Burst is one second of rate (20 images); the next 10 images wait for refills
+        await hold(sched, BATCH, "b", order, cost=8)
+        await hold(sched, BATCH, "b", order, cost=8)
+        await hold(sched, BATCH, "b", order, cost=4)
+        assert loop.time() - start < 0.05
+        await asyncio.gather(*(hold(sched, BATCH, "b", order, cost=5) for _ in range(2)))
+        return loop.time() - start, sched.describe()["classes"][BATCH]
+
+    elapsed, stats = asyncio.run(main())
+    assert 0.4 <= elapsed < 1.5
+    assert stats["admitted"] == 5
+    assert stats["rate_limited"] == 2
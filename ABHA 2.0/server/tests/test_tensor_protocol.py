@@ -0,0 +1,94 @@
+"""PXT1 request / PXR1 response framing and the engine path for raw tensors."""
+import asyncio
+import struct
+
+import numpy as np
+import pytest
+
+import tensor_protocol as tp
+from inference_engine import InferenceEngine, MockBackend
+from input_gate import InputGate, InputRejected
+
+
+def noise(n, h=8, w=8, seed=0):
+    gray = np.random.default_rng(seed).integers(30, 220, size=(n, h, w, 1), dtype=np.uint8)
+    return np.repeat(gray, 3, axis=-1)
+
+
+def test_request_round_trip():
+    a = noise(2)
+    b = np.random.default_rng(1).random((8, 8, 1), dtype=np.float32)
+    images, verbose = tp.decode_frames(tp.encode_request([a, b], verbose=True))
+
+    assert verbose is True
+    assert len(images) == 3
+    np.testing.assert_array_equal(images[0], a[0])
+    np.testing.assert_array_equal(images[1], a[1])
+    np.testing.assert_array_equal(images[2], b)
+    assert images[0].dtype == np.uint8 and images[2].dtype == np.float32
+    # Frames are views into the request body
+    assert not images[0].flags.writeable
+
+
+def test_response_round_trip():
+    results = [
+        {"prediction": "PNEUMONIA", "confidence": 0.9, "threshold_used": 0.5,
+         "calibrated_probability": 0.9, "content_hash": "abc"},
+        ValueError("bad frame"),
+        {"prediction": "NORMAL", "confidence": 0.75, "threshold_used": 0.5, "raw_probability": 0.25},
+    ]
+    decoded = tp.decode_response(tp.encode_results(results, 0.5, verbose=True))
+
+    assert decoded[0]["prediction"] == "PNEUMONIA"
+    assert decoded[0]["probability"] == pytest.approx(0.9)
+    assert decoded[0]["content_hash"] == "abc"
+    assert decoded[1] == {"error": "bad frame"}
+    assert decoded[2]["prediction"] == "NORMAL"
+    assert decoded[2]["probability"] == pytest.approx(0.25)
+    assert decoded[2]["threshold_used"] == pytest.approx(0.5)
+
+
+def test_compact_response_has_no_trailer():
+    body = tp.encode_results([{"prediction": "NORMAL", "confidence": 0.6, "raw_probability": 0.4}], 0.5)
+    assert len(body) == struct.calcsize("<4sIf") + struct.calcsize("<Bxxxff")
+    assert "content_hash" not in tp.decode_response(body)[0]
+
+
+def _frame(magic=b"PXT1", dtype=1, n=1, h=2, w=2, c=3, payload=None):
+    header = struct.pack("<4sBBHIIII", magic, dtype, 0, 0, n, h, w, c)
+    payload = bytes(n * h * w * c) if payload is None else payload
+    return struct.pack("<I", len(header) + len(payload)) + header + payload
+
+
+@pytest.mark.parametrize("body, message", [
+    (b"", "Empty request"),
+    (b"\x01\x00", "Truncated frame length"),
+    (_frame()[:-1], "Invalid frame length"),
+    (_frame(magic=b"XXXX"), "Bad frame magic"),
+    (_frame(dtype=7), "Unsupported dtype"),
+    (_frame(c=4), "Channel count"),
+    (_frame(payload=bytes(5)), "expected 12"),
+])
+def test_rejects_malformed_frames(body, message):
+    with pytest.raises(tp.TensorProtocolError, match=message):
+        tp.decode_frames(body)
+
+
+def test_rejects_bad_result_magic():
+    with pytest.raises(tp.TensorProtocolError):
+        tp.decode_response(b"NOPE" + bytes(8))
+
+
+def test_tensor_inputs_pass_the_input_gate():
+    gate = InputGate(mode="reject", model_path=None)
+    engine = InferenceEngine(MockBackend(), image_size=(8, 8), gate=gate, cache_size=0)
+    blank = np.full((1, 8, 8, 3), 128, dtype=np.uint8)
+    body = tp.encode_request([noise(1), blank])
+
+    results = tp.decode_response(asyncio.run(tp.predict_tensor_request(engine, body)))
+
+    assert "prediction" in results[0]
+    assert results[1] == {"error": True}
+    assert gate.describe()["checked"] == 2
+    with pytest.raises(InputRejected):
+        engine.predict([blank[0]])
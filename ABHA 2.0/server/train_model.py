@@ -5,6 +5,7 @@ Train a CNN (Keras / TensorFlow) for Pneumonia detection on chest X‑ray images
 Usage examples:
     python train_model.py --data ./chest_xray --epochs 15
     python train_model.py --data ./chest_xray --img-size 224 224 --batch-size 16 --model-path pneumonia_model.keras
+    python train_model.py --data ./chest_xray --perf --batch-size 128 --lr-scaling linear --warmup-epochs 2
 
 Kaggle dataset (Chest X-Ray Pneumonia) structure expected:
 chest_xray/
@@ -25,20 +26,41 @@ Arguments:
     --lr               Learning rate (default 1e-4)
     --early-stop       Enable EarlyStopping (patience 4)
     --augment-off      Disable data augmentation
+    --perf             Performance mode: tf.data pipeline with in-graph augmentation,
+                       tuned threading, mixed precision (auto) and a per-epoch throughput report
+    --mixed-precision  auto|bfloat16|float16|off (default off, auto in --perf)
+    --intra-op-threads / --inter-op-threads  TF thread pools (default: TF defaults, tuned in --perf)
+    --lr-scaling       none|linear|sqrt - scale --lr by batch size / --base-batch-size
+    --warmup-epochs    Linearly ramp the (scaled) learning rate over N epochs
+    --cache-data       Cache decoded images in memory (perf mode only)
+    --checkpoint-dir   Directory for periodic checkpoints (default <model>_checkpoints)
+    --checkpoint-every Save a resumable checkpoint every N epochs (default 0 = off, 1 with --resume)
+    --resume           Continue from the last checkpoint (weights, optimizer state, epoch, data order)
+    --keep-best        Keep the best N per-epoch snapshots by --best-metric and register them
+    --seed             Shuffle seed, so resumed runs continue the same data order
+    --arch             baseline|gap|separable|mobilenet|improved (default baseline)
+    --compare-archs    Benchmark params, file size and CPU latency (batch 1/32) of every architecture and exit
+    --reference-samples  Training images sampled for the drift reference profile
+                       (<model>_reference_profile.json, see drift_monitor.py; default 0 = none,
+                       e.g. 1000 for a model that will be served)
 
 Environment alternative:
     DATA_DIR, MODEL_PATH, EPOCHS, BATCH_SIZE
+
+Hyperparameter sweeps over --lr, --batch-size, --img-size, augmentation and
+--arch (shared decoded dataset, successive halving): see sweep.py.
 """
 
 import tensorflow as tf
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import (
     Conv2D, MaxPooling2D, Flatten, Dense, Dropout, BatchNormalization,
-    RandomFlip, RandomRotation
+    RandomFlip, RandomRotation, SeparableConv2D, DepthwiseConv2D, GlobalAveragePooling2D
 )
 from tensorflow.keras.optimizers import Adam
 import os
 import json
+import time
 import numpy as np
 import matplotlib.pyplot as plt
 import argparse
@@ -77,9 +99,145 @@ def parse_args():
     parser.add_argument('--auto-kaggle', action='store_true', help='Download Kaggle chest-xray-pneumonia dataset automatically via kagglehub (requires internet)')
     parser.add_argument('--train-steps', type=int, default=None, help='Limit steps per epoch for quick runs (optional)')
     parser.add_argument('--val-steps', type=int, default=None, help='Limit validation steps per epoch (optional)')
+    parser.add_argument('--perf', action='store_true', help='Performance training mode (tf.data pipeline, tuned threads, mixed precision, throughput report)')
+    parser.add_argument('--mixed-precision', choices=['auto','bfloat16','float16','off'], default=None, help='Mixed precision policy (default off, auto with --perf)')
+    parser.add_argument('--intra-op-threads', type=int, default=None, help='Threads used inside a single op (default: all cores with --perf)')
+    parser.add_argument('--inter-op-threads', type=int, default=None, help='Ops executed in parallel (default: 2 with --perf)')
+    parser.add_argument('--lr-scaling', choices=['none','linear','sqrt'], default='none', help='Scale learning rate with batch size relative to --base-batch-size')
+    parser.add_argument('--base-batch-size', type=int, default=32, help='Batch size the --lr value was tuned for')
+    parser.add_argument('--warmup-epochs', type=int, default=0, help='Linear learning-rate warmup epochs (useful with large batches)')
+    parser.add_argument('--cache-data', action='store_true', help='Cache decoded images in memory (perf mode only)')
+    parser.add_argument('--checkpoint-dir', default=None, help='Checkpoint directory (default: <model>_checkpoints)')
+    parser.add_argument('--checkpoint-every', type=int, default=None, help='Save a resumable checkpoint every N epochs (default 0 = off, 1 with --resume)')
+    parser.add_argument('--resume', action='store_true', help='Resume from the last checkpoint in --checkpoint-dir')
+    parser.add_argument('--keep-best', type=int, default=0, help='Keep the best N epoch snapshots and register them (0 disables)')
+    parser.add_argument('--best-metric', default='val_accuracy', help='Metric used to rank snapshots (val_loss ranks ascending)')
+    parser.add_argument('--seed', type=int, default=1337, help='Data shuffle seed')
+    parser.add_argument('--arch', choices=ARCHITECTURES, default='baseline', help='Model architecture')
+    parser.add_argument('--compare-archs', action='store_true', help='Benchmark parameter count, size and CPU latency of every architecture, then exit')
+    parser.add_argument('--reference-samples', type=int, default=0, help='Training images sampled for the drift reference profile (default 0 = none; opt in for served models, e.g. 1000)')
     return parser.parse_args()
 
-def build_datasets(train_dir: str, val_dir: str, img_size: Tuple[int,int], batch_size: int, augment: bool):
+def configure_threads(intra_op: int = None, inter_op: int = None):
+    """Set TF thread pools; must run before TensorFlow executes any op."""
+    if intra_op:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+    if inter_op:
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+
+def _cpu_supports_bf16() -> bool:
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+def configure_precision(mode: str) -> str:
+    """Set the global Keras dtype policy and return its name."""
+    if mode == 'auto':
+        if tf.config.list_physical_devices('GPU'):
+            mode = 'float16'
+        elif _cpu_supports_bf16():
+            mode = 'bfloat16'
+        else:
+            mode = 'off'
+    policy = {'bfloat16': 'mixed_bfloat16', 'float16': 'mixed_float16'}.get(mode, 'float32')
+    tf.keras.mixed_precision.set_global_policy(policy)
+    return policy
+
+def scaled_learning_rate(lr: float, batch_size: int, base_batch_size: int, scaling: str) -> float:
+    ratio = batch_size / float(base_batch_size)
+    if scaling == 'linear':
+        return lr * ratio
+    if scaling == 'sqrt':
+        return lr * float(np.sqrt(ratio))
+    return lr
+
+def build_augmentation() -> Sequential:
+    """In-graph augmentation in the spirit of the ImageDataGenerator settings (applied per batch)."""
+    return Sequential([
+        RandomFlip('horizontal'),
+        RandomRotation(20 / 360),
+        tf.keras.layers.RandomTranslation(0.2, 0.2, fill_mode='nearest'),
+        tf.keras.layers.RandomZoom(0.2, fill_mode='nearest'),
+    ])
+
+def build_perf_datasets(train_dir: str, val_dir: str, img_size: Tuple[int,int], batch_size: int, augment: bool, cache: bool = False, seed: int = 1337):
+    """tf.data pipeline with parallel decode and in-graph augmentation.
+
+    Replaces the Python-side ImageDataGenerator so decoding and augmentation run
+    on TF worker threads and overlap with training via prefetch.
+    """
+    if not os.path.exists(train_dir) or not os.path.exists(val_dir):
+        raise FileNotFoundError(f"Dataset not found. Expecting train/ and val/ inside: {os.path.abspath(os.path.dirname(train_dir))}")
+
+    train_raw = tf.keras.utils.image_dataset_from_directory(
+        train_dir, image_size=img_size, batch_size=None, label_mode='binary', shuffle=True, seed=seed)
+    val_raw = tf.keras.utils.image_dataset_from_directory(
+        val_dir, image_size=img_size, batch_size=None, label_mode='binary', shuffle=False)
+    class_names = train_raw.class_names
+    print(f"Found classes: {class_names}")
+
+    rescale = tf.keras.layers.Rescaling(1./255)
+    train_ds = train_raw.map(lambda x, y: (rescale(x), y), num_parallel_calls=tf.data.AUTOTUNE)
+    val_ds = val_raw.map(lambda x, y: (rescale(x), y), num_parallel_calls=tf.data.AUTOTUNE)
+    if cache:
+        train_ds = train_ds.cache()
+        val_ds = val_ds.cache()
+    train_ds = train_ds.shuffle(2048, seed=seed).batch(batch_size)
+    if augment:
+        augmentation = build_augmentation()
+        train_ds = train_ds.map(lambda x, y: (augmentation(x, training=True), y), num_parallel_calls=tf.data.AUTOTUNE)
+    train_ds = train_ds.prefetch(tf.data.AUTOTUNE)
+    val_ds = val_ds.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+    return train_ds, val_ds
+
+class ThroughputReport(tf.keras.callbacks.Callback):
+    """Per-epoch images/sec, step time and estimated input-pipeline stall.
+
+    A training step that had its batch ready runs at pure compute speed, so the
+    fastest decile of steps is used as the compute baseline; time above that
+    baseline is attributed to waiting on the input pipeline.
+    """
+
+    def __init__(self, batch_size: int):
+        super().__init__()
+        self.batch_size = batch_size
+        self.epochs: List[Dict[str, float]] = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._step_times: List[float] = []
+        self._epoch_start = time.perf_counter()
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self._step_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._step_times.append(time.perf_counter() - self._step_start)
+
+    def on_epoch_end(self, epoch, logs=None):
+        if not self._step_times:
+            return
+        # Skip the first step (tracing / graph compilation)
+        steps = np.array(self._step_times[1:] or self._step_times)
+        baseline = float(np.percentile(steps, 10))
+        stall = float(np.clip(steps - baseline, 0, None).sum() / steps.sum()) if steps.sum() > 0 else 0.0
+        train_time = float(steps.sum())
+        report = {
+            'epoch': epoch + 1,
+            'images_per_sec': len(steps) * self.batch_size / train_time if train_time > 0 else 0.0,
+            'step_time_ms': float(steps.mean() * 1000),
+            'step_time_p90_ms': float(np.percentile(steps, 90) * 1000),
+            'input_stall_pct': stall * 100,
+            'epoch_wall_s': time.perf_counter() - self._epoch_start,
+        }
+        self.epochs.append(report)
+        print(f"\n[throughput] epoch {report['epoch']}: {report['images_per_sec']:.1f} img/s, "
+              f"step {report['step_time_ms']:.1f} ms (p90 {report['step_time_p90_ms']:.1f}), "
+              f"input stall {report['input_stall_pct']:.1f}%, wall {report['epoch_wall_s']:.1f}s")
+
+def build_datasets(train_dir: str, val_dir: str, img_size: Tuple[int,int], batch_size: int, augment: bool, seed: int = 1337):
     if not os.path.exists(train_dir) or not os.path.exists(val_dir):
         raise FileNotFoundError(f"Dataset not found. Expecting train/ and val/ inside: {os.path.abspath(os.path.dirname(train_dir))}")
 
@@ -104,7 +262,8 @@ def build_datasets(train_dir: str, val_dir: str, img_size: Tuple[int,int], batch
         train_dir,
         target_size=img_size,
         batch_size=batch_size,
-        class_mode='binary'
+        class_mode='binary',
+        seed=seed
     )
 
     validation_generator = val_datagen.flow_from_directory(
@@ -118,28 +277,225 @@ def build_datasets(train_dir: str, val_dir: str, img_size: Tuple[int,int], batch
 
     return train_generator, validation_generator
 
-def build_model(img_size: Tuple[int,int]):
+class TrainingCheckpoint(tf.keras.callbacks.Callback):
+    """Periodic resumable checkpoints plus optional best-N epoch snapshots.
+
+    `last.keras` holds weights and optimizer state; `state.json` records the
+    epoch, input-pipeline position and history so far. Retained snapshots get
+    a `_metrics.json` and are registered in the model registry, so the model
+    manager and ensemble can use them like any other model version.
+    """
+
+    STATE_FILE = 'state.json'
+    LAST_CHECKPOINT = 'last.keras'
+
+    def __init__(self, checkpoint_dir: str, every: int = 1, keep_best: int = 0, monitor: str = 'val_accuracy',
+                 train_data=None, seed: int = 1337, model_stem: str = 'model', registry=None, history: Dict[str, List[float]] = None):
+        super().__init__()
+        self.checkpoint_dir = checkpoint_dir
+        self.every = every
+        self.keep_best = keep_best
+        self.monitor = monitor
+        self.mode_min = 'loss' in monitor
+        self.train_data = train_data
+        self.seed = seed
+        self.model_stem = model_stem
+        self.registry = registry
+        self.history: Dict[str, List[float]] = history or {}
+        self.best: List[Dict[str, Any]] = []
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    @classmethod
+    def load_state(cls, checkpoint_dir: str) -> Dict[str, Any]:
+        with open(os.path.join(checkpoint_dir, cls.STATE_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _pipeline_state(self) -> Dict[str, Any]:
+        # DirectoryIterator derives each epoch's shuffle from seed + batches seen
+        state = {'seed': self.seed}
+        if hasattr(self.train_data, 'total_batches_seen'):
+            state['total_batches_seen'] = int(self.train_data.total_batches_seen)
+        return state
+
+    def _save_snapshot(self, epoch: int, value: float, logs: Dict[str, Any]):
+        name = f"{self.model_stem}_epoch{epoch:03d}.keras"
+        path = os.path.join(self.checkpoint_dir, name)
+        self.model.save(path)
+        with open(os.path.splitext(path)[0] + '_metrics.json', 'w', encoding='utf-8') as f:
+            validation = {k[len('val_'):]: float(v) for k, v in logs.items() if k.startswith('val_')}
+            json.dump({'validation': validation, 'test': None, 'epoch': epoch}, f, indent=2)
+        entry = {'epoch': epoch, 'value': value, 'path': path}
+        if self.registry is not None:
+            registered = self.registry.register(path, source='checkpoint', checkpoint={'epoch': epoch, 'monitor': self.monitor, 'value': value})
+            entry['version_id'] = registered['version_id']
+            print(f"Registered snapshot {name} as version {registered['version_id']}")
+        return entry
+
+    def _update_best(self, epoch: int, logs: Dict[str, Any]):
+        value = logs.get(self.monitor)
+        if value is None:
+            return
+        value = float(value)
+        ranked = sorted(self.best, key=lambda b: b['value'], reverse=not self.mode_min)
+        if len(ranked) >= self.keep_best:
+            worst = ranked[-1]
+            better = value < worst['value'] if self.mode_min else value > worst['value']
+            if not better:
+                return
+            self.best.remove(worst)
+            for path in (worst['path'], os.path.splitext(worst['path'])[0] + '_metrics.json'):
+                if os.path.exists(path):
+                    os.remove(path)
+            if self.registry is not None:
+                self.registry.refresh()
+        self.best.append(self._save_snapshot(epoch, value, logs))
+
+    def on_epoch_end(self, epoch, logs=None):
+        logs = logs or {}
+        for k, v in logs.items():
+            self.history.setdefault(k, []).append(float(v))
+        completed = epoch + 1
+        if self.keep_best > 0:
+            self._update_best(completed, logs)
+        if self.every > 0 and completed % self.every == 0:
+            # Write to a temp file first so an interruption never corrupts the last checkpoint
+            tmp_path = os.path.join(self.checkpoint_dir, 'last.tmp.keras')
+            self.model.save(tmp_path)
+            os.replace(tmp_path, os.path.join(self.checkpoint_dir, self.LAST_CHECKPOINT))
+            state = {
+                'epoch': completed,
+                'pipeline': self._pipeline_state(),
+                'history': self.history,
+                'best': self.best,
+                'monitor': self.monitor,
+            }
+            with open(os.path.join(self.checkpoint_dir, self.STATE_FILE), 'w', encoding='utf-8') as f:
+                json.dump(state, f, indent=2)
+            print(f"\nCheckpoint saved at epoch {completed} to {self.checkpoint_dir}")
+
+
+ARCHITECTURES = ['baseline', 'gap', 'separable', 'mobilenet', 'improved']
+
+def _conv_stack(filters: Tuple[int, ...] = (32, 64, 128)) -> List[tf.keras.layers.Layer]:
+    layers: List[tf.keras.layers.Layer] = []
+    for f in filters:
+        layers += [Conv2D(f,(3,3),activation='relu'), BatchNormalization(), MaxPooling2D((2,2))]
+    return layers
+
+def _separable_block(filters: int) -> List[tf.keras.layers.Layer]:
+    return [
+        SeparableConv2D(filters, (3,3), padding='same', use_bias=False), BatchNormalization(), tf.keras.layers.ReLU(),
+        SeparableConv2D(filters, (3,3), padding='same', use_bias=False), BatchNormalization(), tf.keras.layers.ReLU(),
+        MaxPooling2D((2,2)),
+    ]
+
+def _mobilenet_block(filters: int, strides: int) -> List[tf.keras.layers.Layer]:
+    # MobileNetV1-style: depthwise 3x3 then pointwise 1x1, each with BN + ReLU6
+    return [
+        DepthwiseConv2D((3,3), strides=strides, padding='same', use_bias=False), BatchNormalization(), tf.keras.layers.ReLU(6.0),
+        Conv2D(filters, (1,1), use_bias=False), BatchNormalization(), tf.keras.layers.ReLU(6.0),
+    ]
+
+def build_model(img_size: Tuple[int,int], arch: str = 'baseline'):
+    """Build one of the selectable architectures.
+
+    baseline  - original conv stack + Flatten + Dense(512) head
+    gap       - same conv stack with a GlobalAveragePooling head (far fewer params)
+    separable - depthwise-separable convolution blocks + GAP head
+    mobilenet - small MobileNet-style backbone (strided depthwise blocks) + GAP head
+    improved  - deeper double-conv architecture from ModelManager.create_improved_model
+    """
     h,w = img_size
+    if arch == 'baseline':
+        body = _conv_stack() + [Flatten(), Dense(512, activation='relu'), Dropout(0.5)]
+    elif arch == 'gap':
+        body = _conv_stack() + [GlobalAveragePooling2D(), Dense(128, activation='relu'), Dropout(0.3)]
+    elif arch == 'separable':
+        body = [Conv2D(32,(3,3),strides=2,padding='same',use_bias=False), BatchNormalization(), tf.keras.layers.ReLU()]
+        for f in (64, 128, 256):
+            body += _separable_block(f)
+        body += [GlobalAveragePooling2D(), Dropout(0.3)]
+    elif arch == 'mobilenet':
+        body = [Conv2D(16,(3,3),strides=2,padding='same',use_bias=False), BatchNormalization(), tf.keras.layers.ReLU(6.0)]
+        for f, stride in ((32,1), (64,2), (64,1), (128,2), (128,1), (256,2), (256,1)):
+            body += _mobilenet_block(f, stride)
+        body += [GlobalAveragePooling2D(), Dropout(0.2)]
+    elif arch == 'improved':
+        body = []
+        for f in (32, 64, 128):
+            body += [
+                Conv2D(f, (3,3), activation='relu', padding='same'), BatchNormalization(),
+                Conv2D(f, (3,3), activation='relu', padding='same'), MaxPooling2D((2,2)), Dropout(0.25),
+            ]
+        body += [GlobalAveragePooling2D(), Dense(512, activation='relu'), Dropout(0.5), Dense(256, activation='relu'), Dropout(0.3)]
+    else:
+        raise ValueError(f"Unknown architecture '{arch}'. Choose from: {', '.join(ARCHITECTURES)}")
+
     model = Sequential([
         tf.keras.Input(shape=(h,w,3)),
-        Conv2D(32,(3,3),activation='relu'), BatchNormalization(), MaxPooling2D((2,2)),
-        Conv2D(64,(3,3),activation='relu'), BatchNormalization(), MaxPooling2D((2,2)),
-        Conv2D(128,(3,3),activation='relu'), BatchNormalization(), MaxPooling2D((2,2)),
-        Flatten(),
-        Dense(512, activation='relu'), Dropout(0.5),
-        Dense(1, activation='sigmoid')
-    ])
+        *body,
+        # Keep the output in float32 so mixed precision does not hurt the sigmoid
+        Dense(1, activation='sigmoid', dtype='float32')
+    ], name=f"pneumonia_{arch}")
     return model
 
-
-def train():
-    args = parse_args()
-    img_size = (args.img_size[0], args.img_size[1])
-    # Resolve dataset directory (auto-discover common paths if not provided)
+def benchmark_model(model, img_size: Tuple[int,int], batch_sizes: Tuple[int, ...] = (1, 32), repeats: int = 20, model_path: str = None) -> Dict[str, Any]:
+    """Parameter count, file size and CPU forward-pass latency of a model."""
+    h,w = img_size
+    result: Dict[str, Any] = {'params': int(model.count_params()), 'latency_ms': {}}
+    if model_path and os.path.exists(model_path):
+        result['file_size_mb'] = os.path.getsize(model_path) / (1024 * 1024)
+    else:
+        # Measure the serialized size without keeping the file around
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp_path = os.path.join(tmp, 'bench.keras')
+            model.save(tmp_path)
+            result['file_size_mb'] = os.path.getsize(tmp_path) / (1024 * 1024)
+
+    with tf.device('/CPU:0'):
+        forward = tf.function(lambda x: model(x, training=False))
+        for bs in batch_sizes:
+            x = tf.random.uniform((bs, h, w, 3))
+            forward(x)  # trace + warm up
+            timings = []
+            for _ in range(repeats):
+                start = time.perf_counter()
+                forward(x).numpy()
+                timings.append((time.perf_counter() - start) * 1000)
+            result['latency_ms'][f'batch_{bs}'] = {
+                'p50': float(np.percentile(timings, 50)),
+                'p95': float(np.percentile(timings, 95)),
+                'per_image': float(np.percentile(timings, 50) / bs),
+            }
+    return result
+
+def format_benchmark(name: str, bench: Dict[str, Any], metrics: Dict[str, Any] = None) -> str:
+    lat = bench['latency_ms']
+    line = f"{name:10} params={bench['params']:>10,}  size={bench['file_size_mb']:7.2f} MB"
+    for key in sorted(lat, key=lambda k: int(k.split('_')[1])):
+        line += f"  {key}: {lat[key]['p50']:7.2f} ms"
+    if metrics:
+        line += f"  acc={metrics.get('accuracy', float('nan')):.3f} f1={metrics.get('f1', float('nan')):.3f} auc={metrics.get('roc_auc', float('nan')):.3f}"
+    return line
+
+def compare_architectures(img_size: Tuple[int,int], archs: List[str] = None) -> Dict[str, Any]:
+    """Benchmark every architecture untrained (cost only) and print a table."""
+    results = {}
+    print(f"\n--- Architecture cost comparison at {img_size} (CPU) ---")
+    for arch in archs or ARCHITECTURES:
+        bench = benchmark_model(build_model(img_size, arch), img_size)
+        results[arch] = bench
+        print(format_benchmark(arch, bench))
+    return results
+
+
+def resolve_data_dir(data_dir: str = None) -> str:
+    """Resolve the dataset directory, auto-discovering common locations if not provided."""
     def has_required_subdirs(p: str) -> bool:
         return os.path.isdir(os.path.join(p, 'train')) and os.path.isdir(os.path.join(p, 'val'))
 
-    base_dir = args.data
+    base_dir = data_dir
     if not base_dir:
         candidates = [
             os.path.join('data', 'chest_xray', 'chest_xray'),
@@ -159,6 +515,135 @@ def train():
             base_dir = maybe
         else:
             base_dir = os.getenv('DATA_DIR', 'data/chest_xray/chest_xray')
+    return base_dir
+
+
+# --- Evaluation helpers (shared with distill_model.py) ---
+
+def collect_probs_and_labels(model, ds, steps=None) -> Tuple[np.ndarray, np.ndarray]:
+    y_true_list: List[float] = []
+    y_prob_list: List[float] = []
+
+    # If ds is a generator from flow_from_directory, steps must be provided to avoid infinite loop.
+    # Labels are numpy arrays from generators and EagerTensors from tf.data, so both go through np.asarray.
+    if steps:
+        for i, (xb, yb) in enumerate(ds):
+            if i >= steps:
+                break
+            probs = model.predict(xb, verbose=0).ravel()
+            y_prob_list.append(probs)
+            y_true_list.append(np.asarray(yb).ravel())
+    else: # Assumes a finite dataset like tf.data.Dataset which doesn't loop
+        for xb, yb in ds:
+            probs = model.predict(xb, verbose=0).ravel()
+            y_prob_list.append(probs)
+            y_true_list.append(np.asarray(yb).ravel())
+
+    if not y_prob_list:
+        return np.array([]), np.array([])
+
+    y_true = np.concatenate(y_true_list, axis=0)
+    y_prob = np.concatenate(y_prob_list, axis=0)
+    return y_true, y_prob
+
+def compute_metrics(y_true: np.ndarray, y_prob: np.ndarray, threshold: float = 0.5) -> Dict[str, Any]:
+    y_pred = (y_prob >= threshold).astype(int)
+    acc = float(accuracy_score(y_true, y_pred))
+    precision, recall, f1, _ = precision_recall_fscore_support(y_true, y_pred, average='binary', zero_division=0)
+    # AUC metrics may fail if only one class present; guard them
+    roc_auc = float(roc_auc_score(y_true, y_prob)) if len(np.unique(y_true)) > 1 else float('nan')
+    pr_auc = float(average_precision_score(y_true, y_prob)) if len(np.unique(y_true)) > 1 else float('nan')
+    cm = confusion_matrix(y_true, y_pred).tolist()
+    # Additional scores
+    # Clip probabilities to avoid log(0) without using deprecated 'eps' argument
+    y_prob_clipped = np.clip(y_prob, 1e-15, 1-1e-15)
+    ll = float(log_loss(y_true, y_prob_clipped)) if len(np.unique(y_true)) > 1 else float('nan')
+    brier = float(brier_score_loss(y_true, y_prob))
+    mse = float(mean_squared_error(y_true, y_prob))
+    r2 = float(r2_score(y_true, y_prob)) if len(np.unique(y_true)) > 1 else float('nan')
+    report = classification_report(y_true, y_pred, target_names=['NORMAL','PNEUMONIA'], zero_division=0)
+    return {
+        'threshold': threshold,
+        'accuracy': acc,
+        'precision': float(precision),
+        'recall': float(recall),
+        'f1': float(f1),
+        'roc_auc': roc_auc,
+        'pr_auc': pr_auc,
+        'log_loss': ll,
+        'brier_score': brier,
+        'mse': mse,
+        'r2': r2,
+        'confusion_matrix': cm,
+        'classification_report': report,
+    }
+
+def save_curves(y_true: np.ndarray, y_prob: np.ndarray, prefix: str):
+    # ROC
+    try:
+        RocCurveDisplay.from_predictions(y_true, y_prob)
+        plt.title('ROC Curve')
+        roc_path = prefix + '_roc.png'
+        plt.savefig(roc_path)
+        plt.close()
+        print(f"Saved ROC curve to {roc_path}")
+    except Exception as e:
+        print(f"Skipping ROC curve: {e}")
+    # PR
+    try:
+        PrecisionRecallDisplay.from_predictions(y_true, y_prob)
+        plt.title('Precision-Recall Curve')
+        pr_path = prefix + '_pr.png'
+        plt.savefig(pr_path)
+        plt.close()
+        print(f"Saved PR curve to {pr_path}")
+    except Exception as e:
+        print(f"Skipping PR curve: {e}")
+
+
+def write_reference_profile(model, train_dir: str, img_size: Tuple[int,int], model_path: str, samples: int, seed: int = 1337) -> str:
+    """Sketch of training inputs and model outputs that the services compare live traffic against."""
+    from drift_monitor import build_reference_profile
+    from model_registry import reference_profile_path_for
+    from model_ensemble import calibrate
+    exts = {'.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp', '.tif', '.tiff'}
+    files = sorted(os.path.join(root, name) for root, _, names in os.walk(train_dir)
+                   for name in names if os.path.splitext(name)[1].lower() in exts)
+    rng = np.random.default_rng(seed)
+    if len(files) > samples:
+        files = [files[i] for i in sorted(rng.choice(len(files), samples, replace=False))]
+    # Serving decodes at the model input as (width, height) and records calibrated probabilities too
+    h, w = img_size
+    profile = build_reference_profile(files, lambda batch: model(batch, training=False), (w, h), calibrate_fn=calibrate)
+    profile['model'] = os.path.basename(model_path)
+    profile['source'] = train_dir
+    out_path = str(reference_profile_path_for(model_path))
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(profile, f)
+    return out_path
+
+def train():
+    args = parse_args()
+    img_size = (args.img_size[0], args.img_size[1])
+    # Threading and precision must be configured before TensorFlow runs any op
+    if args.perf:
+        if args.intra_op_threads is None:
+            args.intra_op_threads = os.cpu_count()
+        if args.inter_op_threads is None:
+            args.inter_op_threads = 2
+        if args.mixed_precision is None:
+            args.mixed_precision = 'auto'
+    configure_threads(args.intra_op_threads, args.inter_op_threads)
+    precision_policy = configure_precision(args.mixed_precision or 'off')
+    if args.compare_archs:
+        results = compare_architectures(img_size)
+        out_json = os.path.splitext(args.model_path)[0] + '_arch_comparison.json'
+        with open(out_json, 'w', encoding='utf-8') as f:
+            json.dump({'img_size': list(img_size), 'architectures': results}, f, indent=2)
+        print(f"Saved architecture comparison to {out_json}")
+        return
+    # Resolve dataset directory (auto-discover common paths if not provided)
+    base_dir = resolve_data_dir(args.data)
 
     # Optional Kaggle auto download
     if args.auto_kaggle:
@@ -180,20 +665,72 @@ def train():
             raise SystemExit(f'Failed to download Kaggle dataset: {e}')
     train_dir = os.path.join(base_dir,'train')
     val_dir = os.path.join(base_dir,'val')
-    train_ds, val_ds = build_datasets(train_dir, val_dir, img_size, args.batch_size, augment=not args.augment_off)
-    
-    # Calculate steps per epoch if not provided
-    if args.train_steps is None:
-        args.train_steps = train_ds.samples // train_ds.batch_size
-    if args.val_steps is None:
-        args.val_steps = val_ds.samples // val_ds.batch_size
+    # Resume state: epoch, data order and history from the last checkpoint
+    model_stem = os.path.splitext(os.path.basename(args.model_path))[0]
+    checkpoint_dir = args.checkpoint_dir or os.path.splitext(args.model_path)[0] + '_checkpoints'
+    resume_state = None
+    if args.checkpoint_every is None:
+        # A resumed run keeps checkpointing so it can be resumed again
+        args.checkpoint_every = 1 if args.resume else 0
+    if args.resume:
+        last_checkpoint = os.path.join(checkpoint_dir, TrainingCheckpoint.LAST_CHECKPOINT)
+        if os.path.exists(last_checkpoint):
+            resume_state = TrainingCheckpoint.load_state(checkpoint_dir)
+            args.seed = resume_state['pipeline'].get('seed', args.seed)
+            print(f"Resuming from {last_checkpoint} after epoch {resume_state['epoch']}")
+        else:
+            print(f"No checkpoint found in {checkpoint_dir}; starting from scratch")
+    initial_epoch = resume_state['epoch'] if resume_state else 0
+
+    if args.perf:
+        # tf.data restarts its shuffle sequence on a new process; offset the seed so
+        # resumed epochs do not replay the first epoch's order
+        train_ds, val_ds = build_perf_datasets(train_dir, val_dir, img_size, args.batch_size, augment=not args.augment_off,
+                                               cache=args.cache_data, seed=args.seed + initial_epoch)
+    else:
+        train_ds, val_ds = build_datasets(train_dir, val_dir, img_size, args.batch_size, augment=not args.augment_off, seed=args.seed)
+        if resume_state and 'total_batches_seen' in resume_state['pipeline']:
+            train_ds.total_batches_seen = resume_state['pipeline']['total_batches_seen']
+        
+        # Calculate steps per epoch if not provided (generators loop forever)
+        if args.train_steps is None:
+            args.train_steps = train_ds.samples // train_ds.batch_size
+        if args.val_steps is None:
+            args.val_steps = val_ds.samples // val_ds.batch_size
 
+    lr = scaled_learning_rate(args.lr, args.batch_size, args.base_batch_size, args.lr_scaling)
     print(f"Training with:\n Data: {base_dir}\n Train: {train_dir}\n Val: {val_dir}\n Img: {img_size}\n Batch: {args.batch_size}\n Epochs: {args.epochs}\n Model Out: {args.model_path}")
+    print(f" Arch: {args.arch}\n LR: {lr:g} (scaling={args.lr_scaling})\n Precision: {precision_policy}\n Threads: intra={args.intra_op_threads or 'default'} inter={args.inter_op_threads or 'default'}")
     
-    model = build_model(img_size)
-    model.compile(optimizer=Adam(learning_rate=args.lr), loss='binary_crossentropy', metrics=['accuracy'])
+    if resume_state:
+        # The .keras checkpoint restores the optimizer state along with the weights
+        model = tf.keras.models.load_model(os.path.join(checkpoint_dir, TrainingCheckpoint.LAST_CHECKPOINT))
+    else:
+        model = build_model(img_size, args.arch)
+        model.compile(optimizer=Adam(learning_rate=lr), loss='binary_crossentropy', metrics=['accuracy'])
     model.summary()
     callbacks = []
+    registry = None
+    if args.keep_best > 0:
+        from model_registry import ModelRegistry
+        registry = ModelRegistry(os.path.dirname(os.path.abspath(args.model_path)), auto_refresh=False)
+    checkpoint = None
+    if args.checkpoint_every > 0 or args.keep_best > 0:
+        checkpoint = TrainingCheckpoint(
+            checkpoint_dir, every=args.checkpoint_every, keep_best=args.keep_best, monitor=args.best_metric,
+            train_data=train_ds, seed=args.seed, model_stem=model_stem, registry=registry,
+            history=resume_state['history'] if resume_state else None)
+        if resume_state:
+            checkpoint.best = resume_state.get('best', [])
+        callbacks.append(checkpoint)
+    if args.warmup_epochs > 0:
+        warmup = args.warmup_epochs
+        callbacks.append(tf.keras.callbacks.LearningRateScheduler(
+            lambda epoch, current: lr * (epoch + 1) / warmup if epoch < warmup else lr))
+    throughput = None
+    if args.perf:
+        throughput = ThroughputReport(args.batch_size)
+        callbacks.append(throughput)
     if args.early_stop:
         callbacks.append(tf.keras.callbacks.EarlyStopping(monitor='val_accuracy', patience=4, restore_best_weights=True))
     print("\n--- Starting Model Training ---")
@@ -209,13 +746,14 @@ def train():
         # fit_kwargs['validation_steps'] = 1
         # print("Using quick-run defaults: steps_per_epoch=20, validation_steps=1. Pass --train-steps/--val-steps to override or remove limits.")
         pass
-    history = model.fit(train_ds, validation_data=val_ds, epochs=args.epochs, callbacks=callbacks, **fit_kwargs)
+    history = model.fit(train_ds, validation_data=val_ds, epochs=args.epochs, initial_epoch=initial_epoch, callbacks=callbacks, **fit_kwargs)
     print("--- Model Training Finished ---\n")
-    # Plot
-    acc = history.history['accuracy']
-    val_acc = history.history.get('val_accuracy') or history.history.get('validation_accuracy')
-    loss = history.history['loss']
-    val_loss = history.history.get('val_loss') or history.history.get('validation_loss')
+    # Plot (including epochs from before a resume)
+    full_history = checkpoint.history if checkpoint is not None else history.history
+    acc = full_history['accuracy']
+    val_acc = full_history.get('val_accuracy') or full_history.get('validation_accuracy')
+    loss = full_history['loss']
+    val_loss = full_history.get('val_loss') or full_history.get('validation_loss')
     epochs_range = range(len(acc))
     plt.figure(figsize=(12,5))
     plt.subplot(1,2,1)
@@ -232,96 +770,29 @@ def train():
     print(f"Saved training curves to {out_png}")
     model.save(args.model_path)
     print(f"Model saved as '{args.model_path}'")
+    if args.reference_samples > 0:
+        profile_path = write_reference_profile(model, train_dir, img_size, args.model_path, args.reference_samples, args.seed)
+        print(f"Saved drift reference profile to {profile_path}")
 
     # --- Evaluation and Reporting ---
+    # Serving cost of the trained model (does not need sklearn)
+    print("\n--- Benchmarking CPU inference cost ---")
+    benchmark = benchmark_model(model, img_size, model_path=args.model_path)
+    prefix = os.path.splitext(args.model_path)[0]
+    report_json = prefix + '_metrics.json'
+
     if not _HAS_SKLEARN:
+        print(format_benchmark(args.arch, benchmark))
         print("sklearn not installed; skipping extended metrics. Install with: pip install scikit-learn")
+        with open(report_json, 'w', encoding='utf-8') as f:
+            json.dump({'validation': None, 'test': None, 'arch': args.arch, 'benchmark': benchmark}, f, indent=2)
+        print(f"Saved benchmark to {report_json}")
         return
 
-    def collect_probs_and_labels(ds, steps=None) -> Tuple[np.ndarray, np.ndarray]:
-        y_true_list: List[float] = []
-        y_prob_list: List[float] = []
-        
-        # If ds is a generator from flow_from_directory, steps must be provided to avoid infinite loop
-        if steps:
-            for i, (xb, yb) in enumerate(ds):
-                if i >= steps:
-                    break
-                probs = model.predict(xb, verbose=0).ravel()
-                y_prob_list.append(probs)
-                y_true_list.append(yb.ravel())
-        else: # Assumes a finite dataset like tf.data.Dataset which doesn't loop
-            for xb, yb in ds:
-                probs = model.predict(xb, verbose=0).ravel()
-                y_prob_list.append(probs)
-                y_true_list.append(yb.ravel())
-
-        if not y_prob_list:
-            return np.array([]), np.array([])
-
-        y_true = np.concatenate(y_true_list, axis=0)
-        y_prob = np.concatenate(y_prob_list, axis=0)
-        return y_true, y_prob
-
-    def compute_metrics(y_true: np.ndarray, y_prob: np.ndarray, threshold: float = 0.5) -> Dict[str, Any]:
-        y_pred = (y_prob >= threshold).astype(int)
-        acc = float(accuracy_score(y_true, y_pred))
-        precision, recall, f1, _ = precision_recall_fscore_support(y_true, y_pred, average='binary', zero_division=0)
-        # AUC metrics may fail if only one class present; guard them
-        roc_auc = float(roc_auc_score(y_true, y_prob)) if len(np.unique(y_true)) > 1 else float('nan')
-        pr_auc = float(average_precision_score(y_true, y_prob)) if len(np.unique(y_true)) > 1 else float('nan')
-        cm = confusion_matrix(y_true, y_pred).tolist()
-        # Additional scores
-        # Clip probabilities to avoid log(0) without using deprecated 'eps' argument
-        y_prob_clipped = np.clip(y_prob, 1e-15, 1-1e-15)
-        ll = float(log_loss(y_true, y_prob_clipped)) if len(np.unique(y_true)) > 1 else float('nan')
-        brier = float(brier_score_loss(y_true, y_prob))
-        mse = float(mean_squared_error(y_true, y_prob))
-        r2 = float(r2_score(y_true, y_prob)) if len(np.unique(y_true)) > 1 else float('nan')
-        report = classification_report(y_true, y_pred, target_names=['NORMAL','PNEUMONIA'], zero_division=0)
-        return {
-            'threshold': threshold,
-            'accuracy': acc,
-            'precision': float(precision),
-            'recall': float(recall),
-            'f1': float(f1),
-            'roc_auc': roc_auc,
-            'pr_auc': pr_auc,
-            'log_loss': ll,
-            'brier_score': brier,
-            'mse': mse,
-            'r2': r2,
-            'confusion_matrix': cm,
-            'classification_report': report,
-        }
-
-    def save_curves(y_true: np.ndarray, y_prob: np.ndarray, prefix: str):
-        # ROC
-        try:
-            RocCurveDisplay.from_predictions(y_true, y_prob)
-            plt.title('ROC Curve')
-            roc_path = prefix + '_roc.png'
-            plt.savefig(roc_path)
-            plt.close()
-            print(f"Saved ROC curve to {roc_path}")
-        except Exception as e:
-            print(f"Skipping ROC curve: {e}")
-        # PR
-        try:
-            PrecisionRecallDisplay.from_predictions(y_true, y_prob)
-            plt.title('Precision-Recall Curve')
-            pr_path = prefix + '_pr.png'
-            plt.savefig(pr_path)
-            plt.close()
-            print(f"Saved PR curve to {pr_path}")
-        except Exception as e:
-            print(f"Skipping PR curve: {e}")
-
     # Evaluate on validation set
     print("\n--- Evaluating on validation set ---")
-    y_true_val, y_prob_val = collect_probs_and_labels(val_ds, steps=args.val_steps)
+    y_true_val, y_prob_val = collect_probs_and_labels(model, val_ds, steps=args.val_steps)
     metrics_val = compute_metrics(y_true_val, y_prob_val)
-    prefix = os.path.splitext(args.model_path)[0]
     save_curves(y_true_val, y_prob_val, prefix + '_val')
 
     # Evaluate on test set if exists
@@ -334,19 +805,21 @@ def train():
             norm = tf.keras.layers.Rescaling(1./255)
             test_ds = test_ds_raw.map(lambda x,y: (norm(x), y)).cache().prefetch(buffer_size=tf.data.AUTOTUNE)
             print("\n--- Evaluating on test set ---")
-            y_true_test, y_prob_test = collect_probs_and_labels(test_ds)
+            y_true_test, y_prob_test = collect_probs_and_labels(model, test_ds)
             metrics_test = compute_metrics(y_true_test, y_prob_test)
             save_curves(y_true_test, y_prob_test, prefix + '_test')
         except Exception as e:
             print(f"Test set evaluation skipped due to error: {e}")
 
+    print(format_benchmark(args.arch, benchmark, metrics_test or metrics_val))
+
     # Save metrics report
     report_txt = prefix + '_report.txt'
-    report_json = prefix + '_metrics.json'
     with open(report_txt, 'w', encoding='utf-8') as f:
         f.write('Pneumonia Detection Model Report\n')
         f.write(f"Model: {args.model_path}\n")
-        f.write(f"Image Size: {img_size}\nBatch Size: {args.batch_size}\nEpochs: {args.epochs}\n\n")
+        f.write(f"Architecture: {args.arch}\nImage Size: {img_size}\nBatch Size: {args.batch_size}\nEpochs: {args.epochs}\n\n")
+        f.write(f"Serving Cost (CPU): {format_benchmark(args.arch, benchmark)}\n\n")
         f.write('Validation Metrics (threshold=0.5):\n')
         for k in ['accuracy','precision','recall','f1','roc_auc','pr_auc','log_loss','brier_score','mse','r2']:
             f.write(f"  {k}: {metrics_val[k]}\n")
@@ -361,7 +834,17 @@ def train():
             f.write('Classification Report (test):\n')
             f.write(metrics_test['classification_report'] + '\n')
     with open(report_json, 'w', encoding='utf-8') as f:
-        json.dump({'validation': metrics_val, 'test': metrics_test}, f, indent=2)
+        metrics_out = {'validation': metrics_val, 'test': metrics_test, 'arch': args.arch, 'benchmark': benchmark}
+        if throughput is not None:
+            metrics_out['training_throughput'] = {
+                'precision_policy': precision_policy,
+                'batch_size': args.batch_size,
+                'learning_rate': lr,
+                'intra_op_threads': args.intra_op_threads,
+                'inter_op_threads': args.inter_op_threads,
+                'epochs': throughput.epochs,
+            }
+        json.dump(metrics_out, f, indent=2)
     print(f"Saved report to {report_txt} and metrics JSON to {report_json}")
 
 if __name__ == '__main__':